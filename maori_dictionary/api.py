@@ -0,0 +1,340 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : api.py
+# Program description   : This is the versioned JSON API of the application, used by the mobile
+#                         flashcard clients.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from services import *
+from compression import negotiate_encoding, compress
+from response_cache import cache_anonymous_response
+from flask import Blueprint, request
+import json
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+MAX_BULK_IDS = 200
+SEARCH_RESULT_FIELDS = ("id", "maori", "english", "level", "date_added", "first_name", "last_name", "snippet")
+WORD_FIELDS = ("id", "maori", "english", "description", "level", "date_added", "first_name", "last_name",
+               "category_id")
+CATEGORY_FIELDS = ("id", "name")
+CATEGORY_WORD_FIELDS = ("id", "maori", "english", "image")
+
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")  # Registered by app.py
+
+
+def json_response(data, status=200):
+    """
+        Creates a compact JSON response, compressed with the best encoding the client accepts.
+    :param data:
+        type: dict
+        required: true
+        description: The response data
+    :param status:
+        type: int
+        required: false
+        description: The HTTP status code
+    :calls
+        negotiate_encoding (in compression.py module) - Chooses the encoding from the Accept-Encoding header
+        compress (in compression.py module) - Compresses the body
+    :return: The response
+    """
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    body, encoding = compress(body, negotiate_encoding(request.accept_encodings))
+    response = app.response_class(body, status=status, mimetype="application/json")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def error_response(message, status):
+    """
+        Creates a JSON error response.
+    :param message:
+        type: string
+        required: true
+        description: The error message
+    :param status:
+        type: int
+        required: true
+        description: The HTTP status code
+    :calls
+        json_response - Creates the response
+    :return: The response
+    """
+    return json_response({"error": message}, status)
+
+
+def get_fields(available):
+    """
+        Gets the fields requested with the "fields" query string argument (a comma separated list)
+        e.g. ?fields=id,maori,english. All the available fields are returned when it is not given.
+    :param available:
+        type: tuple of strings
+        required: true
+        description: The field names of the resource in the order of its values
+    :return: A list of (position, name) tuples of the requested fields or None if an unknown field
+             is requested
+    """
+    requested = request.args.get("fields", "").strip()
+    if requested == "":
+        return list(enumerate(available))
+    fields = []
+    for name in requested.split(","):
+        name = name.strip()
+        if name not in available:
+            return None
+        fields.append((available.index(name), name))
+    return fields
+
+
+def to_objects(rows, fields):
+    """
+        Turns query result tuples into dictionaries with the requested fields.
+    :param rows:
+        type: iterable of tuples
+        required: true
+        description: The rows
+    :param fields:
+        type: list of tuples
+        required: true
+        description: The (position, name) tuples of the fields returned by get_fields
+    :return: A list of dictionaries
+    """
+    return [{name: row[position] for position, name in fields if position < len(row)} for row in rows]
+
+
+def get_search_form(args):
+    """
+        Maps the query string arguments of an API search onto the fields of the search form, so
+        the search is done by the same service function as the search page.
+    :param args:
+        type: request.args
+        required: true
+        description: The query string arguments maori, english, level, most_recent, phrase and after
+    :return: A dictionary with the fields of the search form
+    """
+    return {"maori": args.get("maori", ""),
+            "english": args.get("english", ""),
+            "level": args.get("level", "0"),
+            "Date-Added": args.get("most_recent", "0"),
+            "phrase": args.get("phrase", ""),
+            "after": args.get("after", "")}
+
+
+def get_page_response(page, fields):
+    """
+        Creates the response for a page of words.
+    :param page:
+        type: ResultPage
+        required: true
+        description: The page of words
+    :param fields:
+        type: list of tuples
+        required: true
+        description: The (position, name) tuples of the requested fields
+    :calls
+        to_objects - Turns the rows into dictionaries
+        json_response - Creates the response
+    :return: The response with the words and the cursor of the next page (null on the last page)
+    """
+    words = to_objects(page, fields)
+    return json_response({"words": words, "next": page.next_cursor})
+
+
+@api.route('/search')
+@cache_anonymous_response
+def search():
+    """
+        This end point searches the dictionary like the search form.
+    :methods
+        GET:/api/v1/search?maori=&english=&level=&most_recent=&phrase=&after=&fields=
+    :calls (located in services.py module)
+        do_search_by_form - Searches the dictionary
+    :return: A JSON object with "words" (a page of the search results, with the matched text in
+             "snippet" as HTML for a phrase search) and "next" (the cursor of the next page)
+    """
+    fields = get_fields(SEARCH_RESULT_FIELDS)
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    page = do_search_by_form(get_search_form(request.args))
+    if page is None:
+        return error_response("Unexpected error has occurred during search", 500)
+    return get_page_response(page, fields)
+
+
+@api.route('/browse/<letter>')
+@cache_anonymous_response
+def browse(letter):
+    """
+        This end point browses the dictionary by the first letter of the maori words.
+    :methods
+        GET:/api/v1/browse/<letter>?after=&fields=
+    :param letter:
+        type: string
+        required: true
+        description: The character used to browse the dictionary
+    :calls (located in services.py module)
+        do_search_by_browse - Browses the dictionary
+    :return: A JSON object with "words" (a page of the words) and "next" (the cursor of the next page)
+    """
+    fields = get_fields(SEARCH_RESULT_FIELDS)
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    page = do_search_by_browse(letter, request.args.get("after"))
+    if page is None:
+        return error_response("Unexpected error has occurred during browse", 500)
+    return get_page_response(page, fields)
+
+
+@api.route('/categories')
+@cache_anonymous_response
+def categories():
+    """
+        This end point lists the categories.
+    :methods
+        GET:/api/v1/categories?fields=
+    :calls (located in services.py module)
+        get_categories - Gets the categories
+    :return: A JSON object with "categories"
+    """
+    fields = get_fields(CATEGORY_FIELDS)
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    category_list = get_categories()
+    if category_list is None:
+        return error_response("Unexpected error has occurred", 500)
+    return json_response({"categories": to_objects(category_list, fields)})
+
+
+@api.route('/categories/<int:category_id>/words')
+@cache_anonymous_response
+def category_words(category_id):
+    """
+        This end point lists the words of a category.
+    :methods
+        GET:/api/v1/categories/<category_id>/words?after=&fields=
+    :param category_id:
+        type: int
+        required: true
+        description: The id of the category
+    :calls (located in services.py module)
+        get_category_words - Gets a page of the words of the category
+    :return: A JSON object with the category "id" and "name", "words" (a page of the words, each
+             with its image file name) and "next" (the cursor of the next page)
+    """
+    fields = get_fields(CATEGORY_WORD_FIELDS)
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    page = get_category_words(category_id, request.args.get("after"))
+    if page is None:
+        return error_response("Category not found", 404)
+    category = page.first
+    words = [(word[3], word[1], word[2], word[5]) for word in page if word[1] is not None]
+    return json_response({"id": category[4], "name": category[0],
+                          "words": to_objects(words, fields), "next": page.next_cursor})
+
+
+@api.route('/words/<int:word_id>')
+@cache_anonymous_response
+def word(word_id):
+    """
+        This end point gets the details of a word.
+    :methods
+        GET:/api/v1/words/<word_id>?fields=
+    :param word_id:
+        type: int
+        required: true
+        description: The id of the word
+    :calls (located in services.py module)
+        get_dictionary_word - Gets the word
+        get_image_filename - Gets the image file name of the word
+    :return: A JSON object with the word details and its "image" file name
+    """
+    fields = get_fields(WORD_FIELDS + ("image",))
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    words = get_dictionary_word(word_id)
+    if words is None:
+        return error_response("Word not found", 404)
+    return json_response(to_objects([words[0] + (get_image_filename(words[0][2]),)], fields)[0])
+
+
+@api.route('/words')
+@cache_anonymous_response
+def words():
+    """
+        This end point gets the details of many words in one query, e.g. to sync a flashcard deck.
+    :methods
+        GET:/api/v1/words?ids=1,2,3&fields=
+    :calls (located in services.py module)
+        get_dictionary_words - Gets the words
+    :return: A JSON object with "words" (the words found, in id order) and "missing" (the ids
+             that were not found)
+    """
+    fields = get_fields(WORD_FIELDS)
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    try:
+        word_ids = sorted({int(word_id) for word_id in request.args.get("ids", "").split(",") if word_id.strip()})
+    except ValueError:
+        return error_response("ids must be a comma separated list of word ids", 400)
+    if len(word_ids) == 0 or len(word_ids) > MAX_BULK_IDS:
+        return error_response(f"Between 1 and {MAX_BULK_IDS} word ids must be requested", 400)
+    word_list = get_dictionary_words(word_ids)
+    if word_list is None:
+        return error_response("Unexpected error has occurred", 500)
+    found = {word[0] for word in word_list}
+    return json_response({"words": to_objects(word_list, fields),
+                          "missing": [word_id for word_id in word_ids if word_id not in found]})
+
+
+@api.route('/changes')
+@cache_anonymous_response
+def changes():
+    """
+        This end point is the change feed used by the offline clients to sync their copy of the
+        dictionary. It returns the words and categories changed after the sequence number the
+        client last saw, with the current details of the changed (upserted) words and categories
+        and a tombstone for the deleted ones. A client starts with since=0 (the whole dictionary),
+        keeps the "next" sequence number and calls again while "more" is true.
+    :methods
+        GET:/api/v1/changes?since=<seq>&fields=
+    :calls (located in services.py module)
+        get_changes_since - Gets the changes and the changed words and categories
+    :return: A JSON object with "changes" (each with its "seq", the "entity" ('word' or
+             'category'), the "id", the "operation" ('upsert' or 'delete') and for an upsert the
+             "data" with the word fields or the category "name"), "next" (the sequence number to
+             sync from next time) and "more" (true when there are more changes to read straight away)
+    """
+    fields = get_fields(WORD_FIELDS)
+    if fields is None:
+        return error_response("Unknown field requested", 400)
+    try:
+        since = int(request.args.get("since", "0"))
+    except ValueError:
+        return error_response("since must be a change sequence number", 400)
+    change_list, word_list, category_list, more = get_changes_since(since)
+    if change_list is None:
+        return error_response("Unexpected error has occurred", 500)
+    words = {word[0]: word for word in word_list}
+    categories = {category[0]: category for category in category_list}
+    feed = []
+    for seq, entity, entity_id, operation, changed_at in change_list:
+        change = {"seq": seq, "entity": entity, "id": entity_id, "operation": operation, "changed_at": changed_at}
+        if operation == "upsert":
+            if entity == "word" and entity_id in words:
+                change["data"] = to_objects([words[entity_id]], fields)[0]
+            elif entity == "category" and entity_id in categories:
+                change["data"] = {"name": categories[entity_id][1]}
+            else:
+                continue  # Deleted since, its tombstone has a later sequence number
+        feed.append(change)
+    next_seq = change_list[-1][0] if len(change_list) > 0 else since
+    return json_response({"changes": feed, "next": next_seq, "more": more})
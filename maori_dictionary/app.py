@@ -7,32 +7,50 @@
 # Project               : 91902 (NCEA L3 Internal)
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 from services import *
-from flask import Flask, render_template, request, redirect, session
+from api import api
+from request_profiling import request_profiling
+from response_cache import cache_anonymous_response
+from flask import Flask, render_template, request, redirect, session, send_file, send_from_directory, abort
 from flask_bcrypt import Bcrypt
+import instrumentation
+import io
 
 
 app = Flask(__name__)  # Create application object
 bcrypt = Bcrypt(app)  # Builds the password security platform
 app.secret_key = "Duckyweu"  # The security key used
+if not prepare_database():  # Applies any outstanding database migrations
+    raise RuntimeError(f"The database {DATABASE} could not be migrated or its connection profile applied")
+app.register_blueprint(api)  # The JSON API under /api/v1
+if instrumentation.ENABLED:
+    app.register_blueprint(request_profiling)  # Server-Timing headers, request log lines and /metrics
+app.jinja_env.globals["asset_url"] = get_asset_url  # Hashed URLs of the static files for the templates
 
 
 @app.route('/search/<letter>', methods=["POST", "GET"])
+@cache_anonymous_response
 def render_search(letter):
     """
         This end point renders the application's popular search page
     :methods
-        GET:/search/<letter>
+        GET:/search/<letter>?after=<cursor>
         POST:/search/<letter>
     :param letter:
         type: string
         required: true
         description: The character used to browse the dictionary
+    :param after:
+        type: string
+        required: false
+        description: The cursor of the results page to show (query string or search form field)
     :calls (located in services.py module)
         do_search_by_form - When searching by submitting the search form (POST requests)
         do_search_by_browse - When browsing by clicking a letter in top of page (GET requests)
+        render_page - Renders (or streams) the page
     :return: renders the search.html
         description: Renders the search.html template processed with following:
-            search_results: Actual search results
+            search_results: Actual search results (one page, with the cursor of the next page)
+            search_form: The submitted search form used to request the next page
             logged_in: A boolean describing whether the user is logged in or not
             letter: The letter parameter that was passed in
             category_list: List of categories to be displayed on the sidebar
@@ -44,25 +62,26 @@ def render_search(letter):
     error = ""
     if request.method == "POST":
         search_letter = ""
-        search_results = do_search_by_form(request.form)
+        search_results = do_search_by_form(request.form, STREAM_RESPONSES)
     else:
-        search_results = []
+        search_results = get_page([])
         search_letter = letter
         error = request.args.get('error')
         if error is None:
             error = ""
-            search_results = do_search_by_browse(letter)
+            search_results = do_search_by_browse(letter, request.args.get('after'), STREAM_RESPONSES)
     if search_results is None:
         return redirect(f'/search/~?error=Unexpected+error+has+occurred+during+search+please+try+again+later')
-    return render_template('search.html',
-                           search_results=search_results,
-                           logged_in=is_logged_in(),
-                           letter=letter,
-                           category_list=get_categories(),
-                           selected=get_selected(search_letter),
-                           allow_edit=allow_edit(),
-                           error=error,
-                           current_user=get_user())
+    return render_page('search.html',
+                       search_results=search_results,
+                       search_form=request.form,
+                       logged_in=is_logged_in(),
+                       letter=letter,
+                       category_list=get_categories(),
+                       selected=get_selected(search_letter),
+                       allow_edit=allow_edit(),
+                       error=error,
+                       current_user=get_user())
 
 
 @app.route('/delete_word/<word_id>')
@@ -98,7 +117,7 @@ def render_delete_word(word_id):
     return render_template('delete_word.html',
                            word_list=word,
                            logged_in=is_logged_in(),
-                           image_name=get_image_filename(word[0][2]),
+                           image_name=get_image_filename(word[0][2], "medium"),
                            category_list=get_categories(),
                            breadcrumb=breadcrumb,
                            allow_edit=allow_edit(),
@@ -132,6 +151,7 @@ def action_delete_word(word_id):
 
 
 @app.route('/word/<word_id>', methods=["POST", "GET"])
+@cache_anonymous_response
 def render_word(word_id):
     """
         This end point renders the word page.
@@ -173,7 +193,7 @@ def render_word(word_id):
                            word_details=word,
                            logged_in=is_logged_in(),
                            error=error,
-                           image_name=get_image_filename(word[0][2]),
+                           image_name=get_image_filename(word[0][2], "medium"),
                            checked=get_checked(word[0][4]),
                            category_list=get_categories(),
                            allow_edit=allow_edit(),
@@ -186,7 +206,7 @@ def render_delete_category(category_id):
     """
         This end point renders delete category page
     :methods
-        GET:/delete_category/<category_id>
+        GET:/delete_category/<category_id>?after=<cursor>
     :param category_id:
         type: int
         required: true
@@ -195,22 +215,21 @@ def render_delete_category(category_id):
         get_category_words - To validate request and update the word (GET requests)
     :return: renders the delete_category.html
         description: Renders the delete_category.html template processed with following:
-            category_words: The words corresponding to the category_id passed in
+            category_words: A page of the words (with their image file names) corresponding to the
+                            category_id passed in and the cursor of the next page
             logged_in: A boolean describing whether the user is logged in or not
-            image_name: Tne image file name corresponding to the word
             category_list: List of categories to be displayed on the sidebar
             allow_edit: A boolean describing whether the user is allowed to edit dictionary data
             current_user: Current username and type to be displayed in the top right in the UI
     """
     if not is_logged_in() or not allow_edit():
         return redirect('/')
-    category_words = get_category_words(category_id)
+    category_words = get_category_words(category_id, request.args.get('after'), image_variant="medium")
     if category_words is None:
         return redirect('/?error=Unexpected+error')
     return render_template('delete_category.html',
                            category_words=category_words,
                            logged_in=is_logged_in(),
-                           image_names=get_image_filenames(category_words),
                            category_list=get_categories(),
                            allow_edit=allow_edit(),
                            current_user=get_user())
@@ -274,25 +293,74 @@ def render_add_category():
                            current_user=get_user())
 
 
+@app.route('/bulk_add/<category_id>', methods=["POST", "GET"])
+def render_bulk_add(category_id):
+    """
+        This end point renders the page to add (or update) many words of a category at once
+    :methods
+        GET:/bulk_add/<category_id>
+        POST:/bulk_add/<category_id>
+    :param category_id:
+        type: int
+        required: true
+        description: The id of the category in the category table
+    :calls (located in services.py module)
+        get_category_name - To get the name of the category
+        validate_bulk_add_words - To validate request and add the words (POST requests)
+    :return: renders the bulk_add.html
+        description: Renders the bulk_add.html template processed with following:
+            category_id: The category id passed in
+            category_name: The name of the category
+            report: The added, updated, duplicate and invalid words (POST requests)
+            words: The pasted words, shown again when they could not be added
+            logged_in: A boolean describing whether the user is logged in or not
+            category_list: List of categories to be displayed on the sidebar
+            allow_edit: A boolean describing whether the user is allowed to edit dictionary data
+            current_user: Current username and type to be displayed in the top right in the UI
+    """
+    if not is_logged_in() or not allow_edit():
+        return redirect('/')
+    category_name = get_category_name(category_id)
+    if category_name is None:
+        return redirect('/?error=Category+could+not+be+retrieved+unexpected+error')
+    report = None
+    words = ""
+    if request.method == "POST":
+        is_valid, report = validate_bulk_add_words(request.form, request.files.get('word_file'), category_id)
+        if not is_valid:
+            words = request.form.get('words', "")
+    return render_template('bulk_add.html',
+                           category_id=category_id,
+                           category_name=category_name,
+                           report=report,
+                           words=words,
+                           logged_in=is_logged_in(),
+                           category_list=get_categories(),
+                           allow_edit=allow_edit(),
+                           current_user=get_user())
+
+
 @app.route('/category/<category_id>', methods=["POST", "GET"])
+@cache_anonymous_response
 def render_category(category_id):
     """
         This end point renders the category page
     :methods
-        GET:/category/<category_id>
+        GET:/category/<category_id>?after=<cursor>
         POST:/category/<category_id>
     :calls (located in services.py module)
         validate_add_word - To validate request and add the word (POST requests)
         get_category_words - To get all the corresponding words for the specified category id (GET requests)
+        render_page - Renders (or streams) the page
     :param category_id:
         type: int
         required: true
         description: The id of the category in the category table
     :return: renders the category.html
         description: Renders the category.html template processed with following:
-            category_words: All the corresponding words for the specified category id
+            category_words: A page of the corresponding words (with their image file names) for the
+                            specified category id and the cursor of the next page
             logged_in: A boolean describing whether the user is logged in or not
-            image_name: Tne image file name corresponding to the word
             error: Error message for the UI and URL query string
             category_list: List of categories to be displayed on the sidebar
             allow_edit: A boolean describing whether the user is allowed to edit dictionary data
@@ -303,18 +371,17 @@ def render_category(category_id):
         if not is_valid:
             return redirect(return_url)
         return redirect(f'/category/{category_id}')
-    words = get_category_words(category_id)
+    words = get_category_words(category_id, request.args.get('after'), STREAM_RESPONSES, "thumb")
     if words is None:
         return redirect('/?error=Category+could+not+be+retrieved+unexpected+error')
     error = request.args.get('error')
-    return render_template('category.html',
-                           category_words=words,
-                           logged_in=is_logged_in(),
-                           image_names=get_image_filenames(words),
-                           error=error,
-                           category_list=get_categories(),
-                           allow_edit=allow_edit(),
-                           current_user=get_user())
+    return render_page('category.html',
+                       category_words=words,
+                       logged_in=is_logged_in(),
+                       error=error,
+                       category_list=get_categories(),
+                       allow_edit=allow_edit(),
+                       current_user=get_user())
 
 
 @app.route('/signup', methods=["POST", "GET"])
@@ -336,7 +403,7 @@ def render_signup():
     if is_logged_in():
         return redirect('/')
     if request.method == "POST":
-        is_valid, return_url = validate_signup_user(request.form)
+        is_valid, return_url = validate_signup_user(request.form, request.remote_addr)
         if not is_valid:
             return redirect(return_url)
         return redirect('/login')
@@ -381,8 +448,9 @@ def render_login():
     if is_logged_in():
         return redirect('/')
     if request.method == "POST":
-        if not validate_and_login_user(request.form):
-            return redirect('/login?error=Email+invalid+or+password+incorrect')
+        is_valid, return_url = validate_and_login_user(request.form, request.remote_addr)
+        if not is_valid:
+            return redirect(return_url)
         return redirect('/')
     error = request.args.get('error')
     return render_template('login.html',
@@ -412,5 +480,39 @@ def render_home():
                            current_user=get_user())
 
 
+@app.route('/assets/<path:hashed_path>')
+def render_asset(hashed_path):
+    """
+        This end point serves the static files by their hashed URLs (see get_asset_url). As a
+        changed file gets a new URL the response may be cached by the browsers for good
+        (Cache-Control immutable), so repeat visits do not request the style sheet or images again.
+        An old URL of a changed file (e.g. from a page cached before a new release) is answered
+        with the current file without the long caching.
+    :methods
+        GET:/assets/<hashed_path>
+    :param hashed_path:
+        type: string
+        required: true
+        description: The path of the file in the static directory with the hash of its content,
+                     e.g. css/style.1a2b3c4d5e6f.css
+    :calls (located in services.py module)
+        get_asset - To find the file
+    :return: The file or 404 Not Found
+    """
+    asset = get_asset(hashed_path)
+    if asset is None:
+        abort(404)
+    path, content, is_current = asset
+    max_age = ASSET_MAX_AGE if is_current else None  # None to revalidate the old URL on every request
+    if content is None:
+        response = send_from_directory(STATIC_PATH, path, max_age=max_age)
+    else:
+        response = send_file(io.BytesIO(content), download_name=os.path.basename(path), etag=hashed_path,
+                             conditional=True, max_age=max_age)
+    if is_current:
+        response.cache_control.immutable = True
+    return response
+
+
 if __name__ == '__main__':
     app.run()
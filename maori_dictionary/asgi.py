@@ -0,0 +1,634 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : asgi.py
+# Program description   : This is the async (ASGI) entry point of the application, e.g.
+#                               uvicorn asgi:application --workers 2
+#                         The read pages (home, search, category and word) are served by async
+#                         routes, so a slow client only costs an idle coroutine rather than a
+#                         thread. The other routes run the Flask application on a small pool of
+#                         threads, and their responses are sent by the event loop, so a slow
+#                         download does not hold a thread either.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from services import *
+from app import app
+from async_data_access import run_in_thread, database_executor
+from response_cache import cache_anonymous_response
+from concurrent.futures import ThreadPoolExecutor
+from flask import render_template, request, redirect
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import FileWrapper
+import async_data_access
+import asyncio
+import contextvars
+import functools
+import io
+import os
+import sys
+import threading
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+WSGI_THREADS = int(os.environ.get("DICTIONARY_WSGI_THREADS", "8"))
+MAX_BODY_BYTES = 16 * 1024 * 1024
+WSGI_BUFFER_BYTES = int(os.environ.get("DICTIONARY_WSGI_BUFFER_BYTES", str(1024 * 1024)))
+FILE_BLOCK_BYTES = 64 * 1024
+
+
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+async def search_by_form(search_form):
+    """
+        The async variant of do_search_by_form (in services.py module)
+    :param search_form:
+        type: request.form
+        required: true
+        description: The search from submitted with user search criteria
+    :calls
+        get_search_results (in async_data_access.py module) - Retrieve search results from database
+    :return: A page of search results (ResultPage) or None in case of an unexpected error.
+    """
+    maori, english, level, most_recent, phrase = get_search_form_data(search_form)
+    if maori == "" and english == "" and level == "0" and most_recent == "0" and phrase == "":
+        return get_page([])
+    search_results = await async_data_access.get_search_results(maori, english, level, most_recent, phrase,
+                                                                decode_cursor(search_form.get("after")))
+    if search_results is None:
+        return None
+    return get_page(search_results,
+                    lambda word: word[:7] + (get_highlighted_snippet(word[7]),) if len(word) > 7 else word)
+
+
+async def search_by_browse(letter, cursor):
+    """
+        The async variant of do_search_by_browse (in services.py module)
+    :param letter:
+        type: string
+        required: true
+        description: The character used to browse the dictionary
+    :param cursor:
+        type: string
+        required: false
+        description: The cursor of the page to show, None for the first page
+    :calls
+        get_browse_results (in async_data_access.py module) - Retrieve search results from database
+    :return: A page of search results (ResultPage) or None in case of an unexpected error.
+    """
+    if letter.isalpha() and letter != "~" and len(letter) == 1:
+        search_results = await async_data_access.get_browse_results(letter, decode_cursor(cursor))
+        if search_results is None:
+            return None
+        return get_page(search_results)
+    return get_page([])
+
+
+async def get_page_context():
+    """
+        Gets the template values shared by every page: the categories of the sidebar and whether
+        the user may edit the dictionary, read at the same time.
+    :calls
+        get_category_list (in async_data_access.py module) - Retrieve all the categories from the database
+        allow_edit (in services.py module) - Checks the user's rights
+    :return: A dictionary of the template values
+    """
+    category_list, edit = await asyncio.gather(async_data_access.get_category_list(), run_in_thread(allow_edit))
+    return {"category_list": category_list, "allow_edit": edit, "logged_in": is_logged_in(),
+            "current_user": get_user()}
+
+
+async def render(template_name, **context):
+    """
+        Renders a template on a database thread, so the event loop keeps serving the other clients
+        while the page is rendered.
+    :param template_name:
+        type: string
+        required: true
+        description: The name of the template
+    :param context:
+        type: keyword arguments
+        required: false
+        description: The variables passed to the template
+    :calls
+        run_in_thread (in async_data_access.py module) - Runs the rendering on a database thread
+    :return: The rendered page
+    """
+    return await async_data_access.run_in_thread(functools.partial(render_template, template_name, **context))
+
+
+@cache_anonymous_response
+async def render_search(letter):
+    """
+        The async variant of the search page (see render_search in app.py). The results and the
+        sidebar are read at the same time.
+    :param letter:
+        type: string
+        required: true
+        description: The character used to browse the dictionary
+    :return: renders the search.html
+    """
+    error = ""
+    search_letter = letter
+    if request.method == "POST":
+        search_letter = ""
+        search_results, context = await asyncio.gather(search_by_form(request.form), get_page_context())
+    else:
+        error = request.args.get('error')
+        if error is None:
+            error = ""
+            search_results, context = await asyncio.gather(search_by_browse(letter, request.args.get('after')),
+                                                           get_page_context())
+        else:
+            search_results, context = get_page([]), await get_page_context()
+    if search_results is None:
+        return redirect(f'/search/~?error=Unexpected+error+has+occurred+during+search+please+try+again+later')
+    return await render('search.html',
+                        search_results=search_results,
+                        search_form=request.form,
+                        letter=letter,
+                        selected=get_selected(search_letter),
+                        error=error,
+                        **context)
+
+
+@cache_anonymous_response
+async def render_word(word_id):
+    """
+        The async variant of the word page (see render_word in app.py). The word and the sidebar
+        are read at the same time.
+    :param word_id:
+        type: int
+        required: true
+        description: The id of the word in the dictionary table
+    :return: renders the word.html
+    """
+    word, context = await asyncio.gather(async_data_access.get_word(word_id), get_page_context())
+    if word is None:
+        return redirect('/?error=Word+could+not+be+retrieved+unexpected+error')
+    image_name = get_image_filename(word[0][2], "medium")  # In memory, the resized images are made in the background
+    breadcrumb = request.args.get("breadcrumb")
+    if breadcrumb is None:
+        breadcrumb = "/"
+    return await render('word.html',
+                        word_details=word,
+                        error=request.args.get('error'),
+                        image_name=image_name,
+                        checked=get_checked(word[0][4]),
+                        breadcrumb=breadcrumb,
+                        **context)
+
+
+@cache_anonymous_response
+async def render_category(category_id):
+    """
+        The async variant of the category page (see render_category in app.py). The words and the
+        sidebar are read at the same time.
+    :param category_id:
+        type: int
+        required: true
+        description: The id of the category in the category table
+    :return: renders the category.html
+    """
+    words, context = await asyncio.gather(
+        async_data_access.get_words(category_id, decode_cursor(request.args.get('after'))), get_page_context())
+    category_words = None
+    if words is not None:
+        category_words = await async_data_access.run_in_thread(get_page, add_image_filenames(words, "thumb"))
+    if not category_words:
+        return redirect('/?error=Category+could+not+be+retrieved+unexpected+error')
+    return await render('category.html',
+                        category_words=category_words,
+                        error=request.args.get('error'),
+                        **context)
+
+
+async def render_home():
+    """
+        The async variant of the home page (see render_home in app.py)
+    :return: renders the home.html
+    """
+    return await render('home.html', **await get_page_context())
+
+
+# The routes served asynchronously: endpoint => (async route function, methods). The POST requests
+# of the category and word pages change the dictionary and are served by the Flask routes.
+ASYNC_ROUTES = {"render_search": (render_search, ("GET", "POST")),
+                "render_word": (render_word, ("GET",)),
+                "render_category": (render_category, ("GET",)),
+                "render_home": (render_home, ("GET",))}
+
+
+def get_environ(scope, body):
+    """
+        Creates the WSGI environment of an ASGI HTTP request.
+    :param scope:
+        type: dict
+        required: true
+        description: The ASGI connection scope
+    :param body:
+        type: bytes
+        required: true
+        description: The request body
+    :return: The WSGI environment dictionary
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {"REQUEST_METHOD": scope["method"],
+               "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+               "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+               "QUERY_STRING": scope["query_string"].decode("latin-1"),
+               "SERVER_NAME": server[0],
+               "SERVER_PORT": str(server[1]),
+               "REMOTE_ADDR": client[0],
+               "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+               "wsgi.version": (1, 0),
+               "wsgi.url_scheme": scope.get("scheme", "http"),
+               "wsgi.input": io.BytesIO(body),
+               "wsgi.input_terminated": True,  # The whole body is read, also a chunked one without a Content-Length
+               "wsgi.errors": sys.stderr,
+               "wsgi.multithread": True,
+               "wsgi.multiprocess": True,
+               "wsgi.run_once": False}
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        if name in environ:
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+    return environ
+
+
+async def read_body(receive):
+    """
+        Reads the body of a request.
+    :param receive:
+        type: function
+        required: true
+        description: The ASGI receive function
+    :return: The body, None if it is larger than MAX_BODY_BYTES or False if the client disconnected
+    """
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return False
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        if not message.get("more_body", False):
+            return bytes(body)
+
+
+def get_response_start(status, headers):
+    """
+        Creates the ASGI message starting a response.
+    :param status:
+        type: int
+        required: true
+        description: The status code of the response
+    :param headers:
+        type: list
+        required: true
+        description: The (name, value) tuples of the response headers
+    :return: The http.response.start message
+    """
+    return {"type": "http.response.start", "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+                        if name.lower() != "date"]}  # The server adds its own Date header
+
+
+async def dispatch_async(route, values, environ, send):
+    """
+        Runs an async route inside a Flask request context, with the same request processing
+        (before and after request functions, error handlers and saving the session) as a Flask route,
+        and sends the response. A streamed response is read on a WSGI thread, a chunk at a time,
+        in one context so that the request context it keeps stays the same between the chunks.
+    :param route:
+        type: coroutine function
+        required: true
+        description: The async route function
+    :param values:
+        type: dict
+        required: true
+        description: The values of the URL rule
+    :param environ:
+        type: dict
+        required: true
+        description: The WSGI environment of the request
+    :param send:
+        type: function
+        required: true
+        description: The ASGI send function
+    """
+    with app.request_context(environ):
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await route(**values)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            response = app.handle_exception(e)
+        await send(get_response_start(response.status_code, response.headers.to_wsgi_list()))
+        if response.is_sequence:
+            try:
+                await send({"type": "http.response.body", "body": response.get_data()})
+            finally:
+                response.close()
+            return
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        chunks = response.iter_encoded()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(wsgi_executor, context.run, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await loop.run_in_executor(wsgi_executor, context.run, response.close)
+
+
+class ResponseBuffer:
+    """
+        The response of a Flask route run on a WSGI thread, handed over to the event loop which
+        sends it to the client. The thread puts the start and the body chunks of the response and
+        carries on, so a slow client costs memory rather than a WSGI thread. The thread only waits
+        while more than max_bytes of the body are waiting to be sent, so a large response is not
+        all held in memory.
+        The messages are ("start", status, headers), ("body", chunk), ("file", file wrapper) for
+        a file sent by the event loop, ("end",) and ("error", exception).
+    """
+
+    def __init__(self, loop, max_bytes):
+        """
+            Creates an empty buffer.
+        :param loop:
+            type: asyncio.AbstractEventLoop
+            required: true
+            description: The event loop sending the response
+        :param max_bytes:
+            type: int
+            required: true
+            description: The number of body bytes waiting to be sent above which the thread waits
+        """
+        self._loop = loop
+        self._max_bytes = max_bytes
+        self._queue = asyncio.Queue()
+        self._condition = threading.Condition()
+        self._waiting_bytes = 0
+        self._closed = False
+
+    def put(self, message):
+        """
+            Hands a message over to the event loop (called on the WSGI thread).
+        :param message:
+            type: tuple
+            required: true
+            description: The message (see the class description)
+        :return: True, or False when the client has gone and the rest of the response is not wanted
+        """
+        size = len(message[1]) if message[0] == "body" else 0
+        with self._condition:
+            while 0 < self._waiting_bytes and self._max_bytes < self._waiting_bytes + size and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return False
+            self._waiting_bytes += size
+        self._loop.call_soon_threadsafe(self._deliver, message)
+        return True
+
+    def _deliver(self, message):
+        """
+            Queues a message for get (called on the event loop). A file handed over after the
+            buffer was closed is closed straight away.
+        :param message:
+            type: tuple
+            required: true
+            description: The message
+        """
+        if not self._closed:
+            self._queue.put_nowait(message)
+        elif message[0] == "file":
+            message[1].close()
+
+    async def get(self):
+        """
+            Waits for the next message.
+        :return: The message
+        """
+        return await self._queue.get()
+
+    def sent(self, size):
+        """
+            Records that a body chunk has been sent, letting the thread carry on if it was waiting.
+        :param size:
+            type: int
+            required: true
+            description: The size of the chunk
+        """
+        with self._condition:
+            self._waiting_bytes -= size
+            self._condition.notify()
+
+    def close(self):
+        """
+            Stops the response (called on the event loop once it is sent or the client has gone),
+            closing a file that was not sent.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        while not self._queue.empty():
+            message = self._queue.get_nowait()
+            if message[0] == "file":
+                message[1].close()
+
+
+def run_wsgi(environ, buffer):
+    """
+        Runs the Flask application for a request (on one of the WSGI threads), putting the response
+        into the buffer for the event loop to send. A file (e.g. a static file or an image) is
+        handed over as it is and read by the event loop.
+    :param environ:
+        type: dict
+        required: true
+        description: The WSGI environment of the request
+    :param buffer:
+        type: ResponseBuffer
+        required: true
+        description: The buffer the response is put into
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(" ", 1)[0]), headers]
+
+    try:
+        iterable = app(environ, start_response)
+    except Exception as e:
+        buffer.put(("error", e))
+        return
+    if type(iterable) is FileWrapper:
+        buffer.put(("start", *started))
+        if not buffer.put(("file", iterable)):
+            iterable.close()
+        return
+    try:
+        response_started = False
+        for chunk in iterable:
+            if not chunk:
+                continue
+            if not response_started:
+                buffer.put(("start", *started))
+                response_started = True
+            if not buffer.put(("body", chunk)):
+                return
+        if not response_started:
+            buffer.put(("start", *started))
+        buffer.put(("end",))
+    except Exception as e:
+        buffer.put(("error", e))
+    finally:
+        close = getattr(iterable, "close", None)
+        if close is not None:
+            close()
+
+
+async def send_file_response(file_wrapper, send):
+    """
+        Sends a file to the client from the event loop. Each block is read on a short lived
+        executor call, so neither the event loop nor a WSGI thread waits for the client.
+    :param file_wrapper:
+        type: werkzeug.wsgi.FileWrapper
+        required: true
+        description: The file of the response
+    :param send:
+        type: function
+        required: true
+        description: The ASGI send function
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            block = await loop.run_in_executor(None, file_wrapper.file.read, FILE_BLOCK_BYTES)
+            if not block:
+                break
+            await send({"type": "http.response.body", "body": block, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        file_wrapper.close()
+
+
+async def dispatch_wsgi(environ, send):
+    """
+        Runs the Flask application for a request on a WSGI thread and sends its response from the
+        event loop as the thread puts it into a ResponseBuffer.
+    :param environ:
+        type: dict
+        required: true
+        description: The WSGI environment of the request
+    :param send:
+        type: function
+        required: true
+        description: The ASGI send function
+    :calls
+        run_wsgi - Runs the Flask application on a WSGI thread
+        send_file_response - Sends a file response
+    """
+    buffer = ResponseBuffer(asyncio.get_running_loop(), WSGI_BUFFER_BYTES)
+    wsgi_executor.submit(run_wsgi, environ, buffer)
+    try:
+        while True:
+            message = await buffer.get()
+            if message[0] == "start":
+                await send(get_response_start(message[1], message[2]))
+            elif message[0] == "body":
+                await send({"type": "http.response.body", "body": message[1], "more_body": True})
+                buffer.sent(len(message[1]))
+            elif message[0] == "file":
+                await send_file_response(message[1], send)
+                return
+            elif message[0] == "end":
+                await send({"type": "http.response.body", "body": b""})
+                return
+            else:
+                raise message[1]
+    finally:
+        buffer.close()
+
+
+async def handle_lifespan(receive, send):
+    """
+        Answers the ASGI lifespan messages, closing the database connections on shutdown.
+    :param receive:
+        type: function
+        required: true
+        description: The ASGI receive function
+    :param send:
+        type: function
+        required: true
+        description: The ASGI send function
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            wsgi_executor.shutdown()
+            database_executor.shutdown()
+            close_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """
+        The ASGI application. The request is matched against the Flask routes and served by the
+        async route when there is one for its endpoint and method, or by the Flask application on
+        a WSGI thread otherwise.
+    :param scope:
+        type: dict
+        required: true
+        description: The ASGI connection scope
+    :param receive:
+        type: function
+        required: true
+        description: The ASGI receive function
+    :param send:
+        type: function
+        required: true
+        description: The ASGI send function
+    """
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    body = await read_body(receive)
+    if body is False:
+        return  # Nobody is left to answer
+    if body is None:
+        await send(get_response_start(413, [("Content-Type", "text/plain")]))
+        await send({"type": "http.response.body", "body": b"Request body too large"})
+        return
+    environ = get_environ(scope, body)
+    try:
+        endpoint, values = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        endpoint, values = None, {}
+    route, methods = ASYNC_ROUTES.get(endpoint, (None, ()))
+    if route is not None and environ["REQUEST_METHOD"] in methods:
+        await dispatch_async(route, values, environ, send)
+    else:
+        await dispatch_wsgi(environ, send)
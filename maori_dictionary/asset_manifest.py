@@ -0,0 +1,170 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : asset_manifest.py
+# Program description   : This module maps the static files (style sheet and images) to URLs with a
+#                         hash of their content, so the browsers can cache them for good.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import hashlib
+import os
+import posixpath
+import re
+import threading
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+HASH_LENGTH = 12
+HASHED_NAME = re.compile(r"^(.+)\.([0-9a-f]{%d})(\.[^./]+)?$" % HASH_LENGTH)  # e.g. css/style.1a2b3c4d5e6f.css
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")\s]+)\1\s*\)""")
+
+
+class AssetManifest:
+    """
+        Maps the path of each file in the static directory (e.g. css/style.css) to a hashed path
+        with the first HASH_LENGTH characters of the sha256 of its content before the extension
+        (e.g. css/style.1a2b3c4d5e6f.css). The directory is hashed when the manifest is created and
+        the hashed paths are then looked up without touching the disk; a file added later (e.g. a
+        resized image) is hashed the first time it is asked for. A file changed while the
+        application runs keeps its hashed path, unless the manifest reloads (for development),
+        in which case every lookup checks the file's modification time and size and a changed
+        file is hashed again, so it gets a new URL.
+        The url() references of the style sheets are rewritten to the hashed paths of the files
+        they point to, so the images they use are cached for good too.
+    """
+
+    def __init__(self, directory, reload=False):
+        """
+            Creates the manifest and hashes every file in the static directory.
+        :param directory:
+            type: string
+            required: true
+            description: The path of the static directory
+        :param reload:
+            type: boolean
+            required: false
+            description: True to check every file for changes each time it is looked up
+        """
+        self.directory = directory
+        self.reload = reload
+        self._assets = {}  # path => (stamp, hashed path, rewritten content or None, references)
+        self._lock = threading.RLock()  # Re-entered when a style sheet hashes the files it references
+        for folder, _, filenames in os.walk(directory):
+            for filename in filenames:
+                self.get(os.path.relpath(os.path.join(folder, filename), directory).replace(os.sep, "/"))
+
+    def get(self, path):
+        """
+            Gets the hashed path of a static file.
+        :param path:
+            type: string
+            required: true
+            description: The path of the file relative to the static directory, e.g. css/style.css
+        :return: The hashed path or None if there is no such file
+        """
+        asset = self._get_asset(path)
+        return asset[1] if asset is not None else None
+
+    def resolve(self, hashed_path):
+        """
+            Finds the static file of a hashed path.
+        :param hashed_path:
+            type: string
+            required: true
+            description: The hashed path, e.g. css/style.1a2b3c4d5e6f.css
+        :return: A (path, content, is_current) tuple, where content is the rewritten content of a
+                 style sheet (None for the other files, which are sent from the disk) and is_current
+                 is False when the file has changed since the URL was made (e.g. a page cached
+                 before a new release), or None if there is no such file
+        """
+        match = HASHED_NAME.match(hashed_path)
+        if match is None:
+            return None
+        path = match.group(1) + (match.group(3) or "")
+        asset = self._get_asset(path)
+        if asset is None:
+            return None
+        return path, asset[2], asset[1] == hashed_path
+
+    def get_manifest(self):
+        """
+            Gets the manifest.
+        :return: A dictionary of path => hashed path of the files hashed so far
+        """
+        return {path: asset[1] for path, asset in sorted(self._assets.items())}
+
+    def _get_asset(self, path):
+        """
+            Gets the manifest entry of a static file, hashing the file if it is new (or, when the
+            manifest reloads, has changed).
+        :param path:
+            type: string
+            required: true
+            description: The path of the file relative to the static directory
+        :return: The (stamp, hashed path, content, references) entry or None if there is no such
+                 file (or the path is outside the static directory)
+        """
+        path = posixpath.normpath(path)
+        if path.startswith(("../", "/")) or path in ("..", "."):
+            return None
+        asset = self._assets.get(path)
+        if asset is not None and not self.reload:
+            return asset
+        full_path = os.path.join(self.directory, *path.split("/"))
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if asset is not None and asset[0] == stamp and \
+                all(self.get(reference) == hashed for reference, hashed in asset[3]):
+            return asset
+        with self._lock:
+            try:
+                with open(full_path, "rb") as f:
+                    content = f.read()
+            except OSError:
+                return None
+            references = ()
+            if path.endswith(".css"):
+                content, references = self._rewrite_css(path, content)
+            base, extension = posixpath.splitext(path)
+            hashed_path = f"{base}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{extension}"
+            asset = (stamp, hashed_path, content if references else None, references)
+            self._assets[path] = asset
+        return asset
+
+    def _rewrite_css(self, path, content):
+        """
+            Rewrites the url() references of a style sheet to the hashed paths of the static files
+            they point to. Absolute URLs and references to files that do not exist are kept.
+        :param path:
+            type: string
+            required: true
+            description: The path of the style sheet relative to the static directory
+        :param content:
+            type: bytes
+            required: true
+            description: The content of the style sheet
+        :return: A (content, references) tuple of the rewritten content and a tuple of the
+                 (path, hashed path) of the files referenced
+        """
+        folder = posixpath.dirname(path)
+        references = []
+
+        def rewrite(match):
+            url = match.group(2)
+            if ":" in url or url.startswith(("/", "#")) or "?" in url:
+                return match.group(0)
+            reference = posixpath.normpath(posixpath.join(folder, url))
+            hashed_path = self.get(reference)
+            if hashed_path is None:
+                return match.group(0)
+            references.append((reference, hashed_path))
+            return f"url({match.group(1)}{posixpath.relpath(hashed_path, folder or '.')}{match.group(1)})"
+
+        text = CSS_URL.sub(rewrite, content.decode("utf-8"))
+        return text.encode("utf-8"), tuple(references)
@@ -0,0 +1,207 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : async_data_access.py
+# Program description   : This module provides the async variants of the database functions used by
+#                         the async (ASGI) serving mode.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import data_access
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import os
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+DATABASE_THREADS = int(os.environ.get("DICTIONARY_DATABASE_THREADS", str(data_access.POOL_SIZE)))
+
+
+database_executor = ThreadPoolExecutor(max_workers=DATABASE_THREADS, thread_name_prefix="database")
+
+
+async def run_in_thread(function, *args):
+    """
+        This function runs a blocking function (a database call or a service function making
+        database calls) on one of the DATABASE_THREADS database threads, so the event loop keeps
+        serving the other clients while it runs. The database threads are shared by all the
+        requests, so the number of them (rather than the number of clients) limits the number of
+        pooled connections in use.
+        The function runs in a copy of the caller's context, so the Flask request and application
+        contexts (request, session and g) are available to it.
+    :param function:
+        type: function
+        required: true
+        description: The function to run
+    :param args:
+        type: any
+        required: false
+        description: The arguments of the function
+    :return: The return value of the function
+    """
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(database_executor, functools.partial(context.run, function, *args))
+
+
+async def execute_query(query, args=None):
+    """
+        The async variant of data_access.execute_query
+    :param query:
+        type: SQL query
+        required: true
+        description: The query to be executed on the database
+    :param args:
+        type: arguments list
+        required: false
+        description: The optional arguments for query
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: A list of tuples consisting of query results or Error if
+        an error occurred during execution of the statement.
+    """
+    return await run_in_thread(data_access.execute_query, query, args)
+
+
+async def execute_command(command, args=None):
+    """
+        The async variant of data_access.execute_command. The command is queued for the database
+        writer without holding a database thread while it waits to be committed.
+    :param command:
+        type: SQL statement
+        required: true
+        description: The sql statement to be executed on the database
+    :param args:
+        type: arguments list
+        required: false
+        description: The optional arguments for the command
+    :return: An Error only if an error occurred during execution
+             of the statement.
+    """
+    return await asyncio.to_thread(data_access.execute_command, command, args)
+
+
+async def get_data_generations():
+    """
+        The async variant of data_access.get_data_generations
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: A dictionary of name => (generation, changed_at) or None if the generations could
+             not be read
+    """
+    return await run_in_thread(data_access.get_data_generations)
+
+
+async def get_category_list():
+    """
+        The async variant of data_access.get_category_list
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: A list of (id, category_name) tuples or None
+    """
+    return await run_in_thread(data_access.get_category_list)
+
+
+async def get_word(word_id):
+    """
+        The async variant of data_access.get_word
+    :param word_id:
+        type: int
+        required: true
+        description: The id of the word
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: A list with the word details tuple or None
+    """
+    return await run_in_thread(data_access.get_word, word_id)
+
+
+async def get_browse_results(letter, after=None, page_size=data_access.PAGE_SIZE):
+    """
+        The async variant of data_access.get_browse_results. The results are always read in full
+        (never streamed) so the database thread is released before the page is sent.
+    :param letter:
+        type: string
+        required: true
+        description: The character used to browse the dictionary
+    :param after:
+        type: tuple
+        required: false
+        description: The (maori, english) of the last word of the previous page
+    :param page_size:
+        type: int
+        required: false
+        description: The number of words on a page
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: The list of result tuples or None
+    """
+    return await run_in_thread(data_access.get_browse_results, letter, after, page_size)
+
+
+async def get_search_results(maori, english, level, most_recent, phrase="", after=None,
+                             page_size=data_access.PAGE_SIZE):
+    """
+        The async variant of data_access.get_search_results. The results are always read in full
+        (never streamed) so the database thread is released before the page is sent.
+    :param maori:
+        type: string
+        required: true
+        description: The maori word
+    :param english:
+        type: string
+        required: true
+        description: The english word
+    :param level:
+        type: string
+        required: true
+        description: The year level, "0" for all levels
+    :param most_recent:
+        type: string
+        required: true
+        description: "1" for the most recently added words
+    :param phrase:
+        type: string
+        required: false
+        description: The phrase for a full text search
+    :param after:
+        type: tuple
+        required: false
+        description: The (maori, english) of the last word of the previous page
+    :param page_size:
+        type: int
+        required: false
+        description: The number of words on a page
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: The list of result tuples or None
+    """
+    return await run_in_thread(data_access.get_search_results, maori, english, level, most_recent, phrase,
+                               after, page_size)
+
+
+async def get_words(category_id, after=None, page_size=data_access.PAGE_SIZE):
+    """
+        The async variant of data_access.get_words. The results are always read in full (never
+        streamed) so the database thread is released before the page is sent.
+    :param category_id:
+        type: int
+        required: true
+        description: The id of the category
+    :param after:
+        type: tuple
+        required: false
+        description: The (maori, english) of the last word of the previous page
+    :param page_size:
+        type: int
+        required: false
+        description: The number of words on a page
+    :calls
+        run_in_thread - Runs the query on a database thread
+    :return: The list of result tuples or None
+    """
+    return await run_in_thread(data_access.get_words, category_id, after, page_size)
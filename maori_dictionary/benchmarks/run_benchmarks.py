@@ -0,0 +1,512 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : run_benchmarks.py
+#                         NOTE: This is a benchmark harness and not a part of the application.
+#                               Examples (run from the application directory):
+#                                   python benchmarks/run_benchmarks.py --sizes 1000,100000
+#                                   python benchmarks/run_benchmarks.py compare old.json new.json
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("DICTIONARY_ATTEMPTS_PER_IP", "0")  # The login benchmark logs in again and again
+os.environ.setdefault("DICTIONARY_ATTEMPTS_PER_EMAIL", "0")
+os.environ.setdefault("DICTIONARY_SLOW_QUERY_MS", "0")  # The contended write benchmarks would fill the log
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+import data_access
+from flask_bcrypt import generate_password_hash
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+SOURCE_DATABASE = os.path.join("database", "dictionary.db")
+VOCAB_FILE = os.path.join("migrations", "data", "Vocab_List.csv")
+RESULTS_DIR = os.path.join("benchmarks", "results")
+DEFAULT_SIZES = "1000,100000,1000000"
+SYLLABLES = ["a", "e", "i", "o", "u", "ha", "he", "hi", "ho", "hu", "ka", "ke", "ki", "ko", "ku", "ma", "me", "mi",
+             "mo", "mu", "na", "ne", "ni", "no", "nu", "nga", "pa", "pe", "pi", "po", "pu", "ra", "re", "ri", "ro",
+             "ru", "ta", "te", "ti", "to", "tu", "wa", "we", "wi", "wha", "whe", "whi"]
+BENCHMARK_EMAIL = "benchmark.teacher@example.com"
+BENCHMARK_PASSWORD = "benchmark-password"
+CONCURRENT_READERS = 4
+SEARCH_SCENARIOS = [
+    ("search_01_maori_english_recent", "ka", "t", "0", "1"),
+    ("search_02_maori_level_recent", "ka", "", "3", "1"),
+    ("search_03_english_level_recent", "", "t", "3", "1"),
+    ("search_04_maori_recent", "ka", "", "0", "1"),
+    ("search_05_english_recent", "", "t", "0", "1"),
+    ("search_06_level_recent", "", "", "3", "1"),
+    ("search_07_maori_english_level_recent", "ka", "t", "3", "1"),
+    ("search_08_maori_english", "ka", "t", "0", "0"),
+    ("search_09_maori_level", "ka", "", "3", "0"),
+    ("search_10_english_level", "", "t", "3", "0"),
+    ("search_11_maori", "ka", "", "0", "0"),
+    ("search_12_english", "", "t", "0", "0"),
+    ("search_13_level", "", "", "3", "0"),
+    ("search_14_maori_english_level", "ka", "t", "3", "0"),
+    ("search_15_recent", "", "", "0", "1"),
+]
+
+
+def get_suffix(number):
+    """
+        This function turns a number into a made up maori looking word built from syllables,
+        used to make each synthetic word unique.
+    :param number:
+        type: int
+        required: true
+        description: The number to turn into a word
+    :return: The word
+    """
+    word = ""
+    while True:
+        number, index = divmod(number, len(SYLLABLES))
+        word = SYLLABLES[index] + word
+        if number == 0:
+            return word
+
+
+def read_vocab_list():
+    """
+        This function reads the vocab list rows used as the shape of the synthetic words
+    :return: A list of [maori, english, category, definition, level] rows
+    """
+    with open(VOCAB_FILE, encoding="utf-8") as csv_file:
+        rows = list(csv.reader(csv_file))
+    return rows[1:]
+
+
+def generate_database(path, word_count, seed):
+    """
+        This function creates a synthetic dictionary database with the number of words given.
+        It starts from a copy of the application database brought up to the current schema and
+        replaces the dictionary words with words generated from the vocab list: the first pass
+        uses the vocab list as it is and every later pass adds a made up syllable suffix to the
+        maori and english words. Levels and categories are kept, date_added is spread over the
+        last two years and the words are edited by a benchmark teacher user.
+    :param path:
+        type: string
+        required: true
+        description: The path of the database file to create
+    :param word_count:
+        type: int
+        required: true
+        description: The number of dictionary words to generate
+    :param seed:
+        type: int
+        required: true
+        description: The random seed, so that the same database is generated every time
+    :return: The number of seconds it took to generate the database
+    """
+    start = time.perf_counter()
+    shutil.copy(SOURCE_DATABASE, path)
+    data_access.DATABASE = path
+    data_access.migrate_database()
+    vocab = read_vocab_list()
+    randomizer = random.Random(seed)
+    today = date(2022, 5, 30)
+    connection = data_access.get_connection(path)
+    with connection:
+        connection.execute("DELETE FROM dictionary")
+        connection.execute("DELETE FROM sqlite_sequence WHERE name = 'dictionary'")
+        connection.execute("DELETE FROM user_details WHERE email = ?", [BENCHMARK_EMAIL])
+        connection.execute("""INSERT INTO user_details (first_name, last_name, email, password, user_type_id)
+                              VALUES ('Bench', 'Mark', ?, ?, (SELECT id FROM user_type WHERE user_type = 'teacher'))""",
+                           [BENCHMARK_EMAIL, generate_password_hash(BENCHMARK_PASSWORD)])
+        user_id = connection.execute("SELECT id FROM user_details WHERE email = ?", [BENCHMARK_EMAIL]).fetchone()[0]
+        categories = {name: category_id
+                      for category_id, name in connection.execute("SELECT id, category_name FROM category")}
+
+        def rows():
+            for number in range(word_count):
+                maori, english, category, definition, level = vocab[number % len(vocab)]
+                pass_number = number // len(vocab)
+                if pass_number > 0:
+                    maori = f"{maori}{get_suffix(pass_number)}"
+                    english = f"{english} {pass_number}"
+                date_added = today - timedelta(days=randomizer.randrange(730))
+                yield (maori, english, definition, int(level), categories[category.title()],
+                       randomizer.choice([user_id, None]), date_added.isoformat())
+
+        connection.executemany("""INSERT OR IGNORE INTO dictionary
+                                  (maori, english, description, level, category_id, user_id, date_added,
+                                   maori_key, english_key)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, normalize_key(?1), normalize_key(?2))""", rows())
+        connection.execute("ANALYZE")
+    connection.close()
+    return time.perf_counter() - start
+
+
+def get_stats(latencies, elapsed):
+    """
+        This function summarises the latencies of a benchmark
+    :param latencies:
+        type: list of floats
+        required: true
+        description: The latency of each call in seconds
+    :param elapsed:
+        type: float
+        required: true
+        description: The total time taken by all the calls in seconds
+    :return: A dictionary of the call count, latency percentiles in milliseconds and throughput
+             in calls per second
+    """
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "calls": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+        "throughput_per_s": len(ordered) / elapsed if elapsed > 0 else 0,
+    }
+
+
+def measure(function, iterations, warmup):
+    """
+        This function calls a function repeatedly and measures the latency of each call
+    :param function:
+        type: function
+        required: true
+        description: The function to benchmark, called with the iteration number
+    :param iterations:
+        type: int
+        required: true
+        description: The number of measured calls
+    :param warmup:
+        type: int
+        required: true
+        description: The number of calls made before measuring
+    :return: The statistics from get_stats
+    """
+    for number in range(warmup):
+        function(number)
+    latencies = []
+    start = time.perf_counter()
+    for number in range(iterations):
+        call_start = time.perf_counter()
+        function(warmup + number)
+        latencies.append(time.perf_counter() - call_start)
+    return get_stats(latencies, time.perf_counter() - start)
+
+
+def get_data_access_benchmarks(word_count):
+    """
+        This function lists the data_access benchmarks
+    :param word_count:
+        type: int
+        required: true
+        description: The number of words in the database, used to pick word ids
+    :return: A list of (name, function, is_write) tuples
+    """
+    benchmarks = [(f"data_access.{name}", lambda n, c=criteria: data_access.get_search_results(*c), False)
+                  for name, *criteria in SEARCH_SCENARIOS]
+    benchmarks += [
+        ("data_access.search_full_text", lambda n: data_access.get_search_results("", "", "0", "0", "haere"), False),
+        ("data_access.get_browse_results", lambda n: data_access.get_browse_results("k"), False),
+        ("data_access.get_browse_results_next_page",
+         lambda n: data_access.get_browse_results("k", after=("ko", "")), False),
+        ("data_access.get_category_list", lambda n: data_access.get_category_list(), False),
+        ("data_access.get_words", lambda n: data_access.get_words(2), False),
+        ("data_access.get_words_next_page", lambda n: data_access.get_words(2, after=("m", "")), False),
+        ("data_access.get_word", lambda n: data_access.get_word(n % word_count + 1), False),
+        ("data_access.get_user_details", lambda n: data_access.get_user_details(BENCHMARK_EMAIL), False),
+        ("data_access.get_allow_edit", lambda n: data_access.get_allow_edit(BENCHMARK_EMAIL), False),
+        ("data_access.add_word", lambda n: data_access.add_word(f"benchmark {n}", "benchmark", "Benchmark word.",
+                                                                 5, 2, BENCHMARK_EMAIL), True),
+        ("data_access.update_word", lambda n: data_access.update_word(f"benchmark update {n}", "benchmark",
+                                                                       "Benchmark update.", 5, BENCHMARK_EMAIL,
+                                                                       n % word_count + 1), True),
+    ]
+    return benchmarks
+
+
+def get_route_benchmarks(flask_app, client, teacher, word_count):
+    """
+        This function lists the Flask route benchmarks
+    :param flask_app:
+        type: Flask
+        required: true
+        description: The application, used to create a new client for each login
+    :param client:
+        type: FlaskClient
+        required: true
+        description: A test client for anonymous requests
+    :param teacher:
+        type: FlaskClient
+        required: true
+        description: A test client logged in as the benchmark teacher
+    :param word_count:
+        type: int
+        required: true
+        description: The number of words in the database, used to pick word ids
+    :return: A list of (name, function, is_write) tuples
+    """
+    def search_form(maori, english, level, most_recent, phrase=""):
+        return {"maori": maori, "english": english, "level": level, "Date-Added": most_recent, "phrase": phrase}
+
+    benchmarks = [(f"route.{name}", lambda n, c=criteria: client.post("/search/~", data=search_form(*c)), False)
+                  for name, *criteria in SEARCH_SCENARIOS]
+    benchmarks += [
+        ("route.search_full_text", lambda n: client.post("/search/~", data=search_form("", "", "0", "0", "haere")),
+         False),
+        ("route.home", lambda n: client.get("/"), False),
+        ("route.browse", lambda n: client.get("/search/k"), False),
+        ("route.category", lambda n: client.get("/category/2"), False),
+        ("route.word", lambda n: client.get(f"/word/{n % word_count + 1}"), False),
+        ("route.browse_teacher", lambda n: teacher.get("/search/k"), False),
+        ("route.api_browse", lambda n: client.get("/api/v1/browse/k", headers={"Accept-Encoding": "gzip"}), False),
+        ("route.api_word", lambda n: client.get(f"/api/v1/words/{n % word_count + 1}"), False),
+        ("route.api_words_bulk", lambda n: client.get(
+            "/api/v1/words?ids=" + ",".join(str((n * 100 + i) % word_count + 1) for i in range(100))), False),
+        ("route.api_changes", lambda n: client.get(f"/api/v1/changes?since={n % word_count}"), False),
+        ("route.login", lambda n: flask_app.test_client().post("/login", data={
+            "email": BENCHMARK_EMAIL, "password": BENCHMARK_PASSWORD}), True),
+        ("route.add_word", lambda n: teacher.post("/category/2", data={
+            "maori": f"benchmark route {n}", "english": "benchmark", "description": "Benchmark word.",
+            "level": "5"}), True),
+        ("route.update_word", lambda n: teacher.post(f"/word/{n % word_count + 1}?breadcrumb=/", data={
+            "maori": f"benchmark route update {n}", "english": "benchmark", "description": "Benchmark update.",
+            "level": "5"}), True),
+    ]
+    return benchmarks
+
+
+def measure_reads_under_writes(word_count, seconds):
+    """
+        This function measures the read throughput while a teacher keeps saving words, to show
+        whether the readers are held up by the writes (the journal mode is set with the
+        DICTIONARY_JOURNAL_MODE environment variable, e.g. "delete" to compare with "wal").
+        CONCURRENT_READERS threads read words and browse pages while one thread updates words.
+    :param word_count:
+        type: int
+        required: true
+        description: The number of words in the database, used to pick word ids
+    :param seconds:
+        type: float
+        required: true
+        description: How long to run for
+    :return: A dictionary with the read statistics from get_stats together with the number of
+             writes, failed writes and the writes per second
+    """
+    stop = threading.Event()
+    latencies = [[] for reader in range(CONCURRENT_READERS)]
+    writes = {"writes": 0, "failed_writes": 0}
+
+    def read(number):
+        n = number
+        while not stop.is_set():
+            start = time.perf_counter()
+            if n % 2 == 0:
+                data_access.get_word(n % word_count + 1)
+            else:
+                data_access.get_browse_results("k")
+            latencies[number].append(time.perf_counter() - start)
+            n += 1  # Every reader alternates between the two queries
+
+    def write():
+        n = 0
+        while not stop.is_set():
+            if data_access.update_word(f"benchmark concurrent {n}", "benchmark", "Benchmark update.", 5,
+                                       BENCHMARK_EMAIL, n % word_count + 1):
+                writes["writes"] += 1
+            else:
+                writes["failed_writes"] += 1
+            n += 1
+
+    threads = [threading.Thread(target=read, args=(number,)) for number in range(CONCURRENT_READERS)]
+    threads.append(threading.Thread(target=write))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    results = get_stats([latency for reader in latencies for latency in reader], elapsed)
+    results.update(writes, writes_per_s=writes["writes"] / elapsed)
+    return results
+
+
+def run_size(word_count, args, data_dir):
+    """
+        This function generates a database of the size given and runs every benchmark against it
+    :param word_count:
+        type: int
+        required: true
+        description: The number of words in the synthetic database
+    :param args:
+        type: argparse.Namespace
+        required: true
+        description: The command line arguments
+    :param data_dir:
+        type: string
+        required: true
+        description: The directory the synthetic database is created in
+    :return: A dictionary of benchmark name => statistics
+    """
+    path = os.path.join(data_dir, f"dictionary_{word_count}.db")
+    print(f"Generating {word_count} words ...", flush=True)
+    results = {"generate_seconds": generate_database(path, word_count, args.seed)}
+    import app
+    import response_cache
+    response_cache.response_cache = response_cache.ResponseCache(
+        response_cache.RESPONSE_CACHE_MAX_BYTES if args.response_cache else 0)
+    client = app.app.test_client()
+    teacher = app.app.test_client()
+    teacher.post("/login", data={"email": BENCHMARK_EMAIL, "password": BENCHMARK_PASSWORD})
+    benchmarks = get_data_access_benchmarks(word_count) + get_route_benchmarks(app.app, client, teacher, word_count)
+    for name, function, is_write in benchmarks:
+        if args.filter and args.filter not in name:
+            continue
+        iterations = args.write_iterations if is_write else args.iterations
+        results[name] = measure(function, iterations, args.warmup)
+        print(f"  {name:48} p50 {results[name]['p50_ms']:9.3f} ms  p99 {results[name]['p99_ms']:9.3f} ms  "
+              f"{results[name]['throughput_per_s']:10.1f}/s", flush=True)
+    if args.concurrent_seconds > 0 and (not args.filter or args.filter in "concurrent.reads_under_writes"):
+        results["concurrent.reads_under_writes"] = stats = measure_reads_under_writes(word_count,
+                                                                                      args.concurrent_seconds)
+        print(f"  {'concurrent.reads_under_writes':48} p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+              f"{stats['throughput_per_s']:10.1f}/s  writes {stats['writes_per_s']:.1f}/s "
+              f"({stats['failed_writes']} failed)", flush=True)
+    results["pool"] = data_access.get_pool_stats()
+    results["writer"] = data_access.get_writer_stats()
+    results["password_hasher"] = app.get_password_hasher_stats()
+    data_access.close_pool()
+    return results
+
+
+def get_git_commit():
+    """
+        This function gets the current git commit, to identify the code that was benchmarked
+    :return: The commit hash or an empty string if it could not be found
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run(args):
+    """
+        This function runs the benchmarks for each database size and saves the results as JSON
+    :param args:
+        type: argparse.Namespace
+        required: true
+        description: The command line arguments
+    """
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="dictionary_benchmark_")
+    os.makedirs(data_dir, exist_ok=True)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": get_git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "write_iterations": args.write_iterations,
+            "warmup": args.warmup,
+            "response_cache": args.response_cache,
+            "connection_profile": data_access.get_connection_profile(),
+        },
+        "results": {},
+    }
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            report["results"][str(size)] = run_size(size, args, data_dir)
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results saved to {output}")
+
+
+def compare(args):
+    """
+        This function compares two saved benchmark results and reports the benchmarks whose
+        median latency got slower by more than the threshold
+    :param args:
+        type: argparse.Namespace
+        required: true
+        description: The command line arguments
+    :return: The number of regressions found
+    """
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["results"]
+    regressions = 0
+    for size in sorted(set(baseline) & set(candidate), key=int):
+        print(f"{size} words")
+        for name in sorted(set(baseline[size]) & set(candidate[size])):
+            before, after = baseline[size][name], candidate[size][name]
+            if not isinstance(before, dict) or "p50_ms" not in before:
+                continue
+            ratio = after["p50_ms"] / before["p50_ms"] if before["p50_ms"] > 0 else 1
+            flag = ""
+            if ratio > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {name:48} p50 {before['p50_ms']:9.3f} -> {after['p50_ms']:9.3f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main():
+    """
+        This function parses the command line and runs or compares the benchmarks
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks the data_access functions and Flask routes.")
+    subparsers = parser.add_subparsers(dest="command")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated dictionary sizes")
+    parser.add_argument("--iterations", type=int, default=200, help="Measured calls per read benchmark")
+    parser.add_argument("--write-iterations", type=int, default=20, help="Measured calls per write/login benchmark")
+    parser.add_argument("--warmup", type=int, default=5, help="Calls made before measuring")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic data")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--no-response-cache", dest="response_cache", action="store_false",
+                        help="Disable the anonymous response cache")
+    parser.add_argument("--concurrent-seconds", type=float, default=5,
+                        help="How long to measure reads under concurrent writes (0 to skip)")
+    parser.add_argument("--data-dir", help="Keep the synthetic databases in this directory")
+    parser.add_argument("--output", help="The JSON results file")
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=1.2,
+                                help="Median latency ratio counted as a regression")
+    args = parser.parse_args()
+    if args.command == "compare":
+        sys.exit(1 if compare(args) > 0 else 0)
+    run(args)
+
+
+main()
@@ -0,0 +1,71 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : compression.py
+# Program description   : This module chooses and applies the content encoding (compression) of
+#                         the API responses.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import gzip
+
+try:
+    import brotli  # Optional, brotli is only offered when the package is installed
+except ImportError:
+    brotli = None
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+MIN_COMPRESS_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def get_encodings():
+    """
+        Gets the content encodings the application can produce, most preferred first.
+    :return: A list of encoding names
+    """
+    if brotli is None:
+        return ["gzip"]
+    return ["br", "gzip"]
+
+
+def negotiate_encoding(accept_encodings):
+    """
+        Chooses the content encoding of a response from the client's Accept-Encoding header.
+    :param accept_encodings:
+        type: werkzeug.datastructures.MIMEAccept
+        required: true
+        description: The parsed Accept-Encoding header of the request (request.accept_encodings)
+    :calls
+        get_encodings - Gets the encodings the application can produce
+    :return: The chosen encoding name or None when the response is not compressed
+    """
+    for encoding in get_encodings():
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    """
+        Compresses a response body. Bodies smaller than MIN_COMPRESS_BYTES are not compressed
+        as the compression headers would cost more than they save.
+    :param body:
+        type: bytes
+        required: true
+        description: The response body
+    :param encoding:
+        type: string
+        required: false
+        description: The encoding chosen by negotiate_encoding or None
+    :return: A tuple of the (possibly) compressed body and its encoding, None when it is not compressed
+    """
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), encoding
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), encoding
@@ -0,0 +1,160 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : connection_pool.py
+# Program description   : This module provides a pool of reusable database connections for the
+#                         data access module.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import sqlite3
+import threading
+import time
+
+
+class ConnectionPool:
+    """
+        A pool of reusable database connections. Idle connections are kept in a last in first out
+        list so that a worker thread usually gets back the connection it used last, which keeps the
+        SQLite page cache of that connection warm.
+
+        At most "size" idle connections are kept. When more workers than that need a connection at
+        the same time an extra connection is opened and closed again once it is released.
+    """
+
+    def __init__(self, db_file, connect, size, health_check_seconds):
+        """
+            Creates an empty pool. Connections are only opened when they are first needed.
+        :param db_file:
+            type: string
+            required: true
+            description: The database file the pooled connections are opened against
+        :param connect:
+            type: function
+            required: true
+            description: A function taking the database file and returning a new connection or None
+        :param size:
+            type: int
+            required: true
+            description: The maximum number of idle connections kept in the pool
+        :param health_check_seconds:
+            type: int
+            required: true
+            description: Idle connections older than this are checked with a "SELECT 1" before reuse
+        """
+        self.db_file = db_file
+        self.size = size
+        self.health_check_seconds = health_check_seconds
+        self._connect = connect
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"hits": 0, "misses": 0, "health_check_failures": 0, "discarded": 0, "overflow": 0}
+
+    def acquire(self):
+        """
+            Gets a connection from the pool. An idle connection is reused when available (a hit),
+            otherwise a new connection is opened (a miss).
+        :return: A connection to the database or None if a connection could not be opened.
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    return None
+                if len(self._idle) == 0:
+                    self._stats["misses"] += 1
+                    break
+                connection, released_at = self._idle.pop()
+            if time.monotonic() - released_at < self.health_check_seconds or self._is_healthy(connection):
+                with self._lock:
+                    self._stats["hits"] += 1
+                return connection
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            self._close(connection)
+        return self._connect(self.db_file)
+
+    def release(self, connection, discard=False):
+        """
+            Returns a connection to the pool. Any open transaction is rolled back first.
+            The connection is closed instead of pooled when it is marked to be discarded,
+            when the pool is full or when the pool has been shut down.
+        :param connection:
+            type: sqlite3.Connection
+            required: true
+            description: The connection previously obtained from acquire()
+        :param discard:
+            type: boolean
+            required: false
+            description: True when the connection hit an error that may have left it unusable
+        """
+        if connection is None:
+            return
+        if not discard and connection.in_transaction:
+            try:
+                connection.rollback()
+            except sqlite3.Error:
+                discard = True
+        with self._lock:
+            if discard:
+                self._stats["discarded"] += 1
+            elif not self._closed and len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+            else:
+                self._stats["overflow"] += 1
+        self._close(connection)
+
+    def close_all(self):
+        """
+            Shuts the pool down by closing all idle connections. Connections still in use are
+            closed when they are released.
+        """
+        with self._lock:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+        for connection, released_at in idle:
+            self._close(connection)
+
+    def get_stats(self):
+        """
+            Gets the pool statistics.
+        :return: A dictionary with the hit, miss, health check failure, discarded and overflow
+                 counts together with the current number of idle connections.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+            stats["size"] = self.size
+        return stats
+
+    @staticmethod
+    def _is_healthy(connection):
+        """
+            Checks that a connection can still run a statement.
+        :param connection:
+            type: sqlite3.Connection
+            required: true
+            description: The connection to check
+        :return: True if the connection is usable otherwise False
+        """
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _close(connection):
+        """
+            Closes a connection ignoring any error raised while closing it.
+        :param connection:
+            type: sqlite3.Connection
+            required: true
+            description: The connection to close
+        """
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
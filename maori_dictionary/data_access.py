@@ -6,36 +6,317 @@
 # Date                  : 2022-05-30
 # Project               : 91902 (NCEA L3 Internal)
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from connection_pool import ConnectionPool
+from database_writer import DatabaseWriter
+from instrumentation import instrumented
+from normalization import normalize_key, get_key_range
+from query_builder import SelectQuery
+from slow_query_log import SlowQueryLog
+from versioned_cache import VersionedCache
 import sqlite3
 from sqlite3 import Error
+import atexit
+import glob
+import json
+import os
+import re
+import threading
 
 
 # ~~~~~~~~~~~~~~~~~
 # Declare constants
 # ~~~~~~~~~~~~~~~~~
 DATABASE = "database/dictionary.db"
+MIGRATION_SCRIPT_DIR = "migrations/scripts"
+MIGRATION_BASELINE_VERSION = 3
+POOL_SIZE = int(os.environ.get("DICTIONARY_POOL_SIZE", "5"))
+POOL_HEALTH_CHECK_SECONDS = int(os.environ.get("DICTIONARY_POOL_HEALTH_CHECK_SECONDS", "30"))
+MOST_RECENT_LIMIT = 20
+CHANGE_PAGE_SIZE = 500
+EXISTING_WORDS_CHUNK_SIZE = 400  # Two arguments a word, well below SQLite's limit on the number of arguments
+PAGE_SIZE = int(os.environ.get("DICTIONARY_PAGE_SIZE", "50"))
+STREAM_BATCH_SIZE = int(os.environ.get("DICTIONARY_STREAM_BATCH_SIZE", "100"))
+JOURNAL_MODE = os.environ.get("DICTIONARY_JOURNAL_MODE", "wal").lower()
+SYNCHRONOUS = os.environ.get("DICTIONARY_SYNCHRONOUS", "normal").lower()
+MMAP_SIZE = int(os.environ.get("DICTIONARY_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KIB = int(os.environ.get("DICTIONARY_CACHE_SIZE_KIB", "16384"))
+BUSY_TIMEOUT_MS = int(os.environ.get("DICTIONARY_BUSY_TIMEOUT_MS", "5000"))
+WRITE_RETRIES = int(os.environ.get("DICTIONARY_WRITE_RETRIES", "3"))
+WRITE_RETRY_BACKOFF_SECONDS = 0.05
+WRITE_BATCH_SIZE = int(os.environ.get("DICTIONARY_WRITE_BATCH_SIZE", "64"))
+WRITE_TIMEOUT_SECONDS = int(os.environ.get("DICTIONARY_WRITE_TIMEOUT_SECONDS", "30"))
+SYNCHRONOUS_LEVELS = {"off": 0, "normal": 1, "full": 2, "extra": 3}
+BIND_ERRORS = ("binding", "Binding", "parameters are of unsupported type",
+               "one statement at a time")  # ProgrammingErrors raised before the statement runs
+SLOW_QUERY_MS = int(os.environ.get("DICTIONARY_SLOW_QUERY_MS", "250"))
+SLOW_QUERY_LOG = os.environ.get("DICTIONARY_SLOW_QUERY_LOG", os.path.join("logs", "slow_queries.log"))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("DICTIONARY_SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("DICTIONARY_SLOW_QUERY_LOG_BACKUPS", "5"))
+WORD_SUMMARY_COLUMNS = "d.id, d.maori, d.english, d.level, d.date_added, ifnull(u.first_name, ''), " \
+                       "ifnull(u.last_name, '')"
+WORD_SUMMARY_SOURCE = "dictionary d LEFT JOIN user_details u on d.user_id = u.id"
+FULL_TEXT_SNIPPET_COLUMN = "snippet(dictionary_fts, -1, char(2), char(3), '...', 10)"
+FULL_TEXT_SOURCE = "dictionary d JOIN dictionary_fts ON dictionary_fts.rowid = d.id " \
+                   "LEFT JOIN user_details u on d.user_id = u.id"
+FULL_TEXT_RANK = "bm25(dictionary_fts, 10.0, 5.0, 1.0)"
+
+
+connection_pool = None
+connection_pool_lock = threading.Lock()
+database_writer = None
+slow_query_log = SlowQueryLog(SLOW_QUERY_LOG, SLOW_QUERY_MS, SLOW_QUERY_LOG_MAX_BYTES, SLOW_QUERY_LOG_BACKUPS,
+                              lambda query, args: explain_query(query, args))
 
 
 def get_connection(db_file):
     """
         This function is used to get a connection to the specified database. If a connection
         could not be obtained the error details will be printed on the console.
+        The normalize_key function (see normalization.py) is made available to SQL statements
+        and the connection profile (see get_connection_profile) is applied.
 
     :param db_file:
         type: database file
         required: true
         description: The database file
+    :calls
+        get_connection_profile - Gets the pragmas applied to the connection
     :return: A connection to the database.
     """
     try:
-        connection = sqlite3.connect(db_file)
+        connection = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
         connection.execute('pragma foreign_keys=ON')
+        for pragma, value in get_connection_profile().items():
+            if pragma != "journal_mode":  # Stored in the database file, set once by check_connection_profile
+                connection.execute(f"pragma {pragma}={value}")
+        connection.create_function("normalize_key", 1, normalize_key, deterministic=True)
         return connection
     except Error as e:
         print(e)
     return None
 
 
+def get_connection_profile():
+    """
+        This function gets the pragmas every connection is configured with, set with the
+        DICTIONARY_JOURNAL_MODE, DICTIONARY_SYNCHRONOUS, DICTIONARY_MMAP_SIZE,
+        DICTIONARY_CACHE_SIZE_KIB and DICTIONARY_BUSY_TIMEOUT_MS environment variables.
+        The default WAL journal lets the pages be read while a word is being saved, and with
+        WAL a synchronous level of NORMAL is still safe from corruption (only the last commits
+        can be lost on a power failure).
+    :return: A dictionary of pragma name => value
+    """
+    return {"journal_mode": JOURNAL_MODE,
+            "synchronous": SYNCHRONOUS,
+            "mmap_size": MMAP_SIZE,
+            "cache_size": -CACHE_SIZE_KIB,
+            "busy_timeout": BUSY_TIMEOUT_MS}
+
+
+def check_connection_profile():
+    """
+        This function applies the connection profile to the database when the application starts.
+        The journal mode is stored in the database file so it is set here once, and every pragma
+        is read back because SQLite silently keeps its previous value when a setting is not
+        supported (e.g. WAL on a network file system or mmap on some platforms).
+    :calls
+        get_connection - To retrieves a connection to the database
+        get_connection_profile - Gets the expected pragmas
+    :return: A dictionary of pragma name => value in effect or Error if the profile could not
+             be applied
+    """
+    connection = get_connection(DATABASE)
+    if connection is None:
+        return Error("Could not obtain a connection to the database")
+    try:
+        connection.execute(f"pragma journal_mode={JOURNAL_MODE}")
+        profile = {pragma: connection.execute(f"pragma {pragma}").fetchone()[0]
+                   for pragma in get_connection_profile()}
+    except sqlite3.Error as e:
+        return e
+    finally:
+        connection.close()
+    expected = dict(get_connection_profile(), synchronous=SYNCHRONOUS_LEVELS.get(SYNCHRONOUS, SYNCHRONOUS))
+    for pragma, value in profile.items():
+        if str(value).lower() != str(expected[pragma]):
+            print(f"Database {pragma} is {value} instead of {expected[pragma]}")
+    return profile
+
+
+def get_read_connection(db_file):
+    """
+        This function is used to get a read only connection to the specified database for the
+        queries. The connection can not change the database (PRAGMA query_only), so a query can
+        never take the write lock away from the database writer.
+    :param db_file:
+        type: database file
+        required: true
+        description: The database file
+    :calls
+        get_connection - To retrieves a connection to the database
+    :return: A read only connection to the database.
+    """
+    connection = get_connection(db_file)
+    if connection is not None:
+        connection.execute('pragma query_only=ON')
+    return connection
+
+
+def get_pool():
+    """
+        This function is used to get the pool of read only connections for the current DATABASE.
+        The pool is created the first time it is needed and is recreated if the DATABASE has been
+        changed.
+    :calls
+        get_read_connection - Used by the pool to open new connections
+    :return: The connection pool.
+    """
+    global connection_pool
+    with connection_pool_lock:
+        if connection_pool is None or connection_pool.db_file != DATABASE:
+            if connection_pool is not None:
+                connection_pool.close_all()
+            connection_pool = ConnectionPool(DATABASE, get_read_connection, POOL_SIZE, POOL_HEALTH_CHECK_SECONDS)
+        return connection_pool
+
+
+def get_writer():
+    """
+        This function is used to get the database writer for the current DATABASE, which runs
+        all the commands on a single connection. The writer is created the first time it is
+        needed and is recreated if the DATABASE has been changed or its thread has stopped.
+    :calls
+        get_connection - Used by the writer to open its connection
+        is_busy_error - Used by the writer to find the batches to try again
+    :return: The database writer.
+    """
+    global database_writer
+    with connection_pool_lock:
+        if database_writer is None or database_writer.db_file != DATABASE or not database_writer.is_alive():
+            if database_writer is not None:
+                database_writer.close()
+            database_writer = DatabaseWriter(DATABASE, get_connection, WRITE_BATCH_SIZE, WRITE_RETRIES,
+                                             WRITE_RETRY_BACKOFF_SECONDS, is_busy_error, WRITE_TIMEOUT_SECONDS)
+        return database_writer
+
+
+def get_pool_stats():
+    """
+        This function returns the connection pool statistics
+    :return: A dictionary of the pool hit, miss, health check failure, discarded, overflow
+             and idle counts.
+    """
+    return get_pool().get_stats()
+
+
+def get_writer_stats():
+    """
+        This function returns the database writer statistics
+    :return: A dictionary of the command, batch, largest batch, failed command, retry and
+             queued counts.
+    """
+    return get_writer().get_stats()
+
+
+@atexit.register
+def close_pool():
+    """
+        This function closes all the pooled connections, shuts the database writer down once
+        it has committed the queued commands and closes the slow query log. It is called
+        automatically when the application shuts down.
+    """
+    with connection_pool_lock:
+        if connection_pool is not None:
+            connection_pool.close_all()
+        if database_writer is not None:
+            database_writer.close()
+    slow_query_log.close()
+
+
+def is_busy_error(error):
+    """
+        This function checks whether a command failed because another connection held the
+        database lock for longer than the busy timeout, in which case it can be tried again.
+    :param error:
+        type: sqlite3.Error
+        required: true
+        description: The error raised while executing a statement
+    :return: True if the database was locked otherwise False
+    """
+    return isinstance(error, sqlite3.OperationalError) and \
+        ("database is locked" in str(error) or "database is busy" in str(error))
+
+
+def is_connection_error(error):
+    """
+        This function checks whether an error may have left the connection unusable, in which
+        case the connection is discarded rather than returned to the pool. Constraint violations
+        and arguments that could not be bound leave the connection usable. Other programming
+        errors (e.g. "Cannot operate on a closed database") mean the connection is unusable.
+    :param error:
+        type: sqlite3.Error
+        required: true
+        description: The error raised while executing a statement
+    :return: True if the connection should be discarded otherwise False
+    """
+    if isinstance(error, sqlite3.IntegrityError):
+        return False
+    if isinstance(error, (sqlite3.ProgrammingError, sqlite3.InterfaceError)):
+        return not any(fragment in str(error) for fragment in BIND_ERRORS)
+    return True
+
+
+def get_migration_scripts():
+    """
+        This function finds the versioned migration scripts in the migration scripts directory.
+        Scripts are named "<version>_<description>.sql". The scripts up to and including the
+        baseline version are the one-off initial data load scripts and are never run here.
+    :return: A list of (version, script path) tuples in version order
+    """
+    scripts = []
+    for path in glob.glob(os.path.join(MIGRATION_SCRIPT_DIR, "*.sql")):
+        version = os.path.basename(path).split("_")[0]
+        if version.isdigit() and int(version) > MIGRATION_BASELINE_VERSION:
+            scripts.append((int(version), path))
+    return sorted(scripts)
+
+
+def migrate_database():
+    """
+        This function brings the database schema up to date by running every migration script
+        newer than the schema version recorded in the database (PRAGMA user_version).
+        Each script runs in its own transaction together with the update of the schema
+        version, so a failing script leaves the database at the previous version.
+    :calls
+        get_connection - To retrieves a connection to the database
+        get_migration_scripts - To find the migration scripts
+    :return: The schema version of the database or Error if a migration failed
+    """
+    connection = get_connection(DATABASE)
+    if connection is None:
+        return Error("Could not obtain a connection to the database")
+    try:
+        version = max(connection.execute("PRAGMA user_version").fetchone()[0], MIGRATION_BASELINE_VERSION)
+        for script_version, path in get_migration_scripts():
+            if script_version <= version:
+                continue
+            with open(path, encoding="utf-8") as f:
+                script = f.read()
+            try:
+                connection.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {script_version};\nCOMMIT;")
+            except sqlite3.Error as e:
+                if connection.in_transaction:
+                    connection.rollback()
+                print(f"Migration {os.path.basename(path)} failed: {e}")
+                return e
+            version = script_version
+    finally:
+        connection.close()
+    return version
+
+
+@instrumented("query")
+@slow_query_log.watch("query")
 def execute_query(query, args=None):
     """
         This is a generic function used to run a SQL SELECT against the database.
@@ -49,31 +330,120 @@ def execute_query(query, args=None):
         required: false
         description: The optional arguments for query
     :calls
-        get_connection - To retrieves a connection to the database
+        get_pool - To retrieves a pooled connection to the database
     :return: A list of tuples consisting of query results or Error if
         an error occurred during execution of the statement.
     """
-    connection = get_connection(DATABASE)
-    cursor = connection.cursor()
+    pool = get_pool()
+    connection = pool.acquire()
+    if connection is None:
+        return Error("Could not obtain a connection to the database")
+    discard = False
     try:
+        cursor = connection.cursor()
         if args is None:
             cursor.execute(query)
         else:
             cursor.execute(query, args)
         query_results = cursor.fetchall()
     except sqlite3.Error as e:
+        discard = is_connection_error(e)
         return e
     finally:
-        if connection is not None:
-            connection.close()
+        pool.release(connection, discard)
     return query_results
 
 
+@instrumented("query")
+@slow_query_log.watch("query")
+def stream_query(query, args=None):
+    """
+        This function runs a SQL SELECT against the database like execute_query, but instead of
+        fetching all the results it returns a generator that reads them from the cursor in
+        batches of STREAM_BATCH_SIZE rows, so the rows can be rendered while they are still
+        being read. The query is executed before the function returns, so an error executing it
+        is returned straight away like execute_query does.
+        The pooled connection is held until the generator is exhausted or closed.
+    :param query:
+        type: SQL query
+        required: true
+        description: The query to be executed on the database
+    :param args:
+        type: arguments list
+        required: false
+        description: The optional arguments for query
+    :calls
+        iterate_query - Executes the query and reads its results
+    :return: A generator of the result tuples or Error if an error occurred during execution
+        of the statement.
+    """
+    rows = iterate_query(query, args)
+    error = next(rows)
+    if error is not None:
+        return error
+    return rows
+
+
+def iterate_query(query, args):
+    """
+        This generator executes a query on a pooled connection and yields None (or the Error if
+        the query could not be executed) followed by the result tuples read in batches.
+        The connection is returned to the pool when the generator finishes or is closed. An error
+        while reading the results is raised, as the rows before it may already have been sent.
+    :param query:
+        type: SQL query
+        required: true
+        description: The query to be executed on the database
+    :param args:
+        type: arguments list
+        required: false
+        description: The optional arguments for query
+    :calls
+        get_pool - To retrieves a pooled connection to the database
+    """
+    pool = get_pool()
+    connection = pool.acquire()
+    if connection is None:
+        yield Error("Could not obtain a connection to the database")
+        return
+    discard = False
+    try:
+        cursor = connection.cursor()
+        try:
+            if args is None:
+                cursor.execute(query)
+            else:
+                cursor.execute(query, args)
+        except sqlite3.Error as e:
+            discard = is_connection_error(e)
+            yield e
+            return
+        yield None
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if len(rows) == 0:
+                break
+            yield from rows
+        cursor.close()
+    except sqlite3.Error as e:
+        discard = is_connection_error(e)
+        raise
+    finally:
+        pool.release(connection, discard)
+
+
+@instrumented("command")
+@slow_query_log.watch("command")
 def execute_command(command, args=None):
     """
         This is a generic function used to run a SQL command (e.g. INSERT, UPDATE etc.)
         against the database. The function may be called with arguments or without
         arguments
+        The command is queued for the database writer (see database_writer.py), which commits
+        the commands queued at the same time together and tries a batch again (up to
+        WRITE_RETRIES times, waiting twice as long before each retry) when another process
+        holds the database lock for longer than the busy timeout. The function returns once
+        the command has been committed.
     :param command:
         type: SQL statement
         required: true
@@ -83,25 +453,66 @@ def execute_command(command, args=None):
         required: false
         description: The optional arguments for the command
     :calls
-        get_connection - To retrieves a connection to the database
+        get_writer - To retrieves the database writer
     :return: An Error only if an error occurred during execution
              of the statement.
     """
-    connection = get_connection(DATABASE)
-    cursor = connection.cursor()
-    sql = f"""{command}"""
+    return get_writer().execute(f"""{command}""", args)
+
+
+def execute_many(statements):
+    """
+        This function runs several SQL commands, each once for every arguments list in its list
+        (executemany), in one transaction on the database writer. Either all the rows are
+        committed or, if any of them fails (e.g. a duplicate word), none of them are.
+    :param statements:
+        type: list of tuples
+        required: true
+        description: The (command, list of argument lists) of each command
+    :calls
+        get_writer - To retrieves the database writer
+    :return: An Error only if an error occurred during execution
+             of the statements.
+    """
+    return get_writer().execute_many(statements)
+
+
+def explain_query(query, args=None):
+    """
+        This function gets the query plan of a statement (used by the slow query log). It runs on
+        a pooled connection without going through execute_query, so it is not timed or logged
+        itself.
+    :param query:
+        type: SQL statement
+        required: true
+        description: The statement to explain
+    :param args:
+        type: arguments list
+        required: false
+        description: The optional arguments for the statement
+    :calls
+        get_pool - To retrieves a pooled connection to the database
+    :return: A list of the plan lines, indented by their depth in the plan, or Error if the
+             plan could not be read.
+    """
+    pool = get_pool()
+    connection = pool.acquire()
+    if connection is None:
+        return Error("Could not obtain a connection to the database")
+    discard = False
     try:
-        if args is None:
-            cursor.execute(sql)
-        else:
-            cursor.execute(sql, args)
-        connection.commit()
+        plan = connection.execute(f"EXPLAIN QUERY PLAN {query}", args if args is not None else []).fetchall()
     except sqlite3.Error as e:
+        discard = is_connection_error(e)
         return e
     finally:
-        if connection is not None:
-            connection.close()
-    return
+        pool.release(connection, discard)
+    depths = {0: -1}
+    lines = []
+    for step_id, parent_id, _, detail in plan:
+        depths[step_id] = depths.get(parent_id, -1) + 1
+        lines.append("  " * depths[step_id] + detail)
+    return lines
 
 
 def get_allow_edit(email):
@@ -126,56 +537,160 @@ def get_allow_edit(email):
     return query_results[0][0]
 
 
-def get_category_list():
+def get_generation(name):
     """
-        This function retrieves all tuples of the category table
+        This function gets the generation counter of the cached data identified by name. The
+        counter is incremented by a trigger every time the data changes.
+    :param name:
+        type: string
+        required: true
+        description: The name of the data e.g. "category"
     :calls
         execute_query - Executes a query on the database
-    :return: A list of category table tuples
+    :return: A (database, generation) tuple or None if the generation could not be read
+    """
+    query_results = execute_query("SELECT generation FROM data_generation WHERE name = ?", [name])
+    if issubclass(type(query_results), Error) or len(query_results) == 0:
+        return None
+    return DATABASE, query_results[0][0]
+
+
+def get_data_generations():
+    """
+        This function gets the generation counters and last change times of all the cached data
+        in one query
+    :calls
+        execute_query - Executes a query on the database
+    :return: A dictionary of name => (generation, changed_at) or None if the generations could
+             not be read
+    """
+    query_results = execute_query("SELECT name, generation, changed_at FROM data_generation")
+    if issubclass(type(query_results), Error):
+        return None
+    return {name: (generation, changed_at) for name, generation, changed_at in query_results}
+
+
+def load_category_list():
+    """
+        This function retrieves all tuples of the category table from the database
+    :calls
+        execute_query - Executes a query on the database
+    :return: A list of category table tuples or None in case of an unexpected error
     """
     category_list = execute_query("SELECT * FROM category ORDER BY category_name")
     if issubclass(type(category_list), Error):
+        return None
+    return category_list
+
+
+category_cache = VersionedCache(load_category_list, lambda: get_generation("category"))
+
+
+def get_category_list():
+    """
+        This function retrieves all tuples of the category table. The categories are cached
+        in memory and only loaded from the database again when the category generation
+        changes, i.e. after a category has been added or deleted by any process
+    :calls
+        category_cache.get - Gets the cached categories or loads them using load_category_list
+    :return: A list of category table tuples
+    """
+    category_list = category_cache.get()
+    if category_list is None:
         return []
     return category_list
 
 
-def get_browse_results(letter):
+def get_browse_results(letter, after=None, page_size=PAGE_SIZE, stream=False):
     """
-        This function retrieves all tuples of the dictionary table that has a maori word
-        starting with the letter supplied. It also combines it with last updated
-        user's first and last names if available
+        This function retrieves one page of the tuples of the dictionary table that has a maori
+        word starting with the letter supplied, ignoring case and macrons. It also combines it
+        with last updated user's first and last names if available.
+        The tuples are ordered by the maori search key (ignoring case and macrons) and then the
+        maori and english words, the order of the maori key index. Pages are read with keyset
+        pagination: the next page starts straight after the maori and english words of the last
+        tuple of the previous page, so a deep page costs the same as the first one.
+    :param letter:
+        type: string
+        required: true
+        description: The letter the maori words start with
+    :param after:
+        type: tuple
+        required: false
+        description: The (maori, english) of the last tuple of the previous page, None for the first page
+    :param page_size:
+        type: int
+        required: false
+        description: The number of tuples in a page
+    :param stream:
+        type: boolean
+        required: false
+        description: True to return a generator reading the tuples from the cursor
     :calls
+        get_key_range (in normalization.py module) - Gets the search key range for the letter
+        SelectQuery (in query_builder.py module) - Builds the query
         execute_query - Executes a query on the database
-    :return: A list of tuples or None in case of an unexpected error
+        stream_query - Executes a query on the database, streaming the results
+    :return: A list (or generator) of up to page_size + 1 tuples (the extra tuple only shows that
+             there is a next page) or None in case of an unexpected error
     """
-    query = """SELECT d.id, d.maori, d.english, d.level, d.date_added, ifnull(u.first_name, ''), ifnull(u.last_name, '')
-               FROM dictionary d
-               LEFT JOIN user_details u on d.user_id = u.id
-               WHERE maori LIKE ?
-               ORDER BY maori, english"""
-    query_results = execute_query(query, [f"{letter}%"])
+    query = SelectQuery(WORD_SUMMARY_COLUMNS, WORD_SUMMARY_SOURCE) \
+        .where("d.maori_key >= ? AND d.maori_key < ?", *get_key_range(letter))
+    if after is not None:
+        query.where("(d.maori_key, d.maori, d.english) > (?, ?, ?)", normalize_key(after[0]), *after)
+    sql, args = query.order_by("d.maori_key", "d.maori", "d.english").limit(page_size + 1).build()
+    query_results = stream_query(sql, args) if stream else execute_query(sql, args)
     if issubclass(type(query_results), Error):
         return None
     return query_results
 
 
-def get_search_results(maori, english, level, most_recent):
+def get_full_text_query(phrase):
+    """
+        This function turns the words of a search phrase into an FTS5 query. Every word is
+        quoted (so characters such as '"' or '-' typed by the user have no special meaning)
+        and made a prefix query, and all the words must match.
+        e.g. 'haere ma' => '"haere"* "ma"*'
+    :param phrase:
+        type: string
+        required: true
+        description: The search phrase as entered by the user
+    :return: The FTS5 query or an empty string when the phrase has no words
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", phrase))
+
+
+def get_search_results(maori, english, level, most_recent, phrase="", after=None, page_size=PAGE_SIZE,
+                       stream=False):
     """
         This function provides a feature search functionality.
-        It constructs an SQL SELECT query based on the search criteria passed in
-        to as arguments to this function.
+        It composes an SQL SELECT query from the search criteria passed in as arguments to
+        this function. Each criterion that is entered adds one condition to the WHERE clause,
+        always in the order phrase, maori, english and then level, so each combination of
+        criteria produces one and the same statement.
         Results are always ordered by maori and then english however, if the most_recent = "1"
         then it is first ordered in the descending order of the date_added column and then within
         that they are further ordered in maori and then english.
-        If the most_recent = "1" then the results are also limited to 20 tuples
+        If the most_recent = "1" then the results are also limited to 20 tuples (or page_size if it
+        is smaller) and there is no next page, as the date_added order can not be paged by keyset.
+        When a phrase is given the words are looked up in the dictionary_fts full text index over
+        the maori, english and description columns. The results are then ranked by relevance
+        (BM25, a maori match counting more than an english match which counts more than a
+        description match) instead of maori and english, and each tuple has an extra 8th value
+        with a snippet of the matched text. The matched words in the snippet are wrapped in
+        the characters chr(2) and chr(3). Only the page_size best matches are returned.
+        Other searches return one page of results ordered by the maori search key (ignoring case
+        and macrons) and then maori and english, the order of the maori key and level indexes.
+        They are read with keyset pagination: the next page starts straight after the maori and
+        english words of the last tuple of the previous page.
     :param maori:
         type: string
         required: true (but can be an empty string)
-        description: The maori search phrase ready for a LIKE match. e.g "hei%"
+        description: The start of the maori word e.g "hei". Case and macrons are ignored.
     :param english:
         type: string
         required: true (but can be an empty string)
-        description: The english search phrase ready for a LIKE match. e.g "chick%"
+        description: The start of the english word e.g "chick". Case is ignored.
     :param level:
         type: string
         required: true
@@ -188,264 +703,60 @@ def get_search_results(maori, english, level, most_recent):
         description: Must be =>
                      "0" = Don't use in search
                      "1" = Sort by date_added in descending order and limit to the top 20 tuples
+    :param phrase:
+        type: string
+        required: false
+        description: Words to find anywhere in the maori, english or description of a word
+    :param after:
+        type: tuple
+        required: false
+        description: The (maori, english) of the last tuple of the previous page, None for the
+                     first page. Not used for the most recent or phrase searches.
+    :param page_size:
+        type: int
+        required: false
+        description: The number of tuples in a page
+    :param stream:
+        type: boolean
+        required: false
+        description: True to return a generator reading the tuples from the cursor
     :calls
+        get_full_text_query - Builds the full text query from the phrase
+        get_key_range (in normalization.py module) - Gets the search key ranges for maori and english
+        SelectQuery (in query_builder.py module) - Builds the query
         execute_query - Executes a query on the database
+        stream_query - Executes a query on the database, streaming the results
     :return: A list of tuples consisting of search results, an empty list when nothing is found
-            or Error if an unexpected error occurred during execution of the statement.
-    """
-    query = ""
-    args = []
-    maori_search = f"{maori}%"
-    english_search = f"{english}%"
-    level_search = f"{level}"
-    if (maori != "" or english != "" or level != "0") and most_recent == "1":
-        if maori != "" and english != "" and level == "0":
-            # Scenario 1 : Searching by maori and english and get most_recent
-            query = """SELECT d.id,
-                    d.maori,
-                    d.english,
-                    d.level,
-                    d.date_added,
-                    ifnull(u.first_name, ''),
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                        AND english LIKE ?
-                    ORDER BY date_added DESC, maori, english
-                    LIMIT 20
-                    """
-            args = [maori_search, english_search]
-        if maori != "" and english == "" and level != "0":
-            # Scenario 2 : Searching by maori and level and get most_recent
-            query = """SELECT d.id, 
-                    d.maori,
-                    d.english,
-                    d.level,
-                    d.date_added,
-                    ifnull(u.first_name, ''),
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                        AND level = ?
-                    ORDER BY date_added DESC, maori, english
-                    LIMIT 20
-                    """
-            args = [maori_search, level_search]
-        if maori == "" and english != "" and level != "0":
-            # Scenario 3 : Searching by english and level and get most_recent
-            query = """SELECT d.id,
-                    d.maori, d.english,
-                    d.level,
-                    d.date_added,
-                    ifnull(u.first_name, ''),
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE english LIKE ?
-                        AND level = ?
-                    ORDER BY date_added DESC, maori, english
-                    LIMIT 20
-                    """
-            args = [english_search, level_search]
-        if maori != "" and english == "" and level == "0":
-            # Scenario 4 : Searching by maori and get most_recent
-            query = """SELECT d.id,
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                    ORDER BY date_added DESC, maori, english
-                    LIMIT 20 
-                    """
-            args = [maori_search]
-        if maori == "" and english != "" and level == "0":
-            # Scenario 5 : Searching by english and get most_recent
-            query = """SELECT d.id,
-                    d.maori,
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE english LIKE ?
-                    ORDER BY date_added DESC, maori, english
-                    LIMIT 20
-                    """
-            args = [english_search]
-        if maori == "" and english == "" and level != "0":
-            # Scenario 6 : Searching by level and get most_recent
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level,
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE level = ?
-                    ORDER BY date_added DESC, maori, english
-                    LIMIT 20
-                    """
-            args = [level_search]
-        if maori != "" and english != "" and level != "0":
-            # Scenario 7 : Searching by maori and english and level and get most_recent
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                        AND english LIKE ?
-                        AND level = ?
-                     ORDER BY date_added DESC, maori, english
-                     LIMIT 20
-                     """
-            args = [maori_search, english_search, level_search]
-    elif (maori != "" or english != "" or level != "0") and most_recent == "0":
-        if maori != "" and english != "" and level == "0":
-            # Scenario 8 : Searching by maori and english
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                        AND english LIKE ?
-                    ORDER BY maori, english
-                    """
-            args = [maori_search, english_search]
-        if maori != "" and english == "" and level != "0":
-            # Scenario 9 : Searching by maori and level
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                        AND level = ?
-                    ORDER BY maori, english
-                    """
-            args = [maori_search, level_search]
-        if maori == "" and english != "" and level != "0":
-            # Scenario 10 : Searching by english and level
-            query = """SELECT d.id,
-                    d.maori,
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE english LIKE ? 
-                        AND level = ?
-                    ORDER BY maori, english
-                    """
-            args = [english_search, level_search]
-        if maori != "" and english == "" and level == "0":
-            # Scenario 11 : Searching by maori
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                    ORDER BY maori, english 
-                    """
-            args = [maori_search]
-        if maori == "" and english != "" and level == "0":
-            # Scenario 12 : Searching by english and level
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE english LIKE ?
-                    ORDER BY maori, english
-                    """
-            args = [english_search]
-        if maori == "" and english == "" and level != "0":
-            # Scenario 13 : Searching by level
-            query = """SELECT d.id, 
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE level = ?
-                    ORDER BY maori, english
-                    """
-            args = [level_search]
-        if maori != "" and english != "" and level != "0":
-            # Scenario 14 : Searching by maori and english and level
-            query = """SELECT d.id,
-                    d.maori, 
-                    d.english, 
-                    d.level, 
-                    d.date_added, 
-                    ifnull(u.first_name, ''), 
-                    ifnull(u.last_name, '')
-                    FROM dictionary d
-                    LEFT JOIN user_details u on d.user_id = u.id
-                    WHERE maori LIKE ?
-                        AND english LIKE ? 
-                        AND level = ?
-                    ORDER BY maori, english
-                    """
-            args = [maori_search, english_search, level_search]
-    elif most_recent == "1":
-        # Scenario 15 : Searching just for the most_recent
-        query = """SELECT d.id, 
-                d.maori, 
-                d.english, 
-                d.level, 
-                d.date_added, 
-                ifnull(u.first_name, ''), 
-                ifnull(u.last_name, '')
-                FROM dictionary d
-                LEFT JOIN user_details u on d.user_id = u.id
-                ORDER BY date_added DESC, maori, english
-                LIMIT 20
-                """
-    else:
+            or None if an unexpected error occurred during execution of the statement. A paged
+            search returns up to page_size + 1 tuples, the extra tuple only shows that there is
+            a next page. When streaming, a generator of the tuples is returned instead of a list.
+    """
+    full_text_query = get_full_text_query(phrase)
+    if maori == "" and english == "" and level == "0" and full_text_query == "" and most_recent != "1":
         return []
-    if len(args) == 0:
-        query_results = execute_query(query)
+    if full_text_query == "":
+        query = SelectQuery(WORD_SUMMARY_COLUMNS, WORD_SUMMARY_SOURCE)
+        order = ["d.maori", "d.english"]
     else:
-        query_results = execute_query(query, args)
+        query = SelectQuery(f"{WORD_SUMMARY_COLUMNS}, {FULL_TEXT_SNIPPET_COLUMN}", FULL_TEXT_SOURCE)
+        query.where("dictionary_fts MATCH ?", full_text_query)
+        order = [FULL_TEXT_RANK, "d.maori", "d.english"]
+    if maori != "":
+        query.where("d.maori_key >= ? AND d.maori_key < ?", *get_key_range(maori))
+    if english != "":
+        query.where("d.english_key >= ? AND d.english_key < ?", *get_key_range(english))
+    if level != "0":
+        query.where("d.level = ?", f"{level}")
+    if most_recent == "1":
+        query.order_by("d.date_added DESC", *order).limit(min(MOST_RECENT_LIMIT, page_size))
+    elif full_text_query != "":
+        query.order_by(*order).limit(page_size)
+    else:
+        if after is not None:
+            query.where("(d.maori_key, d.maori, d.english) > (?, ?, ?)", normalize_key(after[0]), *after)
+        query.order_by("d.maori_key", *order).limit(page_size + 1)
+    sql, args = query.build()
+    query_results = stream_query(sql, args) if stream else execute_query(sql, args)
     if issubclass(type(query_results), Error):
         return None
     return query_results
@@ -472,6 +783,7 @@ def get_word(word_id):
                , d.date_added
                , ifnull(u.first_name, '')
                , ifnull(u.last_name, '')
+               , d.category_id
                FROM dictionary d
                LEFT JOIN user_details u on d.user_id = u.id
                WHERE d.id = ?"""
@@ -481,34 +793,128 @@ def get_word(word_id):
     return query_results
 
 
-def get_words(category_id):
+def get_words_by_ids(word_ids):
+    """
+        This function gets the details of many words in one query, supplemented with the last
+        updated user details like get_word. The ids are bound as one JSON array argument, so the
+        statement is the same whatever the number of ids.
+    :param word_ids:
+        type: list of ints
+        required: true
+        description: The ids of the words
+    :calls
+        execute_query - Executes a query on the database
+    :return: A list of tuples (in id order) for the words found or None if an unexpected error
+            occurred during execution of the statement.
+    """
+    query = """SELECT d.id
+               , d.maori
+               , d.english
+               , d.description
+               , d.level
+               , d.date_added
+               , ifnull(u.first_name, '')
+               , ifnull(u.last_name, '')
+               , d.category_id
+               FROM dictionary d
+               LEFT JOIN user_details u on d.user_id = u.id
+               WHERE d.id IN (SELECT value FROM json_each(?))
+               ORDER BY d.id"""
+    query_results = execute_query(query, [json.dumps(list(word_ids))])
+    if issubclass(type(query_results), Error):
+        return None
+    return query_results
+
+
+def get_words(category_id, after=None, page_size=PAGE_SIZE, stream=False):
     """
-        This function gets the words details from the database for the supplied category id
-        ordered in the maori and then english order
+        This function gets one page of the words details from the database for the supplied
+        category id ordered in the maori and then english order.
+        Pages are read with keyset pagination: the next page starts straight after the maori and
+        english words of the last word of the previous page. The category is always returned
+        (with None for the word details) even when there are no more words.
     :param category_id:
         type: int
         required: true
         description: The id of the category
+    :param after:
+        type: tuple
+        required: false
+        description: The (maori, english) of the last word of the previous page, None for the first page
+    :param page_size:
+        type: int
+        required: false
+        description: The number of words in a page
+    :param stream:
+        type: boolean
+        required: false
+        description: True to return a generator reading the tuples from the cursor. The generator
+                     yields nothing when the category is not found.
     :calls
         execute_query - Executes a query on the database
-    :return: A list of tuples consisting of the query results or None when nothing is found
-            or if an unexpected error occurred during execution of the statement.
+        stream_query - Executes a query on the database, streaming the results
+    :return: A list (or generator) of up to page_size + 1 tuples (the extra tuple only shows that
+            there is a next page) consisting of the query results or None when the category is
+            not found or if an unexpected error occurred during execution of the statement.
     """
-    query = """SELECT c.category_name, d.maori, d.english, d.id, c.id
-               FROM category c
-               LEFT JOIN dictionary d on c.id = d.category_id
-               WHERE c.id = ?
-               ORDER BY maori, english"""
-    query_results = execute_query(query, [category_id])
-    if issubclass(type(query_results), Error) or len(query_results) == 0:
+    if after is None:
+        query = """SELECT c.category_name, d.maori, d.english, d.id, c.id
+                   FROM category c
+                   LEFT JOIN dictionary d on c.id = d.category_id
+                   WHERE c.id = ?
+                   ORDER BY d.maori, d.english
+                   LIMIT ?"""
+        args = [category_id, page_size + 1]
+    else:
+        query = """SELECT c.category_name, d.maori, d.english, d.id, c.id
+                   FROM category c
+                   LEFT JOIN dictionary d on c.id = d.category_id AND (d.maori, d.english) > (?, ?)
+                   WHERE c.id = ?
+                   ORDER BY d.maori, d.english
+                   LIMIT ?"""
+        args = [after[0], after[1], category_id, page_size + 1]
+    query_results = stream_query(query, args) if stream else execute_query(query, args)
+    if issubclass(type(query_results), Error):
+        return None
+    if not stream and len(query_results) == 0:
+        return None
+    return query_results
+
+
+def get_changes(since, limit=CHANGE_PAGE_SIZE):
+    """
+        This function gets the changes recorded in the change log after the supplied sequence
+        number, in sequence order. Only the latest change of each word or category is kept in
+        the change log.
+    :param since:
+        type: int
+        required: true
+        description: The sequence number of the last change the client has already seen
+    :param limit:
+        type: int
+        required: false
+        description: The maximum number of changes returned
+    :calls
+        execute_query - Executes a query on the database
+    :return: A list of (seq, entity, entity_id, operation, changed_at) tuples where entity is
+            'word' or 'category' and operation is 'upsert' or 'delete', or None if an unexpected
+            error occurred during execution of the statement.
+    """
+    query = """SELECT seq, entity, entity_id, operation, changed_at
+               FROM change_log
+               WHERE seq > ?
+               ORDER BY seq
+               LIMIT ?"""
+    query_results = execute_query(query, [since, limit])
+    if issubclass(type(query_results), Error):
         return None
     return query_results
 
 
 def get_user_details(email):
     """
-        This function gets the username and type details from the database corresponding
-        to the email address supplied
+        This function gets the username, type details and whether the user is allowed to edit
+        dictionary entries from the database corresponding to the email address supplied
     :param email:
         type: string
         required: true
@@ -518,7 +924,7 @@ def get_user_details(email):
     :return: A list containing one tuple from query results or None when nothing is found
             or if an unexpected error occurred during execution of the statement.
     """
-    query = """SELECT ud.first_name, ud.last_name, ud.password, ut.user_type 
+    query = """SELECT ud.first_name, ud.last_name, ud.password, ut.user_type, ut.allow_edit
                FROM user_details ud
                JOIN user_type ut on ud.user_type_id = ut.id 
                WHERE ud.email = ?"""
@@ -532,7 +938,8 @@ def add_word(maori, english, description, level, category_id, email):
     """
         This function inserts a new word to the dictionary table.
         The user id of the user adding the word is also retrieved based on the email
-        supplied and is included in the dictionary record
+        supplied and is included in the dictionary record together with the normalized
+        search keys of the maori and english words
     :param maori:
         type: string
         required: true
@@ -561,18 +968,103 @@ def add_word(maori, english, description, level, category_id, email):
         execute_command - Executes a command on the database
     :return: Returns True of False indicating the success of the insert
     """
-    command = """INSERT INTO dictionary (maori, english, description, level, category_id, date_added, user_id)
-                 VALUES (?, ?, ?, ?, ?, date(), (SELECT id FROM user_details WHERE email = ?))"""
-    args = [maori, english, description, level, category_id, email]
+    command = """INSERT INTO dictionary (maori, english, description, level, category_id, date_added, user_id,
+                                         maori_key, english_key)
+                 VALUES (?, ?, ?, ?, ?, date(), (SELECT id FROM user_details WHERE email = ?), ?, ?)"""
+    args = [maori, english, description, level, category_id, email, normalize_key(maori), normalize_key(english)]
     response = execute_command(command, args)
     if issubclass(type(response), Error):
         return False
     return True
 
 
+def get_existing_words(words):
+    """
+        This function looks up which of a list of words are already in the dictionary, using the
+        unique (maori, english) index. The words are looked up EXISTING_WORDS_CHUNK_SIZE at a time.
+    :param words:
+        type: list of tuples
+        required: true
+        description: The (maori, english) of each word
+    :calls
+        execute_query - Executes a query on the database
+    :return: A dictionary of (maori, english) => (word id, category id, category name, description,
+             level) of the words found or None if an error occurred
+    """
+    existing = {}
+    for start in range(0, len(words), EXISTING_WORDS_CHUNK_SIZE):
+        chunk = words[start:start + EXISTING_WORDS_CHUNK_SIZE]
+        # CROSS JOIN keeps the listed words as the outer loop, so each is looked up by the unique index
+        query = f"""WITH listed_words(maori, english) AS (VALUES {", ".join(["(?, ?)"] * len(chunk))})
+                    SELECT d.maori, d.english, d.id, d.category_id, c.category_name, d.description, d.level
+                    FROM listed_words
+                    CROSS JOIN dictionary d ON d.maori = listed_words.maori AND d.english = listed_words.english
+                    JOIN category c on c.id = d.category_id"""
+        args = [value for word in chunk for value in word]
+        query_results = execute_query(query, args)
+        if issubclass(type(query_results), Error):
+            return None
+        for maori, english, word_id, category_id, category_name, description, level in query_results:
+            existing[(maori, english)] = (word_id, category_id, category_name, description, level)
+    return existing
+
+
+def add_words(words, category_id, email, updates=()):
+    """
+        This function inserts many new words into a category and updates the description and
+        level of many existing words in one transaction, with an executemany for each, so a
+        long list of words is saved with one commit. Nothing is saved if any word fails (e.g. a
+        word added by someone else since the words were checked).
+    :param words:
+        type: list of tuples
+        required: true
+        description: The (maori, english, description, level) of each new word
+    :param category_id:
+        type: int
+        required: true
+        description: The category id of the category the words belong to
+    :param email:
+        type: string
+        required: true
+        description: The email address of the user adding the words
+    :param updates:
+        type: list of tuples
+        required: false
+        description: The (word id, description, level) of each existing word to update
+    :calls
+        execute_many - Executes the commands on the database
+    :return: Returns True of False indicating the success of the insert
+    """
+    insert_command = """INSERT INTO dictionary (maori, english, description, level, category_id, date_added, user_id,
+                                                maori_key, english_key)
+                        VALUES (?, ?, ?, ?, ?, date(), (SELECT id FROM user_details WHERE email = ?), ?, ?)"""
+    update_command = """UPDATE dictionary
+                        SET description = ?,
+                            level = ?,
+                            user_id = (SELECT id FROM user_details WHERE email = ?),
+                            date_added = date()
+                        WHERE id = ?
+                        AND (description IS NOT ? OR level IS NOT ?)"""
+    statements = []
+    if len(words) > 0:
+        statements.append((insert_command, [[maori, english, description, level, category_id, email,
+                                             normalize_key(maori), normalize_key(english)]
+                                            for maori, english, description, level in words]))
+    if len(updates) > 0:
+        statements.append((update_command, [[description, level, email, word_id, description, level]
+                                            for word_id, description, level in updates]))
+    if len(statements) == 0:
+        return True
+    response = execute_many(statements)
+    if issubclass(type(response), Error):
+        return False
+    return True
+
+
 def add_category(category_name):
     """
-        This function inserts a new category to the category table
+        This function inserts a new category to the category table and invalidates
+        the cached categories
     :param category_name:
         type: string
         required: true
@@ -584,6 +1076,7 @@ def add_category(category_name):
     response = execute_command("INSERT INTO category (category_name) VALUES (?)", [category_name])
     if issubclass(type(response), Error):
         return False
+    category_cache.invalidate()
     return True
 
 
@@ -626,12 +1119,34 @@ def add_user(first_name, last_name, email, hashed_password, user_type):
     return True
 
 
+def update_password(email, hashed_password):
+    """
+        This function updates the hashed password of the user identified by the email address
+    :param email:
+        type: string
+        required: true
+        description: The email address of the user
+    :param hashed_password:
+        type: string
+        required: true
+        description: The hashed_password of the user
+    :calls
+        execute_command - Executes a command on the database
+    :return: Returns True of False indicating the success of the update
+    """
+    response = execute_command("UPDATE user_details SET password = ? WHERE email = ?", [hashed_password, email])
+    if issubclass(type(response), Error):
+        return False
+    return True
+
+
 def update_word(maori, english, description, level, email, word_id):
     """
         This function updates the word in the dictionary table identified by the word_id.
         The user id of the user adding the word is also retrieved based on the email
         supplied and is updated in the dictionary record.
-        The date_added column will also be updated with the current date
+        The date_added column will also be updated with the current date and the normalized
+        search keys of the maori and english words are updated too
         The statement also checked if any data supplied is actually changing, if so only
         the record is updated
     :param maori:
@@ -668,7 +1183,9 @@ def update_word(maori, english, description, level, email, word_id):
                 description = ?,
                 level = ?,
                 user_id = (SELECT id FROM user_details WHERE email = ?),
-                date_added = date()
+                date_added = date(),
+                maori_key = ?,
+                english_key = ?
              WHERE id = ?
              AND (
                     maori <> ? OR
@@ -676,7 +1193,8 @@ def update_word(maori, english, description, level, email, word_id):
                     description <> ? OR
                     level <> ?
                  )"""
-    args = [maori, english, description, level, email, word_id, maori, english, description, level]
+    args = [maori, english, description, level, email, normalize_key(maori), normalize_key(english), word_id,
+            maori, english, description, level]
     response = execute_command(command, args)
     if issubclass(type(response), Error):
         return False
@@ -686,7 +1204,7 @@ def update_word(maori, english, description, level, email, word_id):
 def delete_category(category_id):
     """
         This function deletes the category record from category table identified by
-        the category id supplied
+        the category id supplied and invalidates the cached categories
     :param category_id:
         type: int
         required: true
@@ -698,6 +1216,7 @@ def delete_category(category_id):
     response = execute_command("DELETE FROM category WHERE id = ?", [category_id])
     if issubclass(type(response), Error):
         return False
+    category_cache.invalidate()
     return True
 
 
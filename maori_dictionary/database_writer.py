@@ -0,0 +1,312 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : database_writer.py
+# Program description   : This module provides the single database writer used by the data access
+#                         module to run all the commands (INSERT, UPDATE and DELETE statements).
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import queue
+import sqlite3
+import threading
+import time
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+WAIT_SLICE_SECONDS = 1  # How often a waiting request thread checks that the writer thread is running
+
+
+class WriteJob:
+    """
+        The commands waiting in the write queue together with their result. The commands of a
+        job are run in one savepoint, so they succeed or fail together.
+    """
+
+    def __init__(self, statements):
+        """
+            Creates a job for a list of commands.
+        :param statements:
+            type: list of tuples
+            required: true
+            description: The (command, args, many) of each command, where many is True to run the
+                         command once for each arguments list in args (executemany)
+        """
+        self.statements = statements
+        self.result = None
+        self.done = threading.Event()
+
+
+class DatabaseWriter:
+    """
+        Runs every command on one connection owned by a writer thread, so the commands never
+        contend with each other for the database lock and the readers (with WAL) are never held
+        up by them.
+
+        Commands are queued by the request threads, which wait for their command to be committed.
+        The writer takes all the commands queued (up to "batch_size") and commits them in one
+        transaction, each in its own savepoint so a command that fails (e.g. a duplicate word)
+        is rolled back on its own without failing the others in the batch.
+    """
+
+    def __init__(self, db_file, connect, batch_size, retries, backoff_seconds, is_busy_error, timeout_seconds):
+        """
+            Creates the writer and starts its thread. The connection is opened by the thread.
+        :param db_file:
+            type: string
+            required: true
+            description: The database file the commands are run against
+        :param connect:
+            type: function
+            required: true
+            description: A function taking the database file and returning a new connection or None
+        :param batch_size:
+            type: int
+            required: true
+            description: The maximum number of commands committed in one transaction
+        :param retries:
+            type: int
+            required: true
+            description: The number of times a batch is tried again when the database is locked
+        :param backoff_seconds:
+            type: float
+            required: true
+            description: The wait before the first retry, doubled before each further retry
+        :param is_busy_error:
+            type: function
+            required: true
+            description: A function taking an sqlite3.Error and returning True if the database was locked
+        :param timeout_seconds:
+            type: float
+            required: true
+            description: The longest a request thread waits for its command to be committed
+        """
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self._connect = connect
+        self._is_busy_error = is_busy_error
+        self._connection = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"commands": 0, "batches": 0, "largest_batch": 0, "failed_commands": 0, "retries": 0}
+        self._thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+        self._thread.start()
+
+    def execute(self, command, args=None):
+        """
+            Queues a command and waits until it has been committed.
+        :param command:
+            type: SQL statement
+            required: true
+            description: The sql statement to be executed on the database
+        :param args:
+            type: arguments list
+            required: false
+            description: The optional arguments for the command
+        :return: An Error only if an error occurred during execution of the statement.
+        """
+        return self._submit(WriteJob([(command, args, False)]))
+
+    def execute_many(self, statements):
+        """
+            Queues a list of commands, each run for a list of argument lists (e.g. to insert many
+            words with one executemany), and waits until they have been committed together.
+            If any row fails (e.g. a duplicate word) none of them are committed.
+        :param statements:
+            type: list of tuples
+            required: true
+            description: The (command, list of argument lists) of each command
+        :return: An Error only if an error occurred during execution of the statements.
+        """
+        return self._submit(WriteJob([(command, args_list, True) for command, args_list in statements]))
+
+    def _submit(self, job):
+        """
+            Queues a job and waits until it has been committed. The wait ends with an Error if the
+            writer thread has stopped or the job is not done within timeout_seconds (the job may
+            then still be committed later).
+        :param job:
+            type: WriteJob
+            required: true
+            description: The job
+        :return: The result of the job, None or the Error
+        """
+        with self._lock:
+            if self._closed or not self.is_alive():
+                return sqlite3.Error("The database writer has been shut down")
+            self._queue.put(job)
+        deadline = time.monotonic() + self.timeout_seconds
+        while not job.done.wait(min(WAIT_SLICE_SECONDS, max(deadline - time.monotonic(), 0))):
+            if not self.is_alive():
+                return sqlite3.Error("The database writer has stopped")
+            if time.monotonic() >= deadline:
+                return sqlite3.Error("The database writer did not answer in time")
+        return job.result
+
+    def is_alive(self):
+        """
+            Checks whether the writer thread is still running.
+        :return: True if the writer thread is running otherwise False
+        """
+        return self._thread.is_alive()
+
+    def close(self):
+        """
+            Shuts the writer down once the commands already queued have been committed.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def get_stats(self):
+        """
+            Gets the writer statistics.
+        :return: A dictionary with the command, batch, largest batch, failed command and retry
+                 counts together with the number of commands waiting in the queue.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _run(self):
+        """
+            The writer thread. Takes the queued commands in batches and commits them until the
+            writer is shut down.
+        """
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+            if len(batch) > 0:
+                try:
+                    self._commit(batch)
+                except Exception as e:  # The thread must keep running, or every later command would wait in vain
+                    self._fail(batch, sqlite3.Error(f"The database writer failed: {e!r}"))
+        if self._connection is not None:
+            self._connection.close()
+
+    def _commit(self, batch):
+        """
+            Runs a batch of commands in one transaction and hands each command its result.
+            The batch is tried again when the database is locked by another process. An unexpected
+            exception (not an sqlite3.Error) fails the batch like any error.
+        :param batch:
+            type: list of WriteJob
+            required: true
+            description: The commands to run
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if self._connection is None:
+                    self._connection = self._connect(self.db_file)
+                    if self._connection is None:
+                        raise sqlite3.Error("Could not obtain a connection to the database")
+                results = self._execute(batch)
+                self._connection.commit()
+                break
+            except Exception as e:
+                self._reset()
+                if not isinstance(e, sqlite3.Error):
+                    e = sqlite3.Error(f"The database writer failed: {e!r}")
+                if not self._is_busy_error(e) or attempt == self.retries:
+                    results = [e] * len(batch)
+                    break
+                with self._lock:
+                    self._stats["retries"] += 1
+            time.sleep(self.backoff_seconds * 2 ** attempt)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["commands"] += len(batch)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            self._stats["failed_commands"] += sum(1 for result in results if result is not None)
+        for job, result in zip(batch, results):
+            job.result = result
+            job.done.set()
+
+    def _fail(self, batch, error):
+        """
+            Hands every job of a batch that is not done yet the error, after the connection has
+            been reset.
+        :param batch:
+            type: list of WriteJob
+            required: true
+            description: The jobs
+        :param error:
+            type: sqlite3.Error
+            required: true
+            description: The error
+        """
+        try:
+            self._reset()
+        finally:
+            for job in batch:
+                if not job.done.is_set():
+                    job.result = error
+                    job.done.set()
+
+    def _execute(self, batch):
+        """
+            Runs the commands of each job of a batch in its own savepoint of one write transaction.
+            A job that fails is rolled back to its savepoint and its error is its result, except
+            a locked database, which fails the whole batch so it can be tried again.
+        :param batch:
+            type: list of WriteJob
+            required: true
+            description: The jobs to run
+        :return: The result of each job, None or the Error
+        """
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        results = []
+        for job in batch:
+            connection.execute("SAVEPOINT command")
+            try:
+                for command, args, many in job.statements:
+                    if many:
+                        connection.executemany(command, args)
+                    elif args is None:
+                        connection.execute(command)
+                    else:
+                        connection.execute(command, args)
+                results.append(None)
+            except Exception as e:
+                if isinstance(e, sqlite3.Error) and self._is_busy_error(e):
+                    raise
+                connection.execute("ROLLBACK TO command")
+                results.append(e if isinstance(e, sqlite3.Error) else sqlite3.Error(f"The command failed: {e!r}"))
+            connection.execute("RELEASE command")
+        return results
+
+    def _reset(self):
+        """
+            Rolls back the failed transaction. The connection is closed (and reopened for the next
+            batch) if it can not be rolled back.
+        """
+        if self._connection is None:
+            return
+        try:
+            if self._connection.in_transaction:
+                self._connection.rollback()
+        except Exception:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
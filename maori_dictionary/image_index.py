@@ -0,0 +1,119 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : image_index.py
+# Program description   : This module keeps an in memory index of the word images in the images directory.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from normalization import normalize_key
+import os
+import threading
+
+
+class ImageIndex:
+    """
+        Maps the normalized English word of each image file (the file name without its extension)
+        to the image file name. The directory is listed once when the index is created and again
+        only when the modification time of the directory changes, i.e. when an image is added,
+        removed or renamed. The modification time and size of each image are kept with it, so the
+        resized copies of an image that has been replaced can be found without another stat.
+    """
+
+    def __init__(self, directory):
+        """
+            Creates the index and lists the directory.
+        :param directory:
+            type: string
+            required: true
+            description: The path of the images directory
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._filenames = {}
+        self._stamps = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+            Lists the images directory again if its modification time has changed since it was
+            last listed. When more than one file has the same word the first in alphabetical
+            order is used.
+        """
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            filenames = {}
+            stamps = {}
+            if mtime is not None:
+                with os.scandir(self.directory) as entries:
+                    for entry in sorted(entries, key=lambda e: e.name):
+                        if entry.is_file():
+                            filenames.setdefault(normalize_key(os.path.splitext(entry.name)[0]), entry.name)
+                            stat = entry.stat()
+                            stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+            self._filenames = filenames
+            self._stamps = stamps
+            self._mtime = mtime
+
+    def get(self, english_word, default=None):
+        """
+            Gets the image file name for an English word.
+        :param english_word:
+            type: string
+            required: true
+            description: The English word to find the image file for
+        :param default:
+            type: string
+            required: false
+            description: The value returned when there is no image for the word
+        :return: The image file name or the default if there is no image for the word
+        """
+        self.refresh()
+        return self._filenames.get(normalize_key(english_word), default)
+
+    def get_many(self, english_words, default=None):
+        """
+            Gets the image file names for the English words of a page, checking the directory for
+            changes only once for the whole page. The words may be a generator (e.g. reading the
+            words of a streamed page from the database); each is looked up as it is read.
+        :param english_words:
+            type: iterable of strings
+            required: true
+            description: The English words to find the image files for
+        :param default:
+            type: string
+            required: false
+            description: The value used for a word that has no image
+        :return: A generator of the image file names in the same order as the words
+        """
+        self.refresh()
+        filenames = self._filenames
+        return (filenames.get(normalize_key(english_word), default) for english_word in english_words)
+
+    def get_stamp(self, filename):
+        """
+            Gets the modification time and size of an image as they were when the directory was
+            last listed.
+        :param filename:
+            type: string
+            required: true
+            description: The image file name
+        :return: A (modification time in nanoseconds, size) tuple or None if there is no such image
+        """
+        return self._stamps.get(filename)
+
+    def get_stamps(self):
+        """
+            Gets the modification time and size of every image.
+        :return: A dictionary of image file name => (modification time in nanoseconds, size)
+        """
+        self.refresh()
+        return dict(self._stamps)
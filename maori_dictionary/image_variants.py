@@ -0,0 +1,210 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : image_variants.py
+# Program description   : This module creates and caches the resized copies (thumbnail and medium)
+#                         of the word images shown on the pages.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps, features  # Optional, the original images are shown without Pillow
+except ImportError:
+    Image = None
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+VARIANT_SIZES = {"thumb": 180, "medium": 800}  # The longest side in pixels (twice the size shown)
+FORMAT_QUALITY = {"webp": 80, "avif": 60}
+HASH_LENGTH = 12
+
+
+class ImageVariants:
+    """
+        Creates a resized copy of an image for each variant (e.g. the thumbnails of the category
+        page) in a modern format (WebP or AVIF). The copies are saved in the derived directory with
+        the hash of the original image and the resize settings in their names, e.g.
+        apple.thumb.1a2b3c4d5e6f.webp, so a changed image gets a new name and the copies can be
+        cached by the browsers for as long as they like.
+        The copies are made by background worker threads, all of them when the application starts
+        (see warm) and any other when it is first asked for, and the original image is used until
+        its copy is ready, so a page never waits for an image to be resized.
+        The original image is used when Pillow (or its support for the format) is not installed
+        or the image can not be read.
+    """
+
+    def __init__(self, directory, derived_directory, image_format, threads):
+        """
+            Creates the image variants. The worker threads are started when they are first needed.
+        :param directory:
+            type: string
+            required: true
+            description: The path of the images directory
+        :param derived_directory:
+            type: string
+            required: true
+            description: The path of the directory the resized copies are saved in, which must be
+                         a subdirectory of the images directory
+        :param image_format:
+            type: string
+            required: true
+            description: The format of the copies, "webp" or "avif"
+        :param threads:
+            type: int
+            required: true
+            description: The number of worker threads resizing the images
+        """
+        self.directory = directory
+        self.derived_directory = derived_directory
+        self.image_format = image_format if Image is not None and image_format in FORMAT_QUALITY and \
+            features.check(image_format) else None
+        self.threads = threads
+        self._prefix = os.path.relpath(derived_directory, directory).replace(os.sep, "/")
+        self._variants = {}
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def get(self, filename, variant, stamp):
+        """
+            Gets the file name of a variant of an image. When the variant has not been made yet (or
+            the image has changed since) it is queued to be made.
+        :param filename:
+            type: string
+            required: true
+            description: The file name of the image in the images directory
+        :param variant:
+            type: string
+            required: true
+            description: The variant, a key of VARIANT_SIZES
+        :param stamp:
+            type: tuple
+            required: true
+            description: The (modification time, size) of the image from the image index, None
+                         if the image is not in the index
+        :return: The file name of the variant relative to the images directory, the file name of
+                 the original image if no variant can be made or None while the variant is being made
+        """
+        if self.image_format is None or variant not in VARIANT_SIZES or stamp is None:
+            return filename
+        cached = self._variants.get((filename, variant))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        self._submit(filename, variant, stamp)
+        return None
+
+    def warm(self, stamps):
+        """
+            Queues every variant of the images to be made (or found, if an earlier run saved them).
+        :param stamps:
+            type: dictionary
+            required: true
+            description: The image file name => (modification time, size) of each image
+        """
+        if self.image_format is None:
+            return
+        for filename, stamp in stamps.items():
+            for variant in VARIANT_SIZES:
+                self._submit(filename, variant, stamp)
+
+    def _submit(self, filename, variant, stamp):
+        """
+            Queues a variant to be made unless it is already queued.
+        :param filename:
+            type: string
+            required: true
+            description: The file name of the image
+        :param variant:
+            type: string
+            required: true
+            description: The variant
+        :param stamp:
+            type: tuple
+            required: true
+            description: The (modification time, size) of the image
+        """
+        with self._lock:
+            if (filename, variant, stamp) in self._pending:
+                return
+            self._pending.add((filename, variant, stamp))
+            if len(self._workers) < self.threads:
+                worker = threading.Thread(target=self._work, name="image-variants", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        self._queue.put((filename, variant, stamp))
+
+    def _work(self):
+        """
+            A worker thread. Makes the queued variants one at a time.
+        """
+        while True:
+            filename, variant, stamp = self._queue.get()
+            try:
+                variant_filename = self._create(filename, os.path.join(self.directory, filename), variant)
+            except Exception as e:  # The worker must keep running for the other images
+                print(f"Could not create the {variant} image of {filename}: {e!r}")
+                variant_filename = filename
+            with self._lock:
+                cached = self._variants.get((filename, variant))
+                if cached is None or cached[0][0] <= stamp[0]:  # Unless a newer image was made meanwhile
+                    self._variants[(filename, variant)] = (stamp, variant_filename)
+                self._pending.discard((filename, variant, stamp))
+
+    def _create(self, filename, path, variant):
+        """
+            Creates a variant of an image unless it was already saved (e.g. by an earlier run or
+            another application process). The file is written under a temporary name and then
+            renamed, so a half written file is never served.
+        :param filename:
+            type: string
+            required: true
+            description: The file name of the image
+        :param path:
+            type: string
+            required: true
+            description: The path of the image
+        :param variant:
+            type: string
+            required: true
+            description: The variant
+        :return: The file name of the variant relative to the images directory or the file name
+                 of the original image if it can not be read
+        """
+        size = VARIANT_SIZES[variant]
+        quality = FORMAT_QUALITY[self.image_format]
+        try:
+            with open(path, "rb") as f:
+                content_hash = hashlib.sha256(f.read())
+            content_hash.update(f"{size}:{self.image_format}:{quality}".encode("ascii"))
+            name = f"{os.path.splitext(filename)[0]}.{variant}.{content_hash.hexdigest()[:HASH_LENGTH]}." \
+                   f"{self.image_format}"
+            variant_path = os.path.join(self.derived_directory, name)
+            if not os.path.exists(variant_path):
+                os.makedirs(self.derived_directory, exist_ok=True)
+                with Image.open(path) as image:
+                    resized = ImageOps.exif_transpose(image)
+                    resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+                    if resized.mode not in ("RGB", "RGBA"):
+                        resized = resized.convert("RGBA" if "A" in resized.getbands() or
+                                                  "transparency" in resized.info else "RGB")
+                    descriptor, temporary_path = tempfile.mkstemp(dir=self.derived_directory, suffix=".tmp")
+                    try:
+                        with os.fdopen(descriptor, "wb") as f:
+                            resized.save(f, self.image_format.upper(), quality=quality)
+                        os.replace(temporary_path, variant_path)
+                    except BaseException:
+                        os.remove(temporary_path)
+                        raise
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"Could not create the {variant} image of {filename}: {e}")
+            return filename
+        return f"{self._prefix}/{name}"
@@ -0,0 +1,447 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : instrumentation.py
+# Program description   : This module records where the time of each request goes (the database
+#                         statements, the templates and the service helpers) when the
+#                         instrumentation is turned on.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+import types
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+ENABLED = os.environ.get("DICTIONARY_INSTRUMENTATION", "0") == "1"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WHITESPACE = re.compile(r"\s+")
+
+
+current_profile = contextvars.ContextVar("current_profile", default=None)  # The profile of the request
+
+
+class RequestProfile:
+    """
+        Records the database statements and the timings (e.g. rendering the template) of a request.
+        The async routes run their database calls on several threads at the same time, so the
+        records are added under a lock.
+    """
+
+    def __init__(self):
+        """
+            Creates the profile and starts the request's clock.
+        """
+        self.started_at = time.perf_counter()
+        self.statements = []
+        self.timings = {}
+        self.template_starts = []
+        self._lock = threading.Lock()
+
+    def add_statement(self, kind, sql, bind_count, rows, seconds, failed):
+        """
+            Records a database statement.
+        :param kind:
+            type: string
+            required: true
+            description: "query" or "command"
+        :param sql:
+            type: string
+            required: true
+            description: The SQL text
+        :param bind_count:
+            type: int
+            required: true
+            description: The number of bound arguments
+        :param rows:
+            type: int
+            required: true
+            description: The number of rows returned, None for a command
+        :param seconds:
+            type: float
+            required: true
+            description: The time the statement took
+        :param failed:
+            type: boolean
+            required: true
+            description: True if the statement returned an error
+        """
+        with self._lock:
+            self.statements.append((kind, sql, bind_count, rows, seconds, failed))
+
+    def add_timing(self, name, seconds):
+        """
+            Adds the time of a timed step (e.g. "template") to its total.
+        :param name:
+            type: string
+            required: true
+            description: The name of the step
+        :param seconds:
+            type: float
+            required: true
+            description: The time the step took
+        """
+        with self._lock:
+            count, total = self.timings.get(name, (0, 0.0))
+            self.timings[name] = (count + 1, total + seconds)
+
+    def get_database_seconds(self):
+        """
+            Gets the total time of the database statements.
+        :return: The time in seconds
+        """
+        with self._lock:
+            return sum(statement[4] for statement in self.statements)
+
+    def get_server_timing(self):
+        """
+            Creates the Server-Timing header of the request, which the browsers' developer tools
+            show with the request, e.g. db;dur=3.21;desc="4 statements", template;dur=1.05, ...
+        :return: The header value
+        """
+        with self._lock:
+            statements = list(self.statements)
+            timings = sorted(self.timings.items())
+        metrics = [f'db;dur={sum(statement[4] for statement in statements) * 1000:.2f};'
+                   f'desc="{len(statements)} statements"']
+        for name, (count, seconds) in timings:
+            metrics.append(f'{name};dur={seconds * 1000:.2f};desc="{count} calls"')
+        metrics.append(f"total;dur={(time.perf_counter() - self.started_at) * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def get_log_line(self, route, method, path, status, seconds):
+        """
+            Creates the structured (JSON) log line of the request.
+        :param route:
+            type: string
+            required: true
+            description: The URL rule of the request, e.g. /word/<word_id>
+        :param method:
+            type: string
+            required: true
+            description: The HTTP method
+        :param path:
+            type: string
+            required: true
+            description: The path requested
+        :param status:
+            type: int
+            required: true
+            description: The status code of the response
+        :param seconds:
+            type: float
+            required: true
+            description: The time the request took
+        :return: The log line
+        """
+        with self._lock:
+            statements = [{"kind": kind, "sql": WHITESPACE.sub(" ", sql).strip(), "binds": bind_count,
+                           "rows": rows, "ms": round(statement_seconds * 1000, 3), "error": failed}
+                          for kind, sql, bind_count, rows, statement_seconds, failed in self.statements]
+            timings = {name: {"calls": count, "ms": round(total * 1000, 3)}
+                       for name, (count, total) in sorted(self.timings.items())}
+        return json.dumps({"route": route, "method": method, "path": path, "status": status,
+                           "ms": round(seconds * 1000, 3),
+                           "db_ms": round(sum(statement["ms"] for statement in statements), 3),
+                           "statements": statements, "timings": timings}, separators=(",", ":"))
+
+
+class Histogram:
+    """
+        Counts observations (e.g. request latencies) in the LATENCY_BUCKETS buckets, as the
+        cumulative buckets of a Prometheus histogram.
+    """
+
+    def __init__(self):
+        """
+            Creates an empty histogram.
+        """
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+            Counts an observation.
+        :param value:
+            type: float
+            required: true
+            description: The observed value in seconds
+        """
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def get_lines(self, name, labels):
+        """
+            Gets the lines of the histogram in the Prometheus text format.
+        :param name:
+            type: string
+            required: true
+            description: The metric name
+        :param labels:
+            type: string
+            required: true
+            description: The formatted labels, e.g. route="/",method="GET"
+        :return: A list of lines
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics:
+    """
+        Keeps the request latency and database time histograms of each route, the request counts
+        by status and the statement latency histograms, which are exposed by /metrics.
+    """
+
+    def __init__(self):
+        """
+            Creates the empty metrics.
+        """
+        self.request_seconds = {}
+        self.request_database_seconds = {}
+        self.requests = {}
+        self.statement_seconds = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, route, method, status, seconds, database_seconds):
+        """
+            Counts a finished request.
+        :param route:
+            type: string
+            required: true
+            description: The URL rule of the request
+        :param method:
+            type: string
+            required: true
+            description: The HTTP method
+        :param status:
+            type: int
+            required: true
+            description: The status code of the response
+        :param seconds:
+            type: float
+            required: true
+            description: The time the request took
+        :param database_seconds:
+            type: float
+            required: true
+            description: The time of the request's database statements
+        """
+        key = (route, method)
+        with self._lock:
+            self.request_seconds.setdefault(key, Histogram()).observe(seconds)
+            self.request_database_seconds.setdefault(key, Histogram()).observe(database_seconds)
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+
+    def observe_statement(self, kind, seconds):
+        """
+            Counts a database statement.
+        :param kind:
+            type: string
+            required: true
+            description: "query" or "command"
+        :param seconds:
+            type: float
+            required: true
+            description: The time the statement took
+        """
+        with self._lock:
+            self.statement_seconds.setdefault(kind, Histogram()).observe(seconds)
+
+    def render(self):
+        """
+            Renders the metrics in the Prometheus text format.
+        :return: The metrics text
+        """
+        lines = []
+        with self._lock:
+            lines += ["# HELP dictionary_request_duration_seconds The request latency by route.",
+                      "# TYPE dictionary_request_duration_seconds histogram"]
+            for (route, method), histogram in sorted(self.request_seconds.items()):
+                lines += histogram.get_lines("dictionary_request_duration_seconds", get_labels(route, method))
+            lines += ["# HELP dictionary_request_database_seconds The database time of the requests by route.",
+                      "# TYPE dictionary_request_database_seconds histogram"]
+            for (route, method), histogram in sorted(self.request_database_seconds.items()):
+                lines += histogram.get_lines("dictionary_request_database_seconds", get_labels(route, method))
+            lines += ["# HELP dictionary_requests_total The requests by route and status.",
+                      "# TYPE dictionary_requests_total counter"]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'dictionary_requests_total{{{get_labels(route, method)},status="{status}"}} {count}')
+            lines += ["# HELP dictionary_statement_duration_seconds The database statement latency.",
+                      "# TYPE dictionary_statement_duration_seconds histogram"]
+            for kind, histogram in sorted(self.statement_seconds.items()):
+                lines += histogram.get_lines("dictionary_statement_duration_seconds", f'kind="{kind}"')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()  # The metrics of this application process
+
+
+def get_labels(route, method):
+    """
+        Formats the route and method labels of a metric.
+    :param route:
+        type: string
+        required: true
+        description: The URL rule
+    :param method:
+        type: string
+        required: true
+        description: The HTTP method
+    :return: The labels, e.g. route="/word/<word_id>",method="GET"
+    """
+    route = route.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'route="{route}",method="{method}"'
+
+
+def timed(name):
+    """
+        A decorator that adds the time of each call of the function to the request's profile under
+        the name passed in. When the instrumentation is turned off the function is returned as it
+        is, so it costs nothing.
+    :param name:
+        type: string
+        required: true
+        description: The name of the timing, e.g. "image"
+    :return: The decorator
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return function(*args, **kwargs)
+            started_at = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.add_timing(name, time.perf_counter() - started_at)
+        return wrapper
+    return decorator
+
+
+def instrumented(kind):
+    """
+        A decorator for the functions running a SQL statement (execute_query, stream_query and
+        execute_command) that records the statement, its number of bound arguments, the number of
+        rows returned and its duration in the request's profile and the statement metrics.
+        A streamed query is recorded when its rows have all been read, with the time spent
+        executing it and reading its rows. When the instrumentation is turned off the function is
+        returned as it is.
+    :param kind:
+        type: string
+        required: true
+        description: "query" or "command"
+    :return: The decorator
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(sql, args=None):
+            started_at = time.perf_counter()
+            result = function(sql, args)
+            seconds = time.perf_counter() - started_at
+            bind_count = len(args) if args is not None else 0
+            if isinstance(result, types.GeneratorType):
+                return count_rows(result, seconds, lambda rows, total_seconds: record_statement(
+                    kind, sql, bind_count, rows, total_seconds, False))
+            rows = len(result) if isinstance(result, list) else None
+            record_statement(kind, sql, bind_count, rows, seconds, isinstance(result, Exception))
+            return result
+        return wrapper
+    return decorator
+
+
+def count_rows(rows, seconds, finish):
+    """
+        This generator passes on the rows of a streamed query, timing how long each row takes to
+        read, and calls finish when the rows have all been read or the generator is closed.
+    :param rows:
+        type: generator
+        required: true
+        description: The rows of the query
+    :param seconds:
+        type: float
+        required: true
+        description: The time spent executing the query
+    :param finish:
+        type: function
+        required: true
+        description: A function taking the number of rows read and the total time spent
+                     executing the query and reading its rows
+    """
+    count = 0
+    try:
+        while True:
+            started_at = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - started_at
+            count += 1
+            yield row
+    finally:
+        rows.close()
+        finish(count, seconds)
+
+
+def record_statement(kind, sql, bind_count, rows, seconds, failed):
+    """
+        Records a database statement in the request's profile (if there is a request) and the
+        statement metrics.
+    :param kind:
+        type: string
+        required: true
+        description: "query" or "command"
+    :param sql:
+        type: string
+        required: true
+        description: The SQL text
+    :param bind_count:
+        type: int
+        required: true
+        description: The number of bound arguments
+    :param rows:
+        type: int
+        required: true
+        description: The number of rows returned, None for a command
+    :param seconds:
+        type: float
+        required: true
+        description: The time the statement took
+    :param failed:
+        type: boolean
+        required: true
+        description: True if the statement returned an error
+    """
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_statement(kind, sql, bind_count, rows, seconds, failed)
+    metrics.observe_statement(kind, seconds)
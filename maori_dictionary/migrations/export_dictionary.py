@@ -0,0 +1,548 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : export_dictionary.py
+#                         NOTE: This is a data export command and not a part of the application.
+#                               Examples (run from the application directory):
+#                                   python migrations/export_dictionary.py --format csv
+#                                   python migrations/export_dictionary.py --format columnar --compress gzip
+#                                   python migrations/export_dictionary.py --format ndjson --since 2022-06-01
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import argparse
+import bz2
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import lzma
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKING_DIR = os.getcwd()  # The paths given on the command line are relative to it
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+import data_access
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+EXPORT_FORMAT_VERSION = 1
+FETCH_SIZE = 5000
+ROW_GROUP_SIZE = 65536
+COLUMNAR_MAGIC = b"MDCOL1\n"
+COMPRESSORS = {"none": (open, ""), "gzip": (gzip.open, ".gz"), "bz2": (bz2.open, ".bz2"), "xz": (lzma.open, ".xz")}
+FORMAT_EXTENSIONS = {"csv": ".csv", "ndjson": ".ndjson", "columnar": ".mdcol"}
+WORD_COLUMNS = [("id", "int"), ("maori", "text"), ("english", "text"), ("description", "text"), ("level", "int"),
+                ("date_added", "text"), ("category_id", "int"), ("category", "text"),
+                ("author_first_name", "text"), ("author_last_name", "text")]
+WORD_QUERY = """SELECT d.id, d.maori, d.english, d.description, d.level, d.date_added, d.category_id,
+                       c.category_name, u.first_name, u.last_name
+                FROM dictionary d
+                JOIN category c on c.id = d.category_id
+                LEFT JOIN user_details u on u.id = d.user_id
+                {where}
+                ORDER BY d.id"""
+CATEGORY_COLUMNS = [("id", "int"), ("name", "text")]
+CATEGORY_QUERY = "SELECT id, category_name FROM category ORDER BY id"
+
+
+class HashingWriter(io.RawIOBase):
+    """
+        A binary file wrapper that counts and hashes the bytes written to the file, so the size
+        and SHA-256 of each (compressed) export file are known without reading it back.
+    """
+
+    def __init__(self, raw):
+        """
+            Wraps a binary file.
+        :param raw:
+            type: file
+            required: true
+            description: The binary file opened for writing
+        """
+        self._raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self._raw.write(data)
+
+
+def fetch_rows(cursor):
+    """
+        This generator reads the results of a query FETCH_SIZE rows at a time.
+    :param cursor:
+        type: sqlite3.Cursor
+        required: true
+        description: The executed query
+    """
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if len(rows) == 0:
+            return
+        yield from rows
+
+
+def write_csv(rows, columns, stream):
+    """
+        This function writes rows as CSV with a header line.
+    :param rows:
+        type: iterable of tuples
+        required: true
+        description: The rows
+    :param columns:
+        type: list of tuples
+        required: true
+        description: The (name, type) of each column
+    :param stream:
+        type: binary file
+        required: true
+        description: The output file
+    :return: The number of rows written
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow([name for name, column_type in columns])
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.detach()
+    return count
+
+
+def write_ndjson(rows, columns, stream):
+    """
+        This function writes rows as newline delimited JSON, one object per row.
+    :param rows:
+        type: iterable of tuples
+        required: true
+        description: The rows
+    :param columns:
+        type: list of tuples
+        required: true
+        description: The (name, type) of each column
+    :param stream:
+        type: binary file
+        required: true
+        description: The output file
+    :return: The number of rows written
+    """
+    names = [name for name, column_type in columns]
+    count = 0
+    for row in rows:
+        stream.write(json.dumps(dict(zip(names, row)), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        stream.write(b"\n")
+        count += 1
+    return count
+
+
+def write_varint(buffer, value):
+    """
+        This function appends an unsigned integer to a buffer as a LEB128 varint (7 bits per byte).
+    :param buffer:
+        type: bytearray
+        required: true
+        description: The buffer
+    :param value:
+        type: int
+        required: true
+        description: The value, 0 or more
+    """
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, position):
+    """
+        This function reads a LEB128 varint.
+    :param data:
+        type: bytes
+        required: true
+        description: The data
+    :param position:
+        type: int
+        required: true
+        description: The position of the varint
+    :return: A tuple of the value and the position after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_column(buffer, values, column_type):
+    """
+        This function appends one column of a row group to a buffer.
+        The column starts with a byte holding its encoding, then a null bitmap (one bit per row)
+        when the column has any nulls.
+        Integers are stored as the zigzag encoded difference from the previous value, so sorted
+        ids take one byte each. Text is stored either plain (each value as its length and UTF-8
+        bytes) or, when there are at most half as many distinct values as rows (e.g. categories,
+        authors and dates), as a dictionary of the distinct values followed by the index of each
+        value in it.
+    :param buffer:
+        type: bytearray
+        required: true
+        description: The buffer
+    :param values:
+        type: list
+        required: true
+        description: The values of the column
+    :param column_type:
+        type: string
+        required: true
+        description: "int" or "text"
+    """
+    has_nulls = any(value is None for value in values)
+    present = [value for value in values if value is not None]
+    if column_type == "int":
+        encoding = 0
+    else:
+        distinct = list(dict.fromkeys(present))
+        encoding = 2 if len(distinct) * 2 <= len(present) else 1
+    buffer.append(encoding | (0x80 if has_nulls else 0))
+    if has_nulls:
+        bitmap = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value is not None:
+                bitmap[index // 8] |= 1 << (index % 8)
+        buffer += bitmap
+    if encoding == 0:
+        previous = 0
+        for value in present:
+            delta = value - previous
+            write_varint(buffer, (delta << 1) ^ (delta >> 63))
+            previous = value
+    elif encoding == 1:
+        for value in present:
+            encoded = value.encode("utf-8")
+            write_varint(buffer, len(encoded))
+            buffer += encoded
+    else:
+        positions = {value: index for index, value in enumerate(distinct)}
+        write_varint(buffer, len(distinct))
+        for value in distinct:
+            encoded = value.encode("utf-8")
+            write_varint(buffer, len(encoded))
+            buffer += encoded
+        for value in present:
+            write_varint(buffer, positions[value])
+
+
+def decode_column(data, position, count):
+    """
+        This function reads one column of a row group written by encode_column.
+    :param data:
+        type: bytes
+        required: true
+        description: The row group
+    :param position:
+        type: int
+        required: true
+        description: The position of the column
+    :param count:
+        type: int
+        required: true
+        description: The number of rows in the group
+    :return: A tuple of the list of values and the position after the column
+    """
+    flags = data[position]
+    position += 1
+    encoding = flags & 0x7F
+    present = [True] * count
+    if flags & 0x80:
+        bitmap = data[position:position + (count + 7) // 8]
+        position += len(bitmap)
+        present = [bool(bitmap[index // 8] & (1 << (index % 8))) for index in range(count)]
+    present_count = sum(present)
+    values = []
+    if encoding == 0:
+        previous = 0
+        for index in range(present_count):
+            zigzag, position = read_varint(data, position)
+            previous += (zigzag >> 1) ^ -(zigzag & 1)
+            values.append(previous)
+    else:
+        if encoding == 2:
+            size, position = read_varint(data, position)
+            distinct = []
+            for index in range(size):
+                length, position = read_varint(data, position)
+                distinct.append(data[position:position + length].decode("utf-8"))
+                position += length
+        for index in range(present_count):
+            if encoding == 2:
+                value_index, position = read_varint(data, position)
+                values.append(distinct[value_index])
+            else:
+                length, position = read_varint(data, position)
+                values.append(data[position:position + length].decode("utf-8"))
+                position += length
+    values = iter(values)
+    return [next(values) if is_present else None for is_present in present], position
+
+
+def write_columnar(rows, columns, stream):
+    """
+        This function writes rows in the compact columnar format: the magic bytes, the length
+        and JSON of the header (the format version and the columns), then the rows in groups
+        of ROW_GROUP_SIZE, each group holding its row count and every column one after the other
+        (see encode_column) prefixed with its length, and a zero length at the end.
+        Only one row group is held in memory at a time.
+    :param rows:
+        type: iterable of tuples
+        required: true
+        description: The rows
+    :param columns:
+        type: list of tuples
+        required: true
+        description: The (name, type) of each column
+    :param stream:
+        type: binary file
+        required: true
+        description: The output file
+    :calls
+        encode_column - Encodes a column of a row group
+    :return: The number of rows written
+    """
+    header = json.dumps({"format": "mdcol", "version": EXPORT_FORMAT_VERSION,
+                         "columns": [{"name": name, "type": column_type} for name, column_type in columns]})
+    stream.write(COLUMNAR_MAGIC)
+    stream.write(struct.pack("<I", len(header)))
+    stream.write(header.encode("utf-8"))
+    count = 0
+    rows = iter(rows)
+    while True:
+        group = list(itertools.islice(rows, ROW_GROUP_SIZE))
+        if len(group) == 0:
+            break
+        buffer = bytearray()
+        write_varint(buffer, len(group))
+        for position, (name, column_type) in enumerate(columns):
+            encode_column(buffer, [row[position] for row in group], column_type)
+        stream.write(struct.pack("<I", len(buffer)))
+        stream.write(buffer)
+        count += len(group)
+    stream.write(struct.pack("<I", 0))
+    return count
+
+
+def read_columnar(stream):
+    """
+        This generator reads a file written by write_columnar, e.g. to check an export or to load
+        it into another system.
+    :param stream:
+        type: binary file
+        required: true
+        description: The (decompressed) columnar file
+    :return: Yields the column names first and then each row as a tuple
+    """
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar dictionary export")
+    header = json.loads(stream.read(struct.unpack("<I", stream.read(4))[0]))
+    yield [column["name"] for column in header["columns"]]
+    while True:
+        length = struct.unpack("<I", stream.read(4))[0]
+        if length == 0:
+            return
+        data = stream.read(length)
+        count, position = read_varint(data, 0)
+        column_values = []
+        for column in header["columns"]:
+            values, position = decode_column(data, position, count)
+            column_values.append(values)
+        yield from zip(*column_values)
+
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "columnar": write_columnar}
+
+
+def open_snapshot(database):
+    """
+        This function opens a read transaction on the database that every query of the export
+        reads from, so the words, categories and change sequence all come from the same moment.
+        In WAL journal mode the transaction reads straight from the database without blocking
+        writers. Otherwise a reader would stop writers committing for as long as the export runs,
+        so the database is first copied with the online backup API (which only holds its read
+        lock while copying) and the export reads the copy.
+    :param database:
+        type: string
+        required: true
+        description: The database file
+    :return: A tuple of the connection and the temporary directory of the copy (None when not copied)
+    """
+    connection = data_access.get_connection(database)
+    if connection is None:
+        sys.exit("Could not connect to the database")
+    copy_dir = None
+    if connection.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+        copy_dir = tempfile.mkdtemp()
+        copy = data_access.get_connection(os.path.join(copy_dir, "snapshot.db"))
+        connection.backup(copy)
+        connection.close()
+        connection = copy
+    connection.execute("BEGIN")
+    connection.execute("SELECT count(*) FROM sqlite_master").fetchone()  # Starts the read snapshot
+    return connection, copy_dir
+
+
+def export_table(connection, name, query, args, columns, export_format, compressor, output_dir):
+    """
+        This function streams the results of a query into an export file.
+    :param connection:
+        type: sqlite3.Connection
+        required: true
+        description: The snapshot connection
+    :param name:
+        type: string
+        required: true
+        description: The name of the export file without its extensions
+    :param query:
+        type: string
+        required: true
+        description: The query
+    :param args:
+        type: list
+        required: true
+        description: The arguments of the query
+    :param columns:
+        type: list of tuples
+        required: true
+        description: The (name, type) of each column
+    :param export_format:
+        type: string
+        required: true
+        description: "csv", "ndjson" or "columnar"
+    :param compressor:
+        type: string
+        required: true
+        description: "none", "gzip", "bz2" or "xz"
+    :param output_dir:
+        type: string
+        required: true
+        description: The directory the file is written to
+    :calls
+        fetch_rows - Reads the query results in batches
+        write_csv, write_ndjson or write_columnar - Writes the file
+    :return: The manifest entry of the file
+    """
+    open_compressed, compressed_extension = COMPRESSORS[compressor]
+    file_name = f"{name}{FORMAT_EXTENSIONS[export_format]}{compressed_extension}"
+    with open(os.path.join(output_dir, file_name), "wb") as raw:
+        hashing = HashingWriter(raw)
+        stream = io.BufferedWriter(hashing) if compressor == "none" else open_compressed(hashing, "wb")
+        with stream:
+            rows = WRITERS[export_format](fetch_rows(connection.execute(query, args)), columns, stream)
+    return {"file": file_name, "rows": rows, "bytes": hashing.bytes, "sha256": hashing.sha256.hexdigest(),
+            "columns": [{"name": column_name, "type": column_type} for column_name, column_type in columns]}
+
+
+def export_dictionary(export_format, compressor, since, output_dir):
+    """
+        This function exports the words (with their category and author names) and the categories
+        from one consistent snapshot, and writes a manifest describing the export.
+        The manifest records the change sequence number of the snapshot, so a consumer can keep
+        up to date from the export with the /api/v1/changes feed.
+    :param export_format:
+        type: string
+        required: true
+        description: "csv", "ndjson" or "columnar"
+    :param compressor:
+        type: string
+        required: true
+        description: "none", "gzip", "bz2" or "xz"
+    :param since:
+        type: string
+        required: false
+        description: Only export the words added on or after this date (YYYY-MM-DD), None for all
+    :param output_dir:
+        type: string
+        required: true
+        description: The directory the export is written to
+    :calls
+        open_snapshot - Opens the read snapshot
+        export_table - Writes each export file
+    :return: The manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    connection, copy_dir = open_snapshot(data_access.DATABASE)
+    try:
+        schema_version = connection.execute("PRAGMA user_version").fetchone()[0]
+        change_seq = connection.execute("SELECT ifnull(max(seq), 0) FROM change_log").fetchone()[0]
+        where, args = ("WHERE d.date_added >= ?", [since]) if since is not None else ("", [])
+        files = [export_table(connection, "words", WORD_QUERY.format(where=where), args, WORD_COLUMNS,
+                              export_format, compressor, output_dir),
+                 export_table(connection, "categories", CATEGORY_QUERY, [], CATEGORY_COLUMNS,
+                              export_format, compressor, output_dir)]
+        connection.commit()
+    finally:
+        connection.close()
+        if copy_dir is not None:
+            shutil.rmtree(copy_dir, ignore_errors=True)
+    manifest = {"export_format_version": EXPORT_FORMAT_VERSION,
+                "schema_version": schema_version,
+                "change_seq": change_seq,
+                "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "format": export_format,
+                "compression": compressor,
+                "since": since,
+                "files": files}
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    elapsed = time.perf_counter() - start
+    for file in files:
+        print(f"  {file['file']:32} {file['rows']:>10,} rows {file['bytes']:>14,} bytes")
+    print(f"Exported to {output_dir} in {elapsed:.2f} s (change sequence {change_seq}).")
+    return manifest
+
+
+def main():
+    """
+        This function parses the command line and runs the export
+    """
+    parser = argparse.ArgumentParser(description="Exports the dictionary from a consistent snapshot.")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv", help="The export format")
+    parser.add_argument("--compress", choices=sorted(COMPRESSORS), default="none", help="The compression")
+    parser.add_argument("--since", type=lambda value: datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d"),
+                        help="Only export the words added on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--database", help="The database to export (default database/dictionary.db)")
+    parser.add_argument("--output", help="The export directory (default exports/<date and time>)")
+    args = parser.parse_args()
+    if args.database is not None:
+        data_access.DATABASE = os.path.join(WORKING_DIR, args.database)
+    version = data_access.migrate_database()
+    if issubclass(type(version), data_access.Error):
+        sys.exit(f"The database could not be migrated: {version}")
+    output_dir = os.path.join(WORKING_DIR, args.output) if args.output is not None else \
+        os.path.join("exports", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    export_dictionary(args.format, args.compress, args.since, output_dir)
+
+
+if __name__ == "__main__":
+    main()
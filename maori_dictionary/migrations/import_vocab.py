@@ -0,0 +1,338 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : import_vocab.py
+#                         NOTE: This is a data load command and not a part of the application.
+#                               Examples (run from the application directory):
+#                                   python migrations/import_vocab.py
+#                                   python migrations/import_vocab.py migrations/data/Vocab_List.xlsx
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKING_DIR = os.getcwd()  # The paths given on the command line are relative to it
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+import data_access
+
+try:
+    import openpyxl  # Optional, only needed to import .xlsx files
+except ImportError:
+    openpyxl = None
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+DATA_FILE = os.path.join("migrations", "data", "Vocab_List.csv")
+BATCH_SIZE = 10000
+CACHE_SIZE_KIB = 256 * 1024
+COLUMNS = ("Maori", "English", "Category", "Definition", "Level")
+LEVELS = range(1, 11)  # The same levels as the bulk add form (services.LEVELS)
+UPSERT_WORD = """INSERT INTO dictionary(maori, english, description, level, category_id, user_id, date_added,
+                                        maori_key, english_key)
+                 VALUES (?1, ?2, ?3, ?4, ?5, NULL, date(), normalize_key(?1), normalize_key(?2))
+                 ON CONFLICT(maori, english) DO UPDATE
+                 SET description = excluded.description,
+                     level = excluded.level,
+                     category_id = excluded.category_id"""
+# The per row AFTER INSERT triggers on dictionary are replaced during an import by one set based
+# statement each, run for the new words (the words with an id above the largest id before the
+# import) at the end of the import. The triggers are dropped and created again inside the import
+# transaction, so no other connection ever sees the dictionary without them. The AFTER UPDATE
+# triggers stay in place for the words the import updates.
+DEFERRED_INSERT_TRIGGERS = {
+    "dictionary_fts_after_insert":
+        ["INSERT INTO dictionary_fts(rowid, maori, english, description) "
+         "SELECT id, maori, english, description FROM dictionary WHERE id > :last_id"],
+    "dictionary_change_log_after_insert":
+        ["DELETE FROM change_log WHERE entity = 'word' AND entity_id > :last_id",
+         "INSERT INTO change_log (entity, entity_id, operation) "
+         "SELECT 'word', id, 'upsert' FROM dictionary WHERE id > :last_id ORDER BY id"],
+    "dictionary_generation_after_insert":
+        ["UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') "
+         "WHERE name = 'dictionary' AND EXISTS (SELECT 1 FROM dictionary WHERE id > :last_id)"],
+}
+
+
+def read_csv(file_name):
+    """
+        This generator reads the rows of a CSV vocab list one at a time.
+    :param file_name:
+        type: string
+        required: true
+        description: The CSV file
+    """
+    with open(file_name, newline="", encoding="utf-8-sig") as csv_file:
+        yield from csv.reader(csv_file)
+
+
+def read_xlsx(file_name):
+    """
+        This generator reads the rows of the first worksheet of an Excel vocab list one at a time
+        (the workbook is opened read only, so it is not loaded into memory as a whole).
+    :param file_name:
+        type: string
+        required: true
+        description: The .xlsx file
+    """
+    if openpyxl is None:
+        sys.exit("The openpyxl package is needed to import .xlsx files (pip install openpyxl)")
+    workbook = openpyxl.load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_rows(file_name):
+    """
+        This generator reads the vocab list and yields its rows as (line number, row) tuples with
+        the values in COLUMNS order, whatever the order of the columns in the file.
+    :param file_name:
+        type: string
+        required: true
+        description: The .csv or .xlsx file
+    :calls
+        read_csv - Reads a CSV file
+        read_xlsx - Reads an Excel file
+    """
+    rows = read_xlsx(file_name) if file_name.lower().endswith(".xlsx") else read_csv(file_name)
+    header = [name.strip().title() for name in next(rows, [])]
+    missing = [name for name in COLUMNS if name not in header]
+    if len(missing) > 0:
+        sys.exit(f"{file_name} has no {', '.join(missing)} column(s)")
+    positions = [header.index(name) for name in COLUMNS]
+    for line_number, row in enumerate(rows, start=2):
+        if not any(value.strip() for value in row):
+            continue
+        row = row + [""] * (len(header) - len(row))
+        yield line_number, [row[position].strip() for position in positions]
+
+
+class CategoryMap:
+    """
+        Maps category names to category ids, adding the categories that are not in the database yet.
+    """
+
+    def __init__(self, connection):
+        """
+            Loads the existing categories.
+        :param connection:
+            type: sqlite3.Connection
+            required: true
+            description: The connection the import runs on
+        """
+        self._connection = connection
+        self._ids = {name: category_id for category_id, name in connection.execute("SELECT id, category_name FROM category")}
+        self.added = 0
+
+    def get_id(self, category_name):
+        """
+            Gets the id of a category, adding the category if it is new.
+        :param category_name:
+            type: string
+            required: true
+            description: The category name
+        :return: The category id
+        """
+        category_id = self._ids.get(category_name)
+        if category_id is None:
+            category_id = self._connection.execute("INSERT INTO category(category_name) VALUES (?)",
+                                                   [category_name]).lastrowid
+            self._ids[category_name] = category_id
+            self.added += 1
+        return category_id
+
+
+def get_word_parameters(rows, categories, rejected):
+    """
+        This generator validates the vocab list rows and turns them into the parameters of the
+        upsert statement. Invalid rows are reported and skipped.
+    :param rows:
+        type: iterable of tuples
+        required: true
+        description: The (line number, row) tuples from read_rows
+    :param categories:
+        type: CategoryMap
+        required: true
+        description: The category name to id map
+    :param rejected:
+        type: list
+        required: true
+        description: The line numbers and reasons of the rejected rows are appended to it
+    """
+    for line_number, (maori, english, category, definition, level) in rows:
+        if maori == "" or english == "" or category == "":
+            rejected.append((line_number, "the maori, english and category are required"))
+            continue
+        if not level.isdecimal() or int(level) not in LEVELS:
+            rejected.append((line_number, f"the level '{level}' is not a number from {LEVELS[0]} to {LEVELS[-1]}"))
+            continue
+        yield maori, english, definition, int(level), categories.get_id(category.title())
+
+
+def suspend_insert_triggers(connection):
+    """
+        This function drops the dictionary AFTER INSERT triggers listed in DEFERRED_INSERT_TRIGGERS.
+        It must be called inside the import transaction.
+    :param connection:
+        type: sqlite3.Connection
+        required: true
+        description: The connection the import runs on
+    :return: A dictionary of the names and SQL of the dropped triggers
+    """
+    names = list(DEFERRED_INSERT_TRIGGERS)
+    triggers = dict(connection.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                                       f"AND name IN ({', '.join('?' * len(names))})", names))
+    for name in triggers:
+        connection.execute(f"DROP TRIGGER {name}")
+    return triggers
+
+
+def resume_insert_triggers(connection, triggers, last_id):
+    """
+        This function does the work of the dropped triggers for all the new words at once and
+        creates the triggers again.
+    :param connection:
+        type: sqlite3.Connection
+        required: true
+        description: The connection the import runs on
+    :param triggers:
+        type: dict
+        required: true
+        description: The names and SQL of the dropped triggers returned by suspend_insert_triggers
+    :param last_id:
+        type: int
+        required: true
+        description: The largest word id before the import
+    """
+    for name, sql in triggers.items():
+        for statement in DEFERRED_INSERT_TRIGGERS[name]:
+            connection.execute(statement, {"last_id": last_id})
+        connection.execute(sql)
+
+
+def suspend_indexes(connection):
+    """
+        This function drops the secondary (not unique) indexes of the dictionary table, so the
+        words are not inserted into each of them one at a time. It must be called inside the
+        import transaction. The unique (maori, english) index is kept for the upsert.
+    :param connection:
+        type: sqlite3.Connection
+        required: true
+        description: The connection the import runs on
+    :return: A list of the SQL of the dropped indexes
+    """
+    indexes = connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                                 "AND tbl_name = 'dictionary' AND sql IS NOT NULL "
+                                 "AND sql NOT LIKE 'CREATE UNIQUE%'").fetchall()
+    for name, sql in indexes:
+        connection.execute(f"DROP INDEX {name}")
+    return [sql for name, sql in indexes]
+
+
+def import_vocab(file_name, batch_size, quiet, rebuild_indexes):
+    """
+        This function imports a vocab list into the dictionary in one transaction. Each batch of
+        rows is written with executemany. A word already in the dictionary (the same maori and
+        english) has its description, level and category updated, and keeps its id and date added.
+        The full text index, change log and generation of the new words are written once at the
+        end instead of by a trigger per row.
+    :param file_name:
+        type: string
+        required: true
+        description: The .csv or .xlsx file
+    :param batch_size:
+        type: int
+        required: true
+        description: The number of rows written by each executemany
+    :param quiet:
+        type: boolean
+        required: true
+        description: True to not report the progress after each batch
+    :param rebuild_indexes:
+        type: boolean
+        required: true
+        description: True to drop the secondary indexes during the import and build them again
+                     at the end, which is faster when the import is large compared to the dictionary
+    :calls
+        read_rows - Reads the vocab list
+        get_word_parameters - Validates the rows
+        suspend_insert_triggers - Drops the per row insert triggers
+        resume_insert_triggers - Does the work of the insert triggers and creates them again
+        suspend_indexes - Drops the secondary indexes
+    :return: The number of rejected rows
+    """
+    version = data_access.migrate_database()
+    if issubclass(type(version), data_access.Error):
+        sys.exit(f"The database could not be migrated: {version}")
+    connection = data_access.get_connection(data_access.DATABASE)
+    if connection is None:
+        sys.exit("Could not connect to the database")
+    rejected = []
+    start = time.perf_counter()
+    try:
+        connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        connection.execute("BEGIN IMMEDIATE")
+        words_before, last_id = connection.execute("SELECT count(*), ifnull(max(id), 0) FROM dictionary").fetchone()
+        triggers = suspend_insert_triggers(connection)
+        indexes = suspend_indexes(connection) if rebuild_indexes else []
+        categories = CategoryMap(connection)
+        parameters = get_word_parameters(read_rows(file_name), categories, rejected)
+        imported = 0
+        while True:
+            batch = list(itertools.islice(parameters, batch_size))
+            if len(batch) == 0:
+                break
+            connection.executemany(UPSERT_WORD, batch)
+            imported += len(batch)
+            if not quiet:
+                elapsed = time.perf_counter() - start
+                print(f"  {imported:>10,} rows  {imported / elapsed:>10,.0f} rows/s", file=sys.stderr)
+        for sql in indexes:
+            connection.execute(sql)
+        resume_insert_triggers(connection, triggers, last_id)
+        words_after = connection.execute("SELECT count(*) FROM dictionary").fetchone()[0]
+        connection.commit()
+    except (data_access.Error, OSError) as e:
+        connection.rollback()
+        sys.exit(f"The import was rolled back: {e}")
+    finally:
+        connection.close()
+    elapsed = time.perf_counter() - start
+    for line_number, reason in rejected:
+        print(f"Line {line_number} rejected: {reason}")
+    print(f"Imported {imported:,} rows from {file_name} in {elapsed:.2f} s ({imported / max(elapsed, 1e-9):,.0f} rows/s): "
+          f"{words_after - words_before:,} words added, {imported - (words_after - words_before):,} updated, "
+          f"{categories.added:,} categories added, {len(rejected):,} rows rejected.")
+    return len(rejected)
+
+
+def main():
+    """
+        This function parses the command line and runs the import
+    """
+    parser = argparse.ArgumentParser(description="Imports a vocab list (.csv or .xlsx) into the dictionary.")
+    parser.add_argument("file", nargs="?", help="The vocab list to import (default migrations/data/Vocab_List.csv)")
+    parser.add_argument("--database", help="The database to import into (default database/dictionary.db)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows written by each executemany")
+    parser.add_argument("--quiet", action="store_true", help="Only report the totals")
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="Build the secondary indexes again after the import (faster for large imports)")
+    args = parser.parse_args()
+    if args.database is not None:
+        data_access.DATABASE = os.path.join(WORKING_DIR, args.database)
+    file_name = DATA_FILE if args.file is None else os.path.join(WORKING_DIR, args.file)
+    sys.exit(1 if import_vocab(file_name, args.batch_size, args.quiet, args.rebuild_indexes) > 0 else 0)
+
+
+main()
@@ -0,0 +1,68 @@
+-- Change feed for the offline clients. Every insert, update and delete of a word or category
+-- (including the words deleted by the cascade when their category is deleted) is recorded with
+-- a sequence number that only ever increases (AUTOINCREMENT never reuses a number).
+-- Only the latest change of each word or category is kept, so a client syncing since its last
+-- sequence number reads one row per word or category changed, however often it changed, and a
+-- deleted word or category is kept as a 'delete' tombstone.
+CREATE TABLE IF NOT EXISTS change_log
+(
+    seq        integer primary key autoincrement,
+    entity     varchar(10) not null,
+    entity_id  integer     not null,
+    operation  varchar(10) not null,
+    changed_at datetime    not null default (datetime('now'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS change_log_entity_index ON change_log (entity, entity_id);
+
+-- The existing words and categories are the first changes, so a client syncing since 0 gets
+-- the whole dictionary.
+INSERT INTO change_log (entity, entity_id, operation)
+SELECT 'category', id, 'upsert' FROM category ORDER BY id;
+
+INSERT INTO change_log (entity, entity_id, operation)
+SELECT 'word', id, 'upsert' FROM dictionary ORDER BY id;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_change_log_after_insert AFTER INSERT ON dictionary
+BEGIN
+    DELETE FROM change_log WHERE entity = 'word' AND entity_id = NEW.id;
+    INSERT INTO change_log (entity, entity_id, operation) VALUES ('word', NEW.id, 'upsert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_change_log_after_update AFTER UPDATE ON dictionary
+BEGIN
+    DELETE FROM change_log WHERE entity = 'word' AND entity_id = NEW.id;
+    INSERT INTO change_log (entity, entity_id, operation) VALUES ('word', NEW.id, 'upsert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_change_log_after_delete AFTER DELETE ON dictionary
+BEGIN
+    DELETE FROM change_log WHERE entity = 'word' AND entity_id = OLD.id;
+    INSERT INTO change_log (entity, entity_id, operation) VALUES ('word', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS category_change_log_after_insert AFTER INSERT ON category
+BEGIN
+    DELETE FROM change_log WHERE entity = 'category' AND entity_id = NEW.id;
+    INSERT INTO change_log (entity, entity_id, operation) VALUES ('category', NEW.id, 'upsert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS category_change_log_after_update AFTER UPDATE ON category
+BEGIN
+    DELETE FROM change_log WHERE entity = 'category' AND entity_id = NEW.id;
+    INSERT INTO change_log (entity, entity_id, operation) VALUES ('category', NEW.id, 'upsert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS category_change_log_after_delete AFTER DELETE ON category
+BEGIN
+    DELETE FROM change_log WHERE entity = 'category' AND entity_id = OLD.id;
+    INSERT INTO change_log (entity, entity_id, operation) VALUES ('category', OLD.id, 'delete');
+END;
+
+-- The words show the name of the user who last edited them
+CREATE TRIGGER IF NOT EXISTS user_details_change_log_after_update AFTER UPDATE OF first_name, last_name ON user_details
+BEGIN
+    DELETE FROM change_log WHERE entity = 'word' AND entity_id IN (SELECT id FROM dictionary WHERE user_id = NEW.id);
+    INSERT INTO change_log (entity, entity_id, operation)
+    SELECT 'word', id, 'upsert' FROM dictionary WHERE user_id = NEW.id ORDER BY id;
+END;
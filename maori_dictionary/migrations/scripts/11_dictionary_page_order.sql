@@ -0,0 +1,10 @@
+-- The browse and search pages are ordered by the maori search key and then the maori and english
+-- words, so a page is read straight from the maori key index (maori_key, maori, english, ...)
+-- from the cursor onwards and stops at the page size instead of sorting the whole letter range.
+-- The level searches keep reading their pages in order from the level index.
+DROP INDEX IF EXISTS dictionary_level_index;
+
+CREATE INDEX IF NOT EXISTS dictionary_level_index
+    ON dictionary (level, maori_key, maori, english, date_added, user_id);
+
+ANALYZE;
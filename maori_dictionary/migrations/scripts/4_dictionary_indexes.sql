@@ -0,0 +1,30 @@
+-- Indexes supporting the access paths used by data_access.py.
+-- The LIKE searches are case insensitive, so the maori and english indexes use NOCASE
+-- collation which allows SQLite to turn "maori LIKE 'h%'" into an index range search.
+-- The remaining columns make the indexes covering for the word summary queries.
+
+-- get_browse_results and get_search_results searching by maori
+CREATE INDEX IF NOT EXISTS dictionary_maori_nocase_index
+    ON dictionary (maori COLLATE NOCASE, english, level, date_added, user_id);
+
+-- get_search_results searching by english
+CREATE INDEX IF NOT EXISTS dictionary_english_nocase_index
+    ON dictionary (english COLLATE NOCASE, maori, level, date_added, user_id);
+
+-- get_search_results searching by level, already in maori and english order
+CREATE INDEX IF NOT EXISTS dictionary_level_index
+    ON dictionary (level, maori, english, date_added, user_id);
+
+-- get_search_results most recent scenarios (ORDER BY date_added DESC, maori, english LIMIT 20)
+CREATE INDEX IF NOT EXISTS dictionary_date_added_index
+    ON dictionary (date_added DESC, maori, english, level, user_id);
+
+-- get_words and the ON DELETE CASCADE from category
+CREATE INDEX IF NOT EXISTS dictionary_category_id_index
+    ON dictionary (category_id, maori, english);
+
+-- The ON DELETE SET NULL from user_details
+CREATE INDEX IF NOT EXISTS dictionary_user_id_index
+    ON dictionary (user_id);
+
+ANALYZE;
@@ -0,0 +1,36 @@
+-- Full text index over the maori, english and description columns of the dictionary table.
+-- It is an external content table, so the text itself is only stored once (in dictionary)
+-- and the triggers below keep the index in step with every insert, update and delete.
+-- remove_diacritics lets "maori" match "Māori" and the prefix indexes make short prefix
+-- queries (e.g. "ha*") index lookups.
+CREATE VIRTUAL TABLE IF NOT EXISTS dictionary_fts USING fts5(
+    maori,
+    english,
+    description,
+    content = 'dictionary',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS dictionary_fts_after_insert AFTER INSERT ON dictionary
+BEGIN
+    INSERT INTO dictionary_fts (rowid, maori, english, description)
+    VALUES (new.id, new.maori, new.english, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_fts_after_delete AFTER DELETE ON dictionary
+BEGIN
+    INSERT INTO dictionary_fts (dictionary_fts, rowid, maori, english, description)
+    VALUES ('delete', old.id, old.maori, old.english, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_fts_after_update AFTER UPDATE OF maori, english, description ON dictionary
+BEGIN
+    INSERT INTO dictionary_fts (dictionary_fts, rowid, maori, english, description)
+    VALUES ('delete', old.id, old.maori, old.english, old.description);
+    INSERT INTO dictionary_fts (rowid, maori, english, description)
+    VALUES (new.id, new.maori, new.english, new.description);
+END;
+
+INSERT INTO dictionary_fts (dictionary_fts) VALUES ('rebuild');
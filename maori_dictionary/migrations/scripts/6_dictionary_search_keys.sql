@@ -0,0 +1,23 @@
+-- Normalized search keys for the maori and english words (macrons removed, case folded and
+-- whitespace collapsed, see normalization.py). They are set by the application whenever a word
+-- is added or updated; normalize_key() is registered on every application connection so the
+-- existing words can be filled in here.
+ALTER TABLE dictionary ADD COLUMN maori_key varchar(30) not null default '';
+ALTER TABLE dictionary ADD COLUMN english_key varchar(30) not null default '';
+
+UPDATE dictionary
+SET maori_key = normalize_key(maori),
+    english_key = normalize_key(english);
+
+-- The maori and english searches now use the search keys, so the NOCASE indexes are replaced
+-- by covering indexes on the keys.
+DROP INDEX IF EXISTS dictionary_maori_nocase_index;
+DROP INDEX IF EXISTS dictionary_english_nocase_index;
+
+CREATE INDEX IF NOT EXISTS dictionary_maori_key_index
+    ON dictionary (maori_key, maori, english, level, date_added, user_id);
+
+CREATE INDEX IF NOT EXISTS dictionary_english_key_index
+    ON dictionary (english_key, maori, english, level, date_added, user_id);
+
+ANALYZE;
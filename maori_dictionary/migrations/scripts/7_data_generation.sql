@@ -0,0 +1,26 @@
+-- Generation counters for data that the application caches in memory. Every change to a table
+-- increments its counter (via the triggers below), so each application process can tell that
+-- its cached copy is out of date no matter which process made the change.
+CREATE TABLE IF NOT EXISTS data_generation
+(
+    name       varchar(30) not null
+        primary key,
+    generation integer     not null default 0
+);
+
+INSERT OR IGNORE INTO data_generation (name, generation) VALUES ('category', 0);
+
+CREATE TRIGGER IF NOT EXISTS category_generation_after_insert AFTER INSERT ON category
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'category';
+END;
+
+CREATE TRIGGER IF NOT EXISTS category_generation_after_update AFTER UPDATE ON category
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'category';
+END;
+
+CREATE TRIGGER IF NOT EXISTS category_generation_after_delete AFTER DELETE ON category
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'category';
+END;
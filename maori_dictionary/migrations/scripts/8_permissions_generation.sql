@@ -0,0 +1,24 @@
+-- Generation counter for user permissions. The allow_edit flag of a logged-in user is kept in
+-- their session together with this counter; the triggers below increment it whenever a user's
+-- type or a type's allow_edit flag changes, which makes every session refresh its flag.
+INSERT OR IGNORE INTO data_generation (name, generation) VALUES ('permissions', 0);
+
+CREATE TRIGGER IF NOT EXISTS user_details_permissions_after_update AFTER UPDATE OF user_type_id ON user_details
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'permissions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_details_permissions_after_delete AFTER DELETE ON user_details
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'permissions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_type_permissions_after_update AFTER UPDATE OF allow_edit ON user_type
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'permissions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_type_permissions_after_delete AFTER DELETE ON user_type
+BEGIN
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'permissions';
+END;
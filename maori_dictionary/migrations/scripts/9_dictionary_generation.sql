@@ -0,0 +1,50 @@
+-- Generation counter for the dictionary words, used to key the rendered page cache, and the
+-- time each generation last changed, used for the Last-Modified header of cached pages.
+-- The word pages also show the names of the user who last edited a word, so a change to a
+-- user's name counts as a dictionary change.
+ALTER TABLE data_generation ADD COLUMN changed_at datetime;
+
+INSERT OR IGNORE INTO data_generation (name, generation, changed_at)
+VALUES ('dictionary', 0, (SELECT max(date_added) FROM dictionary));
+
+UPDATE data_generation SET changed_at = datetime('now') WHERE name = 'category';
+
+CREATE TRIGGER IF NOT EXISTS dictionary_generation_after_insert AFTER INSERT ON dictionary
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'dictionary';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_generation_after_update AFTER UPDATE ON dictionary
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'dictionary';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dictionary_generation_after_delete AFTER DELETE ON dictionary
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'dictionary';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_details_generation_after_update AFTER UPDATE OF first_name, last_name ON user_details
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'dictionary';
+END;
+
+-- The category triggers now record when the categories changed too
+DROP TRIGGER IF EXISTS category_generation_after_insert;
+DROP TRIGGER IF EXISTS category_generation_after_update;
+DROP TRIGGER IF EXISTS category_generation_after_delete;
+
+CREATE TRIGGER category_generation_after_insert AFTER INSERT ON category
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'category';
+END;
+
+CREATE TRIGGER category_generation_after_update AFTER UPDATE ON category
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'category';
+END;
+
+CREATE TRIGGER category_generation_after_delete AFTER DELETE ON category
+BEGIN
+    UPDATE data_generation SET generation = generation + 1, changed_at = datetime('now') WHERE name = 'category';
+END;
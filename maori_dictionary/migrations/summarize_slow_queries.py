@@ -0,0 +1,157 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : summarize_slow_queries.py
+#                         NOTE: This is a slow query report command and not a part of the application.
+#                               Examples (run from the application directory):
+#                                   python migrations/summarize_slow_queries.py
+#                                   python migrations/summarize_slow_queries.py --top 15 --caller get_search_results
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKING_DIR = os.getcwd()  # The paths given on the command line are relative to it
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+import data_access
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+DEFAULT_TOP = 10
+
+
+def get_log_files(path):
+    """
+        This function finds the slow query log file and its rotated files (path.1, path.2, ...)
+    :param path:
+        type: string
+        required: true
+        description: The path of the log file
+    :return: A list of the existing files, oldest first
+    """
+    files = []
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        files.insert(0, f"{path}.{number}")
+        number += 1
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_entries(files, caller=None):
+    """
+        This generator reads the slow query log entries, skipping the lines that can not be read
+        (e.g. a line cut short when the disk was full)
+    :param files:
+        type: list
+        required: true
+        description: The log files
+    :param caller:
+        type: string
+        required: false
+        description: Only read the entries with a call site containing this text
+    """
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if caller is None or any(caller in frame for frame in entry.get("call_site", [])):
+                    yield entry
+
+
+def summarize(entries):
+    """
+        This function groups the entries by statement. The statements are logged with their
+        arguments bound separately, so each shape of a query (e.g. each combination of the
+        get_search_results filters) is a statement of its own.
+    :param entries:
+        type: iterable
+        required: true
+        description: The log entries
+    :return: A list of the statement summaries, the worst total time first
+    """
+    statements = {}
+    for entry in entries:
+        summary = statements.get(entry["sql"])
+        if summary is None:
+            summary = statements[entry["sql"]] = {"sql": entry["sql"], "kind": entry["kind"], "durations": [],
+                                                  "rows": 0, "errors": 0, "call_sites": Counter()}
+        summary["durations"].append(entry["ms"])
+        summary["rows"] += entry.get("rows") or 0
+        summary["errors"] += 1 if entry.get("error") else 0
+        summary["call_sites"][entry["call_site"][0] if entry.get("call_site") else "unknown"] += 1
+        summary["plan"] = entry.get("plan", [])  # The most recent plan
+        summary["last_seen"] = entry["time"]
+    for summary in statements.values():
+        durations = sorted(summary.pop("durations"))
+        summary["count"] = len(durations)
+        summary["total_ms"] = sum(durations)
+        summary["mean_ms"] = summary["total_ms"] / len(durations)
+        summary["p95_ms"] = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        summary["max_ms"] = durations[-1]
+    return sorted(statements.values(), key=lambda summary: summary["total_ms"], reverse=True)
+
+
+def print_summary(summaries, top):
+    """
+        This function prints the worst statements with their call sites and query plans
+    :param summaries:
+        type: list
+        required: true
+        description: The statement summaries, the worst first
+    :param top:
+        type: int
+        required: true
+        description: The number of statements to print
+    """
+    total_ms = sum(summary["total_ms"] for summary in summaries)
+    print(f"{len(summaries)} statements, {sum(summary['count'] for summary in summaries):,} slow executions, "
+          f"{total_ms / 1000:.2f} s in total")
+    for rank, summary in enumerate(summaries[:top], 1):
+        print()
+        print(f"#{rank} {summary['kind']}: {summary['total_ms']:,.1f} ms total "
+              f"({summary['total_ms'] / total_ms:.0%}), {summary['count']:,} times, "
+              f"mean {summary['mean_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, max {summary['max_ms']:.1f} ms, "
+              f"{summary['rows'] / summary['count']:.0f} rows on average, {summary['errors']} errors, "
+              f"last seen {summary['last_seen']}")
+        print(f"  {summary['sql']}")
+        for call_site, count in summary["call_sites"].most_common(3):
+            print(f"  called from {call_site} ({count} times)")
+        for line in summary["plan"]:
+            print(f"    {line}")
+
+
+def main():
+    """
+        This function parses the command line and prints the summary
+    """
+    parser = argparse.ArgumentParser(description="Summarizes the slow query log by statement.")
+    parser.add_argument("--log", help=f"The slow query log file (default {data_access.SLOW_QUERY_LOG})")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="The number of statements to show")
+    parser.add_argument("--caller", help="Only summarize the statements run by this function, "
+                                         "e.g. get_search_results")
+    args = parser.parse_args()
+    path = os.path.join(WORKING_DIR, args.log) if args.log is not None else data_access.SLOW_QUERY_LOG
+    files = get_log_files(path)
+    if len(files) == 0:
+        sys.exit(f"There is no slow query log at {path}")
+    summaries = summarize(read_entries(files, args.caller))
+    if len(summaries) == 0:
+        sys.exit("There are no slow statements in the log")
+    print_summary(summaries, args.top)
+
+
+if __name__ == "__main__":
+    main()
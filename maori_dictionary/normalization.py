@@ -0,0 +1,44 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : normalization.py
+# Program description   : This module normalizes words into the search keys stored in the database.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import unicodedata
+
+
+def normalize_key(text):
+    """
+        Normalizes a word or phrase into a search key by removing macrons (and any other
+        diacritics), case folding it and collapsing runs of whitespace into a single space.
+        e.g. "  Māori  Kai " => "maori kai"
+    :param text:
+        type: string
+        required: true
+        description: The word or phrase to normalize
+    :return: The normalized search key
+    """
+    if text is None:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def get_key_range(prefix):
+    """
+        Gets the range of search keys starting with the normalized prefix. Searching with
+        "key >= start AND key < end" rather than LIKE keeps the search an index range scan
+        and treats characters such as "%" and "_" as ordinary characters.
+    :param prefix:
+        type: string
+        required: true
+        description: The word or phrase the search keys should start with
+    :return:
+        start - The normalized prefix, the lowest key in the range
+        end - The first key after the range
+    """
+    start = normalize_key(prefix)
+    return start, start + "\U0010ffff"
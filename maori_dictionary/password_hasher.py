@@ -0,0 +1,176 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : password_hasher.py
+# Program description   : This module hashes and checks the passwords on a bounded pool of worker
+#                         threads, so a burst of logins can not use up the request threads.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class PasswordHasher:
+    """
+        Runs the bcrypt password hashing on "threads" worker threads (bcrypt releases the GIL, so
+        they hash in parallel) while the request threads wait for the result. At most "queue_size"
+        more passwords wait for a worker; when the queue is full a login or sign up is turned away
+        straight away instead of waiting behind the others, so the hashing can never hold up more
+        than threads + queue_size request threads and the page views keep being served.
+    """
+
+    def __init__(self, generate, check, rounds, threads, queue_size):
+        """
+            Creates the hasher. The worker threads are started when they are first needed.
+        :param generate:
+            type: function
+            required: true
+            description: A function taking the password and the cost and returning the hash
+        :param check:
+            type: function
+            required: true
+            description: A function taking the hash and the password and returning True if they match
+        :param rounds:
+            type: int
+            required: true
+            description: The bcrypt cost (log2 of the number of rounds) of new hashes
+        :param threads:
+            type: int
+            required: true
+            description: The number of worker threads
+        :param queue_size:
+            type: int
+            required: true
+            description: The number of passwords that may wait for a worker
+        """
+        self.rounds = rounds
+        self._generate = generate
+        self._check = check
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="password-hasher")
+        self._slots = threading.BoundedSemaphore(threads + queue_size)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._stats = {"hashed": 0, "checked": 0, "rehashed": 0, "rejected": 0,
+                       "wait_seconds": 0.0, "hash_seconds": 0.0}
+
+    def hash_password(self, password):
+        """
+            Hashes a password with the current cost.
+        :param password:
+            type: string
+            required: true
+            description: The password
+        :return: The hash or None if the queue is full
+        """
+        future = self._submit("hashed", self._generate, password, self.rounds)
+        if future is None:
+            return None
+        return future.result()
+
+    def check_password(self, hashed_password, password):
+        """
+            Checks a password against its hash.
+        :param hashed_password:
+            type: string or bytes
+            required: true
+            description: The stored hash
+        :param password:
+            type: string
+            required: true
+            description: The password entered
+        :return: True if the password matches, False if it does not or None if the queue is full
+        """
+        future = self._submit("checked", self._check, hashed_password, password)
+        if future is None:
+            return None
+        return future.result()
+
+    def needs_rehash(self, hashed_password):
+        """
+            Checks whether a hash was made with a different cost than the current one.
+        :param hashed_password:
+            type: string or bytes
+            required: true
+            description: The stored hash, e.g. $2b$12$...
+        :return: True if the password should be hashed again otherwise False
+        """
+        if isinstance(hashed_password, bytes):
+            hashed_password = hashed_password.decode("ascii", "replace")
+        parts = hashed_password.split("$")
+        return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) != self.rounds
+
+    def rehash_later(self, password, save):
+        """
+            Hashes a password again with the current cost in the background and saves the new hash,
+            so the login does not wait for it. Nothing is done when the queue is full; the password
+            is hashed again at a later login.
+        :param password:
+            type: string
+            required: true
+            description: The password that was just checked
+        :param save:
+            type: function
+            required: true
+            description: A function taking the new hash and saving it
+        :return: True if the password was queued to be hashed again otherwise False
+        """
+        return self._submit("rehashed", lambda: save(self._generate(password, self.rounds))) is not None
+
+    def get_stats(self):
+        """
+            Gets the hasher statistics.
+        :return: A dictionary with the number of passwords waiting for a worker and being hashed,
+                 the hashed, checked, rehashed and rejected (queue full) counts and the total
+                 seconds spent waiting for a worker and hashing.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = self._queued
+            stats["running"] = self._running
+            stats["rounds"] = self.rounds
+        return stats
+
+    def _submit(self, name, function, *args):
+        """
+            Queues a hashing job when there is room in the queue.
+        :param name:
+            type: string
+            required: true
+            description: The statistic counting the job
+        :param function:
+            type: function
+            required: true
+            description: The hashing function
+        :param args:
+            type: any
+            required: false
+            description: The arguments of the function
+        :return: The Future of the job or None if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            return None
+        queued_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def job():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._stats["wait_seconds"] += started_at - queued_at
+            try:
+                return function(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._stats[name] += 1
+                    self._stats["hash_seconds"] += time.perf_counter() - started_at
+                self._slots.release()
+
+        return self._executor.submit(job)
@@ -0,0 +1,99 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : query_builder.py
+# Program description   : This module composes SQL SELECT statements for the data access module.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+class SelectQuery:
+    """
+        Builds a SELECT statement one clause at a time. Every value is passed as a bound argument,
+        so the same set of filters always produces exactly the same SQL text and sqlite3 can reuse
+        the prepared statement from its statement cache.
+
+        Example:
+            query = SelectQuery("d.id, d.maori", "dictionary d")
+            query.where("maori LIKE ?", "hei%").order_by("maori").limit(20)
+            sql, args = query.build()
+    """
+
+    def __init__(self, columns, source):
+        """
+            Creates a query with no filters, ordering or limit.
+        :param columns:
+            type: string
+            required: true
+            description: The select list e.g. "d.id, d.maori"
+        :param source:
+            type: string
+            required: true
+            description: The FROM clause including any joins e.g. "dictionary d"
+        """
+        self.columns = columns
+        self.source = source
+        self.conditions = []
+        self.args = []
+        self.order_terms = []
+        self.limit_count = None
+
+    def where(self, condition, *args):
+        """
+            Adds a condition to the WHERE clause. Conditions are joined with AND in the order added.
+        :param condition:
+            type: string
+            required: true
+            description: The SQL condition with a ? placeholder for each argument e.g. "level = ?"
+        :param args:
+            type: any
+            required: false
+            description: The values bound to the placeholders of the condition
+        :return: The query, so that calls can be chained.
+        """
+        self.conditions.append(condition)
+        self.args.extend(args)
+        return self
+
+    def order_by(self, *terms):
+        """
+            Sets the ORDER BY clause.
+        :param terms:
+            type: string
+            required: true
+            description: The ordering terms e.g. "date_added DESC", "maori"
+        :return: The query, so that calls can be chained.
+        """
+        self.order_terms = list(terms)
+        return self
+
+    def limit(self, count):
+        """
+            Sets the LIMIT clause. The count is bound as an argument.
+        :param count:
+            type: int
+            required: true
+            description: The maximum number of rows to return
+        :return: The query, so that calls can be chained.
+        """
+        self.limit_count = count
+        return self
+
+    def build(self):
+        """
+            Builds the SQL statement and its arguments.
+        :return:
+            sql - The SELECT statement
+            args - The list of arguments to bind to the statement
+        """
+        sql = f"SELECT {self.columns} FROM {self.source}"
+        args = list(self.args)
+        if len(self.conditions) > 0:
+            sql += " WHERE " + " AND ".join(self.conditions)
+        if len(self.order_terms) > 0:
+            sql += " ORDER BY " + ", ".join(self.order_terms)
+        if self.limit_count is not None:
+            sql += " LIMIT ?"
+            args.append(self.limit_count)
+        return sql, args
@@ -0,0 +1,107 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : rate_limiter.py
+# Program description   : This module limits how often an action (e.g. a login) may be attempted.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from collections import OrderedDict
+import threading
+import time
+
+
+class RateLimiter:
+    """
+        Allows each key (e.g. an IP address or an email address) at most "limit" attempts in a
+        window of "window_seconds", which starts with the key's first attempt.
+        The attempts are counted in memory by each application process. Only the "max_keys" most
+        recently used keys are kept, so the counts can not use up the memory.
+    """
+
+    def __init__(self, limit, window_seconds, max_keys=10000):
+        """
+            Creates the rate limiter.
+        :param limit:
+            type: int
+            required: true
+            description: The number of attempts allowed in a window, 0 for no limit
+        :param window_seconds:
+            type: int
+            required: true
+            description: The length of a window in seconds
+        :param max_keys:
+            type: int
+            required: false
+            description: The maximum number of keys whose attempts are counted
+        """
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """
+            Counts an attempt and checks whether it is allowed.
+        :param key:
+            type: string
+            required: true
+            description: The key, e.g. the IP address
+        :return: True if the attempt is allowed, False if the key has used up its attempts
+        """
+        if not self.check(key):
+            return False
+        self.record(key)
+        return True
+
+    def check(self, key):
+        """
+            Checks whether a key has attempts left without counting an attempt, for the limits
+            that only count the failed attempts (see record).
+        :param key:
+            type: string
+            required: true
+            description: The key, e.g. the email address
+        :return: True if the attempt is allowed, False if the key has used up its attempts
+        """
+        if self.limit <= 0:
+            return True
+        with self._lock:
+            started_at, attempts = self._windows.get(key, (0, 0))
+            if time.monotonic() - started_at < self.window_seconds and attempts >= self.limit:
+                self.rejected += 1
+                return False
+        return True
+
+    def record(self, key):
+        """
+            Counts an attempt.
+        :param key:
+            type: string
+            required: true
+            description: The key, e.g. the email address
+        """
+        if self.limit <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            started_at, attempts = self._windows.get(key, (now, 0))
+            if now - started_at >= self.window_seconds:
+                started_at, attempts = now, 0
+            self._windows[key] = (started_at, attempts + 1)
+            self._windows.move_to_end(key)
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+
+    def reset(self, key):
+        """
+            Forgets the attempts of a key, e.g. after a successful login.
+        :param key:
+            type: string
+            required: true
+            description: The key, e.g. the email address
+        """
+        with self._lock:
+            self._windows.pop(key, None)
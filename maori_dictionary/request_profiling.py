@@ -0,0 +1,99 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : request_profiling.py
+# Program description   : This is the blueprint that profiles each request when the instrumentation
+#                         is turned on (Server-Timing headers, a log line per request and /metrics).
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from instrumentation import RequestProfile, current_profile, metrics
+from flask import Blueprint, Response, request, before_render_template, template_rendered
+import time
+
+
+request_profiling = Blueprint("request_profiling", __name__)  # Registered by app.py when turned on
+
+
+@request_profiling.record_once
+def connect_template_signals(state):
+    """
+        Times the rendering of the templates of the application the blueprint is registered on.
+    :param state:
+        type: BlueprintSetupState
+        required: true
+        description: The state of the blueprint registration
+    """
+    before_render_template.connect(start_template, state.app)
+    template_rendered.connect(finish_template, state.app)
+
+
+def start_template(sender, template, context, **extra):
+    """
+        Notes the time a template starts rendering (the before_render_template signal).
+    """
+    profile = current_profile.get()
+    if profile is not None:
+        profile.template_starts.append(time.perf_counter())
+
+
+def finish_template(sender, template, context, **extra):
+    """
+        Adds the time a template took to render (the template_rendered signal, which is sent when
+        a streamed template has been sent in full) to the request's "template" timing.
+    """
+    profile = current_profile.get()
+    if profile is not None and profile.template_starts:
+        profile.add_timing("template", time.perf_counter() - profile.template_starts.pop())
+
+
+@request_profiling.before_app_request
+def start_profile():
+    """
+        Starts the profile of a request. The profile is kept in a context variable, so the database
+        functions running on the async routes' database threads record into it too.
+    """
+    current_profile.set(RequestProfile())
+
+
+@request_profiling.after_app_request
+def finish_profile(response):
+    """
+        Adds the Server-Timing header to the response and writes the request's log line and
+        metrics when the response has been sent. A streamed page is rendered after the request
+        context has been torn down, so the profile is ended when the response is closed (after
+        the last row has been sent) rather than on teardown.
+    :param response:
+        type: Response
+        required: true
+        description: The response of the request
+    :return: The response
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return response
+    response.headers["Server-Timing"] = profile.get_server_timing()
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    method = request.method
+    path = request.path
+
+    def write_log_line():
+        current_profile.set(None)
+        seconds = time.perf_counter() - profile.started_at
+        metrics.observe_request(route, method, response.status_code, seconds, profile.get_database_seconds())
+        print(profile.get_log_line(route, method, path, response.status_code, seconds), flush=True)
+
+    response.call_on_close(write_log_line)
+    return response
+
+
+@request_profiling.route('/metrics')
+def render_metrics():
+    """
+        This end point exposes the request and database latency histograms of this application
+        process in the Prometheus text format.
+    :methods
+        GET:/metrics
+    :return: The metrics text
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
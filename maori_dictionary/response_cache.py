@@ -0,0 +1,347 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : response_cache.py
+# Program description   : This module caches the rendered pages served to anonymous users.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from async_data_access import run_in_thread
+from compression import negotiate_encoding
+from data_access import get_data_generations
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import g, has_request_context, request, session, make_response
+from functools import wraps
+import hashlib
+import inspect
+import os
+import threading
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("DICTIONARY_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHED_GENERATIONS = ("dictionary", "category")
+CACHED_HEADERS = ("Content-Encoding", "Vary")
+LAST_MODIFIED_RESOLUTION = timedelta(seconds=1)
+
+
+class ResponseCache:
+    """
+        A least recently used cache of rendered pages. The total size of the cached page bodies
+        is kept under max_bytes by discarding the least recently used pages first.
+    """
+
+    def __init__(self, max_bytes):
+        """
+            Creates an empty cache.
+        :param max_bytes:
+            type: int
+            required: true
+            description: The maximum total size of the cached page bodies in bytes
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+            Gets a cached page and marks it as the most recently used.
+        :param key:
+            type: tuple
+            required: true
+            description: The cache key
+        :return: The cached (body, mimetype, headers) tuple or None if the page is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype, headers=()):
+        """
+            Caches a page, discarding the least recently used pages if the cache is full.
+            Pages larger than the whole cache are not cached.
+        :param key:
+            type: tuple
+            required: true
+            description: The cache key
+        :param body:
+            type: bytes
+            required: true
+            description: The rendered page
+        :param mimetype:
+            type: string
+            required: true
+            description: The mimetype of the page
+        :param headers:
+            type: tuple of tuples
+            required: false
+            description: The (name, value) pairs of the headers that describe the body (e.g. its
+                         Content-Encoding)
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = (body, mimetype, headers)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
+                self.evictions += 1
+
+    def get_stats(self):
+        """
+            Gets the cache statistics.
+        :return: A dictionary of the hit, miss and eviction counts, the number of cached pages
+                 and their total size in bytes
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+
+
+def get_last_modified(generations):
+    """
+        Gets the time the cached data last changed from the changed_at times of the generations.
+        The times (and the Last-Modified header) only have whole seconds, so while the current
+        second is the second of the last change a further change could have the same time and
+        a client's If-Modified-Since would wrongly match it. No time is given then, so the page
+        is only revalidated by its ETag.
+    :param generations:
+        type: list of tuples
+        required: true
+        description: The (generation, changed_at) tuples of the cached data
+    :return: The latest change time as a UTC datetime or None if no change time is known or the
+             data changed in the current second
+    """
+    changed = [datetime.fromisoformat(changed_at).replace(tzinfo=timezone.utc)
+               for generation, changed_at in generations if changed_at is not None]
+    if len(changed) == 0:
+        return None
+    last_modified = max(changed).replace(microsecond=0)
+    if datetime.now(timezone.utc) - last_modified < LAST_MODIFIED_RESOLUTION:
+        return None
+    return last_modified
+
+
+def skip_response_cache():
+    """
+        Marks the page of the current request as one that must not be cached, e.g. because it
+        shows an original image while its resized copy is still being made. A page that is not
+        streamed is also sent without its validators.
+    """
+    if has_request_context():
+        g.skip_response_cache = True
+
+
+def get_cached_headers(response):
+    """
+        Gets the headers of a response that are cached with its body.
+    :param response:
+        type: Response
+        required: true
+        description: The response
+    :return: A tuple of the (name, value) pairs of the CACHED_HEADERS set on the response
+    """
+    return tuple((name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers)
+
+
+def cache_streamed_response(chunks, key, mimetype, headers, request_globals):
+    """
+        Passes the chunks of a streamed page through while keeping a copy, and caches the page
+        once the last chunk has been sent. A page that is not sent completely (e.g. the browser
+        disconnected or an error occurred while rendering), that grows larger than the whole
+        cache or that was marked by skip_response_cache while it was rendered is not cached.
+    :param chunks:
+        type: iterable of strings or bytes
+        required: true
+        description: The chunks of the page, which are closed when the page has been sent
+    :param key:
+        type: tuple
+        required: true
+        description: The cache key
+    :param mimetype:
+        type: string
+        required: true
+        description: The mimetype of the page
+    :param headers:
+        type: tuple of tuples
+        required: true
+        description: The (name, value) pairs of the headers cached with the page
+    :param request_globals:
+        type: flask.g
+        required: true
+        description: The request's g, which outlives the request context of the streamed page
+    """
+    body = []
+    size = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if body is not None:
+                size += len(chunk)
+                if size > response_cache.max_bytes:
+                    body = None
+                else:
+                    body.append(chunk)
+            yield chunk
+        if body is not None and not request_globals.get("skip_response_cache", False):
+            response_cache.put(key, b"".join(body), mimetype, headers)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def look_up_response():
+    """
+        Looks the current request up in the response cache. The cache key is the URL (with its
+        query string), the content encoding the client accepts and the dictionary and category
+        generations, so a page is rendered again as soon as any process changes the data it shows.
+    :calls (located in data_access.py module)
+        get_data_generations - Gets the generations of the cached data
+    :return: None when the request bypasses the cache, otherwise a tuple of the cache key, the ETag,
+             the Last-Modified time and the response: the cached page, a 304 Not Modified when the
+             client's copy is still current or None when the page has to be rendered
+    """
+    if request.method != "GET" or session.get('email') is not None:
+        return None
+    generations = get_data_generations()
+    if generations is None or any(name not in generations for name in CACHED_GENERATIONS):
+        return None
+    versions = tuple(generations[name] for name in CACHED_GENERATIONS)
+    key = (request.full_path, negotiate_encoding(request.accept_encodings),
+           tuple(generation for generation, changed_at in versions))
+    etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    last_modified = get_last_modified(versions)
+    entry = response_cache.get(key)
+    if entry is None:
+        if request.if_none_match.contains(etag):
+            return key, etag, last_modified, make_response("", 304)
+        return key, etag, last_modified, None
+    body, mimetype, headers = entry
+    response = make_response(body)
+    response.mimetype = mimetype
+    for name, value in headers:
+        response.headers[name] = value
+    return key, etag, last_modified, response
+
+
+def store_response(response, key):
+    """
+        Caches a rendered page. A streamed page is sent as it is rendered and copied into the
+        cache on its way out.
+    :param response:
+        type: Response
+        required: true
+        description: The rendered page
+    :param key:
+        type: tuple
+        required: true
+        description: The cache key from look_up_response
+    """
+    if response.is_streamed:
+        response.response = cache_streamed_response(response.response, key, response.mimetype,
+                                                    get_cached_headers(response), g._get_current_object())
+        response.implicit_sequence_conversion = False  # Keeps make_conditional from buffering it
+    elif not g.get("skip_response_cache", False):
+        response_cache.put(key, response.get_data(), response.mimetype, get_cached_headers(response))
+
+
+def make_cached_response(response, etag, last_modified):
+    """
+        Adds the validators to a response and answers a conditional request.
+    :param response:
+        type: Response
+        required: true
+        description: The cached or rendered page
+    :param etag:
+        type: string
+        required: true
+        description: The ETag from look_up_response
+    :param last_modified:
+        type: datetime
+        required: false
+        description: The Last-Modified time from look_up_response
+    :return: The response, or a 304 Not Modified when the request's If-None-Match or
+             If-Modified-Since header is still current
+    """
+    response.set_etag(etag)
+    if last_modified is not None:  # Setting None would send the current time
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
+
+
+def cache_anonymous_response(view):
+    """
+        A decorator for routes whose pages depend only on the URL and the database contents.
+        GET requests from anonymous users are served from the response cache (see
+        look_up_response).
+        The responses carry an ETag derived from the cache key and a Last-Modified time derived
+        from when the data last changed, and a request whose If-None-Match or If-Modified-Since
+        header is still current gets a 304 Not Modified without the page being rendered.
+        Logged-in users and POST requests always bypass the cache.
+        An async route (see asgi.py) gets an async wrapper that looks the page up on a
+        database thread.
+    :param view:
+        type: function
+        required: true
+        description: The route function to cache
+    :calls
+        look_up_response - Looks the request up in the cache
+        store_response - Caches a rendered page
+        make_cached_response - Adds the validators and answers conditional requests
+    :return: The wrapped route function
+    """
+    if inspect.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            cached = await run_in_thread(look_up_response)
+            if cached is None:
+                return await view(*args, **kwargs)
+            key, etag, last_modified, response = cached
+            if response is None:
+                response = make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                store_response(response, key)
+            if g.get("skip_response_cache", False):
+                return response
+            return make_cached_response(response, etag, last_modified)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cached = look_up_response()
+        if cached is None:
+            return view(*args, **kwargs)
+        key, etag, last_modified, response = cached
+        if response is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            store_response(response, key)
+        if g.get("skip_response_cache", False):
+            return response
+        return make_cached_response(response, etag, last_modified)
+    return wrapper
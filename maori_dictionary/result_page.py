@@ -0,0 +1,95 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : result_page.py
+# Program description   : This module provides a page of query results that the templates can
+#                         render while the rows are still being read from the database.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+class ResultPage:
+    """
+        One page of query results read with keyset pagination, i.e. up to page_size rows followed
+        by at most one extra row which only shows that there is a next page.
+        The rows may be a list or a generator reading them from a database cursor, so a streamed
+        template can render each row as it is read. The first row is read straight away so that
+        the page heading can be rendered and an empty result found before the page starts.
+        The cursor of the next page is only known once the rows have been iterated, so templates
+        use next_cursor after their loop over the rows.
+    """
+
+    def __init__(self, rows, page_size, make_cursor, transform=None):
+        """
+            Creates the page and reads its first row.
+        :param rows:
+            type: iterable of tuples
+            required: true
+            description: The rows of the page plus the optional extra row
+        :param page_size:
+            type: int
+            required: true
+            description: The number of rows in a page
+        :param make_cursor:
+            type: function
+            required: true
+            description: A function creating the cursor of the next page from the last row of this page
+        :param transform:
+            type: function
+            required: false
+            description: A function applied to each row before it is rendered (e.g. to add an image name)
+        """
+        self._rows = iter(rows)
+        self._page_size = page_size
+        self._make_cursor = make_cursor
+        self._transform = transform
+        self._first = next(self._rows, None)
+        self.first = self._apply(self._first)
+        self.next_cursor = None
+
+    def _apply(self, row):
+        """
+            Applies the transform to a row.
+        :param row:
+            type: tuple
+            required: true
+            description: A query result row
+        :return: The transformed row, or None for no row
+        """
+        if row is None or self._transform is None:
+            return row
+        return self._transform(row)
+
+    def __bool__(self):
+        """
+            A page is true when it has at least one row.
+        """
+        return self._first is not None
+
+    def __iter__(self):
+        """
+            Yields the (transformed) rows of the page. When the extra row is found the next page
+            cursor is set from the last row of the page and the remaining rows are not read.
+        """
+        if self._first is None:
+            return
+        yield self.first
+        last = self._first
+        count = 1
+        for row in self._rows:
+            if count == self._page_size:
+                self.next_cursor = self._make_cursor(last)
+                break
+            yield self._apply(row)
+            last = row
+            count += 1
+        self.close()
+
+    def close(self):
+        """
+            Stops reading the rows, which returns a streamed query's database connection to the pool.
+        """
+        close = getattr(self._rows, "close", None)
+        if close is not None:
+            close()
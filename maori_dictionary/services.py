@@ -7,23 +7,79 @@
 # Project               : 91902 (NCEA L3 Internal)
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 from data_access import *
-from flask import Flask, session
+from asset_manifest import AssetManifest
+from flask import Flask, session, g, render_template, stream_template
 from flask_bcrypt import Bcrypt
+from image_index import ImageIndex
+from image_variants import ImageVariants
+from instrumentation import timed
+from markupsafe import Markup, escape
+from password_hasher import PasswordHasher
+from rate_limiter import RateLimiter
+from response_cache import skip_response_cache
+from result_page import ResultPage
+import base64
+import binascii
+import csv
+import itertools
+import json
 import string
-import glob
 import os
 
 
 # ~~~~~~~~~~~~~~~~~
 # Declare constants
 # ~~~~~~~~~~~~~~~~~
-IMAGE_PATH = "static\\images\\"
+STATIC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+IMAGE_PATH = os.path.join(STATIC_PATH, "images")
+IMAGE_DERIVED_PATH = os.path.join(IMAGE_PATH, "derived")
+IMAGE_FORMAT = os.environ.get("DICTIONARY_IMAGE_FORMAT", "webp")
+IMAGE_THREADS = int(os.environ.get("DICTIONARY_IMAGE_THREADS", "1"))
 NO_IMAGE_FILENAME = "noimage.png"
+ASSET_URL_PREFIX = "/assets/"
+ASSET_MAX_AGE = int(os.environ.get("DICTIONARY_ASSET_MAX_AGE", str(365 * 24 * 60 * 60)))
+ASSET_RELOAD = os.environ.get("DICTIONARY_ASSET_RELOAD", "0") == "1"
+STREAM_RESPONSES = os.environ.get("DICTIONARY_STREAM_RESPONSES", "1") == "1"
+STREAM_CHUNK_SIZE = 16 * 1024
+BCRYPT_ROUNDS = int(os.environ.get("DICTIONARY_BCRYPT_ROUNDS", "12"))
+HASH_THREADS = int(os.environ.get("DICTIONARY_HASH_THREADS", "2"))
+HASH_QUEUE_SIZE = int(os.environ.get("DICTIONARY_HASH_QUEUE_SIZE", "16"))
+ATTEMPTS_PER_IP = int(os.environ.get("DICTIONARY_ATTEMPTS_PER_IP", "60"))
+ATTEMPTS_PER_EMAIL = int(os.environ.get("DICTIONARY_ATTEMPTS_PER_EMAIL", "5"))
+ATTEMPT_WINDOW_SECONDS = int(os.environ.get("DICTIONARY_ATTEMPT_WINDOW_SECONDS", "60"))
+MAX_BULK_WORDS = int(os.environ.get("DICTIONARY_MAX_BULK_WORDS", "1000"))
+BULK_COLUMNS = ("maori", "english", "description", "level")
+MAX_WORD_LENGTH = 30
+MAX_DESCRIPTION_LENGTH = 1000
+LEVELS = range(1, 11)
 
 
 app = Flask(__name__)  # Create application object
 bcrypt = Bcrypt(app)  # Builds the password security platform
 app.secret_key = "Duckyweu"  # The security key used
+image_index = ImageIndex(IMAGE_PATH)  # Index of the word images, built once on startup
+image_variants = ImageVariants(IMAGE_PATH, IMAGE_DERIVED_PATH, IMAGE_FORMAT, IMAGE_THREADS)  # Resized copies of the word images
+image_variants.warm(image_index.get_stamps())  # Made in the background, the original images are shown meanwhile
+asset_manifest = AssetManifest(STATIC_PATH, ASSET_RELOAD)  # Hashed URLs of the static files, built once on startup
+password_hasher = PasswordHasher(bcrypt.generate_password_hash, bcrypt.check_password_hash, BCRYPT_ROUNDS,
+                                 HASH_THREADS, HASH_QUEUE_SIZE)  # Hashes the passwords off the request threads
+ip_rate_limiter = RateLimiter(ATTEMPTS_PER_IP, ATTEMPT_WINDOW_SECONDS)  # Logins and sign ups per IP address
+email_rate_limiter = RateLimiter(ATTEMPTS_PER_EMAIL, ATTEMPT_WINDOW_SECONDS)  # Failed logins per email address
+
+
+def prepare_database():
+    """
+        This function prepares the database for use when the application starts by applying
+        any outstanding migration scripts and the connection profile (WAL journal etc.)
+    :calls (located in data_access.py module)
+        migrate_database - Applies the outstanding migration scripts
+        check_connection_profile - Applies and checks the connection profile
+    :return: A boolean indicating whether the database is ready
+    """
+    version = migrate_database()
+    if issubclass(type(version), Error):
+        return False
+    return not issubclass(type(check_connection_profile()), Error)
 
 
 def is_logged_in():
@@ -40,45 +96,93 @@ def is_logged_in():
         return True
 
 
+@timed("permission")
 def allow_edit():
     """
-        This function is used to obtain whether the user has rights to edit directory entries
-    :calls (located in data_access.py module)
-        get_allow_edit - Retrieve allow edit from database
+        This function is used to obtain whether the user has rights to edit directory entries.
+        The answer is resolved when the user logs in and kept in the session together with the
+        permissions generation at that time. It is only looked up in the database again when
+        the permissions generation has changed (a user's type or a type's rights were changed),
+        so a revoked right takes effect on the user's next request.
+    :calls
+        get_permissions_version - Gets the current permissions generation
+        get_allow_edit (in data_access.py module) - Retrieve allow edit from database
     :return: A boolean representing whether the user has rights to edit directory entries
         True: When the user has rights to edit directory entries
         False: When the user has NO rights to edit directory entries
     """
     if not is_logged_in():
         return False
-    email = session.get('email')
-    allow = get_allow_edit(email)
-    if allow is None:
-        return False
-    return allow
+    version = get_permissions_version()
+    if version is None or session.get('permissions_version') != version or 'allow_edit' not in session:
+        allow = get_allow_edit(session.get('email'))
+        session['allow_edit'] = bool(allow)
+        if version is not None:
+            session['permissions_version'] = version
+    return session['allow_edit']
 
 
-def do_search_by_form(search_form):
+def get_permissions_version():
+    """
+        This function gets the current permissions generation. It is read from the database
+        at most once per request.
+    :calls
+        get_generation (in data_access.py module) - Retrieve the permissions generation from database
+    :return: The permissions generation or None if it could not be read
+    """
+    if 'permissions_version' not in g:
+        generation = get_generation('permissions')
+        g.permissions_version = None if generation is None else generation[1]
+    return g.permissions_version
+
+
+def do_search_by_form(search_form, stream=False):
     """
         This function is used to search directory entries using the search criteria submitted
-        via the search form
+        via the search form. The form's "after" field holds the cursor of the page to show.
     :param search_form:
         type: request.form
         required: true
         description: The search from submitted with user search criteria
-    :calls (located in data_access.py module)
-        get_search_results - Retrieve search results from database
-    :return: A list of search results
-        When no search criteria entered straight away return empty list.
-        Otherwise, return search results from database
+    :param stream:
+        type: boolean
+        required: false
+        description: True to read the results from the database while the page is rendered
+    :calls
+        get_search_results (in data_access.py module) - Retrieve search results from database
+        decode_cursor - Gets the position of the page from the cursor
+        get_page - Creates the page of results
+        get_highlighted_snippet - Highlights the matched words of full text search results
+    :return: A page of search results (ResultPage) or None in case of an unexpected error.
+        When no search criteria entered straight away return an empty page.
+        Otherwise, return search results from database. Full text search results have the
+        highlighted snippet as an 8th value.
+    """
+    maori, english, level, most_recent, phrase = get_search_form_data(search_form)
+    if maori == "" and english == "" and level == "0" and most_recent == "0" and phrase == "":
+        return get_page([])
+    search_results = get_search_results(maori, english, level, most_recent, phrase,
+                                        decode_cursor(search_form.get("after")), stream=stream)
+    if search_results is None:
+        return None
+    return get_page(search_results,
+                    lambda word: word[:7] + (get_highlighted_snippet(word[7]),) if len(word) > 7 else word)
+
+
+def get_highlighted_snippet(snippet):
     """
-    maori, english, level, most_recent = get_search_form_data(search_form)
-    if maori == "" and english == "" and level == "0" and most_recent == "0":
-        return []
-    return get_search_results(maori, english, level, most_recent)
+        This function turns a full text search snippet into HTML with the matched words
+        highlighted. The snippet text is escaped first so that it is safe to display.
+    :param snippet:
+        type: string
+        required: true
+        description: The snippet with the matched words wrapped in chr(2) and chr(3)
+    :return: The snippet as HTML markup with the matched words wrapped in <mark> tags
+    """
+    return Markup(str(escape(snippet)).replace("\x02", "<mark>").replace("\x03", "</mark>"))
 
 
-def do_search_by_browse(letter):
+def do_search_by_browse(letter, cursor=None, stream=False):
     """
         This function is used to search directory entries using the browse character the user
         clicked in the search page header
@@ -86,15 +190,134 @@ def do_search_by_browse(letter):
         type: string
         required: true
         description: The character used to browse the dictionary
-    :calls (located in data_access.py module)
-        get_browse_results - Retrieve search results from database
-    :return: If letter is a valid for searching then return the search results from database
-             otherwise return empty list.
+    :param cursor:
+        type: string
+        required: false
+        description: The cursor of the page to show, None for the first page
+    :param stream:
+        type: boolean
+        required: false
+        description: True to read the results from the database while the page is rendered
+    :calls
+        get_browse_results (in data_access.py module) - Retrieve search results from database
+        decode_cursor - Gets the position of the page from the cursor
+        get_page - Creates the page of results
+    :return: A page of search results (ResultPage) or None in case of an unexpected error.
+             If letter is a valid for searching then the search results are from
+             the database otherwise the page is empty.
     """
-    search_results = []
     if letter.isalpha() and letter != "~" and len(letter) == 1:
-        search_results = get_browse_results(letter)
-    return search_results
+        search_results = get_browse_results(letter, decode_cursor(cursor), stream=stream)
+        if search_results is None:
+            return None
+        return get_page(search_results)
+    return get_page([])
+
+
+def encode_cursor(word):
+    """
+        This function creates the cursor of the page that starts after the supplied word.
+        The cursor is the maori and english words, JSON and then URL safe base64 encoded.
+    :param word:
+        type: tuple
+        required: true
+        description: The (maori, english) words of the last word of a page
+    :return: The cursor string
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(word)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+        This function gets the (maori, english) words from a cursor created by encode_cursor.
+    :param cursor:
+        type: string
+        required: false
+        description: The cursor of the page
+    :return: The (maori, english) tuple or None for a missing or invalid cursor (i.e. the first page)
+    """
+    if cursor is None or cursor == "":
+        return None
+    try:
+        word = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+    if not isinstance(word, list) or len(word) != 2 or not all(isinstance(value, str) for value in word):
+        return None
+    return tuple(word)
+
+
+def get_page(rows, transform=None):
+    """
+        This function creates the page of results from the rows read for it. The rows are read
+        with one extra row which is only there to show that a next page exists.
+    :param rows:
+        type: list or generator of tuples
+        required: true
+        description: Up to PAGE_SIZE + 1 rows with the maori and english words in the 2nd and
+                     3rd values
+    :param transform:
+        type: function
+        required: false
+        description: A function applied to each row before it is rendered
+    :calls
+        ResultPage (in result_page.py module) - The page of results
+        encode_cursor - Creates the cursor of the next page
+    :return: The page of results (ResultPage)
+    """
+    return ResultPage(rows, PAGE_SIZE, lambda row: encode_cursor((row[1], row[2])), transform)
+
+
+def render_page(template_name, **context):
+    """
+        This function renders a page, streaming it to the browser while it is rendered when
+        STREAM_RESPONSES is set. A streamed page starts reaching the browser before its results
+        have all been read from the database and is never held in memory as a whole.
+    :param template_name:
+        type: string
+        required: true
+        description: The name of the template
+    :param context:
+        type: keyword arguments
+        required: false
+        description: The variables passed to the template
+    :calls
+        join_chunks - Joins the small pieces of the streamed template into larger chunks
+    :return: The streamed response or the rendered page
+    """
+    if STREAM_RESPONSES:
+        return app.response_class(join_chunks(stream_template(template_name, **context), STREAM_CHUNK_SIZE))
+    return render_template(template_name, **context)
+
+
+def join_chunks(pieces, chunk_size):
+    """
+        This generator joins the pieces of a streamed template (every piece of text between the
+        template tags is a separate piece) into chunks of about chunk_size characters, so the
+        page is not written to the browser a few bytes at a time.
+    :param pieces:
+        type: generator of strings
+        required: true
+        description: The streamed template, which is closed when the page has been sent
+    :param chunk_size:
+        type: int
+        required: true
+        description: The number of characters collected before a chunk is sent
+    """
+    chunk = []
+    size = 0
+    try:
+        for piece in pieces:
+            chunk.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+                size = 0
+        if size > 0:
+            yield "".join(chunk)
+    finally:
+        pieces.close()
 
 
 def validate_add_word(word_form, category_id):
@@ -128,6 +351,153 @@ def validate_add_word(word_form, category_id):
     return is_valid, return_url
 
 
+def validate_bulk_add_words(bulk_form, bulk_file, category_id):
+    """
+        This function is used to validate a list of words pasted into (or uploaded with) the bulk
+        add form and add them to the specified category. The words are all validated first and
+        nothing is saved if any of them is invalid. The words already in the dictionary (or listed
+        twice) are reported and skipped, or updated when the form asks for the words already in
+        this category to be updated (only the ones with a new description or level are updated).
+        The other words are all inserted in one transaction.
+     :param bulk_form:
+        type: request.form
+        required: true
+        description: The bulk add form with the pasted words (one word a line: maori, english,
+                     description and level, separated by tabs or commas) and the update checkbox
+    :param bulk_file:
+        type: FileStorage
+        required: false
+        description: The uploaded CSV (or tab separated) file of words, used instead of the pasted
+                     words when a file was chosen
+    :param category_id:
+        type: int
+        required: true
+        description: The category id the user is attempting to add the words to
+    :calls
+        read_bulk_words - Reads the rows of words
+        get_bulk_words - Validates the rows
+        get_existing_words (in data_access.py module) - Finds the words already in the dictionary
+        add_words (in data_access.py module) - Adds and updates the words in the database
+    :return:
+        is_valid: A boolean indicating success.
+        report: A dictionary of the "added", "updated" and "duplicates" words (line number, maori
+                and english, and the reason for the duplicates), the invalid rows ("errors" of
+                line number and reason) and an "error" message for the whole list.
+    """
+    report = {"added": [], "updated": [], "duplicates": [], "errors": [], "error": None}
+    text = bulk_form.get("words", "")
+    if bulk_file is not None and bulk_file.filename:
+        try:
+            text = bulk_file.read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            report["error"] = "The file must be a UTF-8 CSV or text file"
+            return False, report
+    rows = read_bulk_words(text)
+    if len(rows) == 0:
+        report["error"] = "Please paste or upload the words to add"
+        return False, report
+    if len(rows) > MAX_BULK_WORDS:
+        report["error"] = f"Please add at most {MAX_BULK_WORDS} words at a time"
+        return False, report
+    words, report["errors"] = get_bulk_words(rows)
+    if len(report["errors"]) > 0:
+        report["error"] = "No words were added, please correct the rows below"
+        return False, report
+    first_lines = {}
+    unique_words = []
+    for line_number, maori, english, description, level in words:
+        if (maori, english) in first_lines:
+            report["duplicates"].append((line_number, maori, english,
+                                         f"Listed before on line {first_lines[(maori, english)]}"))
+        else:
+            first_lines[(maori, english)] = line_number
+            unique_words.append((line_number, maori, english, description, level))
+    existing = get_existing_words([(maori, english) for _, maori, english, _, _ in unique_words])
+    if existing is None:
+        report["error"] = "Unexpected error has occurred please try again later"
+        return False, report
+    update = bulk_form.get("update") == "1"
+    new_words = []
+    updates = []
+    for line_number, maori, english, description, level in unique_words:
+        if (maori, english) not in existing:
+            new_words.append((maori, english, description, level))
+            report["added"].append((line_number, maori, english))
+            continue
+        word_id, word_category_id, category_name, old_description, old_level = existing[(maori, english)]
+        if not update or str(word_category_id) != str(category_id):
+            report["duplicates"].append((line_number, maori, english, f"Already in the {category_name} category"))
+        elif description == old_description and str(level) == str(old_level):
+            report["duplicates"].append((line_number, maori, english, "Already in this category, unchanged"))
+        else:
+            updates.append((word_id, description, level))
+            report["updated"].append((line_number, maori, english))
+    if not add_words(new_words, category_id, session.get('email'), updates):
+        report["added"] = []
+        report["updated"] = []
+        report["error"] = "No words were added, a word was added by someone else meanwhile, please try again"
+        return False, report
+    return True, report
+
+
+def read_bulk_words(text):
+    """
+        Reads the rows of words pasted into or uploaded with the bulk add form. The values are
+        separated by tabs (pasted from a spreadsheet) or otherwise by commas (a CSV file) and may
+        be quoted. Blank lines and a heading row (starting with "maori") are skipped.
+    :param text:
+        type: string
+        required: true
+        description: The text of the words
+    :return: A list of (line number, list of values) tuples
+    """
+    lines = text.splitlines()
+    delimiter = "\t" if any("\t" in line for line in lines[:20]) else ","
+    reader = csv.reader(lines, delimiter=delimiter)
+    rows = []
+    for values in reader:
+        values = [value.strip() for value in values]
+        if all(value == "" for value in values):
+            continue
+        if len(rows) == 0 and values[0].lower() == BULK_COLUMNS[0]:
+            continue
+        rows.append((reader.line_num, values))
+    return rows
+
+
+def get_bulk_words(rows):
+    """
+        Validates the rows of words read from the bulk add form against the same rules as the add
+        word form.
+    :param rows:
+        type: list of tuples
+        required: true
+        description: The (line number, list of values) of each row
+    :return:
+        words - A list of (line number, maori, english, description, level) tuples of the valid rows
+        errors - A list of (line number, reason) tuples of the invalid rows
+    """
+    words = []
+    errors = []
+    for line_number, values in rows:
+        if len(values) != len(BULK_COLUMNS):
+            errors.append((line_number, f"Expected {len(BULK_COLUMNS)} values ({', '.join(BULK_COLUMNS)}) "
+                                        f"but found {len(values)}"))
+            continue
+        maori, english, description, level = values
+        if maori == "" or english == "" or description == "":
+            errors.append((line_number, "The maori, english and description are required"))
+        elif len(maori) > MAX_WORD_LENGTH or len(english) > MAX_WORD_LENGTH:
+            errors.append((line_number, f"The maori and english can be at most {MAX_WORD_LENGTH} characters"))
+        elif len(description) > MAX_DESCRIPTION_LENGTH:
+            errors.append((line_number, f"The description can be at most {MAX_DESCRIPTION_LENGTH} characters"))
+        elif not level.isdecimal() or int(level) not in LEVELS:
+            errors.append((line_number, f"The level must be a number from {LEVELS[0]} to {LEVELS[-1]}"))
+        else:
+            words.append((line_number, maori, english, description, int(level)))
+    return words, errors
+
+
 def validate_update_word(word_form, word_id, breadcrumb):
     """
         This function is used to validate and update the word identified by the word_id
@@ -189,13 +559,19 @@ def validate_add_category(category_form):
     return is_valid, return_url
 
 
-def validate_signup_user(signup_form):
+def validate_signup_user(signup_form, remote_address):
     """
-        This function is used to validate and sign up user
+        This function is used to validate and sign up user. The password is hashed by the
+        password hasher, and the sign ups from an IP address are rate limited together with its
+        logins as they cost the same hashing work.
      :param signup_form:
         type: request.form
         required: true
         description: The sign-up form submitted with sign up details
+    :param remote_address:
+        type: string
+        required: true
+        description: The IP address of the client
     :calls
         add_user (in data_access.py module) - Add user to the database
     :return:
@@ -222,8 +598,12 @@ def validate_signup_user(signup_form):
     if len(password) < 8:
         is_valid = False
         return_url = '/signup?error=Passwords+must+be+8+characters+or+more'
+    if is_valid and not ip_rate_limiter.allow(remote_address):
+        return False, '/signup?error=Too+many+attempts+please+try+again+later'
     if is_valid:
-        hashed_password = bcrypt.generate_password_hash(password)
+        hashed_password = password_hasher.hash_password(password)
+        if hashed_password is None:
+            return False, '/signup?error=The+site+is+busy+please+try+again'
         success = add_user(first_name, last_name, email, hashed_password, user_type)
         if not success:
             is_valid = False
@@ -231,30 +611,70 @@ def validate_signup_user(signup_form):
     return is_valid, return_url
 
 
-def validate_and_login_user(login_form):
+def validate_and_login_user(login_form, remote_address):
     """
-        This function is used to validate and login user. The user email, names and type details
-        are stored in the session if successful login
+        This function is used to validate and login user. The user email, names, type details and
+        whether the user is allowed to edit dictionary entries are stored in the session if
+        successful login
+        The attempts are rate limited by IP address, and the failed attempts by email address (a
+        successful login clears them), and the password is checked by the password hasher. A password hashed with a different cost than
+        BCRYPT_ROUNDS is hashed again in the background once it has been checked.
      :param login_form:
         type: request.form
         required: true
         description: The login form submitted with login details
+    :param remote_address:
+        type: string
+        required: true
+        description: The IP address of the client
     :calls
         get_user_details (in data_access.py module) - Gets the user details from database for validation
-    :return: A boolean indicating success of login.
-        True: Login success.
-        False: Login failure.
+        update_password (in data_access.py module) - Saves the password hashed again
+        get_permissions_version - Gets the permissions generation to store in the session
+    :return:
+        is_valid: A boolean indicating success of login.
+        return_url: Return URL with error message in case of a login failure.
     """
     email = login_form["email"].strip().lower()
     password = login_form["password"].strip()
+    if not ip_rate_limiter.allow(remote_address) or not email_rate_limiter.check(email):
+        return False, '/login?error=Too+many+login+attempts+please+try+again+later'
     user_details = get_user_details(email)
-    if user_details is None or not bcrypt.check_password_hash(user_details[0][2], password):
-        return False
+    if user_details is None:
+        email_rate_limiter.record(email)
+        return False, '/login?error=Email+invalid+or+password+incorrect'
+    hashed_password = user_details[0][2]
+    is_valid = password_hasher.check_password(hashed_password, password)
+    if is_valid is None:
+        return False, '/login?error=The+site+is+busy+please+try+again'
+    if not is_valid:
+        email_rate_limiter.record(email)
+        return False, '/login?error=Email+invalid+or+password+incorrect'
+    email_rate_limiter.reset(email)
+    if password_hasher.needs_rehash(hashed_password):
+        password_hasher.rehash_later(password, lambda new_hash: update_password(email, new_hash))
     session['email'] = email
     session['first_name'] = user_details[0][0]
     session['last_name'] = user_details[0][1]
     session['user_type'] = user_details[0][3]
-    return True
+    session['allow_edit'] = bool(user_details[0][4])
+    version = get_permissions_version()
+    if version is not None:
+        session['permissions_version'] = version
+    return True, ""
+
+
+def get_password_hasher_stats():
+    """
+        This function returns the password hasher statistics together with the number of attempts
+        turned away by the rate limits
+    :return: A dictionary of the hasher statistics (see PasswordHasher.get_stats) and the
+             rate_limited_ip and rate_limited_email counts
+    """
+    stats = password_hasher.get_stats()
+    stats["rate_limited_ip"] = ip_rate_limiter.rejected
+    stats["rate_limited_email"] = email_rate_limiter.rejected
+    return stats
 
 
 def remove_category(category_id):
@@ -328,6 +748,7 @@ def get_selected(alphabetic_letter):
     return selected
 
 
+@timed("categories")
 def get_categories():
     """
         This function returns all the categories in the database
@@ -338,20 +759,63 @@ def get_categories():
     return get_category_list()
 
 
-def get_category_words(category_id):
+def get_category_name(category_id):
+    """
+        This function returns the name of a category
+    :param category_id:
+        type: int
+        required: true
+        description: The category id of the category
+    :calls
+        get_categories - Gets all the categories
+    :return: The category name or None if there is no such category
+    """
+    categories = get_categories()
+    if categories is None or issubclass(type(categories), Error):
+        return None
+    for category in categories:
+        if str(category[0]) == str(category_id):
+            return category[1]
+    return None
+
+
+def get_category_words(category_id, cursor=None, stream=False, image_variant=None):
     """
-        This function returns all the words for the category specified from the database
+        This function returns a page of the words for the category specified from the database.
+        The image file name of each word is added as a 6th value.
     :param category_id:
         type: int
         required: true
         description: The category id of the category to retrieve the words
+    :param cursor:
+        type: string
+        required: false
+        description: The cursor of the page to show, None for the first page
+    :param stream:
+        type: boolean
+        required: false
+        description: True to read the words from the database while the page is rendered
+    :param image_variant:
+        type: string
+        required: false
+        description: The resized variant of the images (see add_image_filenames), None for the
+                     original images
     :calls
-        get_words (in data_access.py module) - Retrieve all the words for the given category id
+        get_words (in data_access.py module) - Retrieve a page of the words for the given category id
         from the database
-    :return: A list of all the words in the database for the given category or Error if any
-             database level issue occurs.
+        decode_cursor - Gets the position of the page from the cursor
+        get_page - Creates the page of words
+        add_image_filenames - Adds the image file name of each word
+    :return: A page of the words in the database for the given category (ResultPage) or None if
+             the category is not found or any database level issue occurs.
     """
-    return get_words(category_id)
+    words = get_words(category_id, decode_cursor(cursor), stream=stream)
+    if words is None:
+        return None
+    category_words = get_page(add_image_filenames(words, image_variant))
+    if not category_words:
+        return None
+    return category_words
 
 
 def get_dictionary_word(word_id):
@@ -370,6 +834,51 @@ def get_dictionary_word(word_id):
     return get_word(word_id)
 
 
+def get_dictionary_words(word_ids):
+    """
+        This function returns the words for the word ids specified from the database in one query
+    :param word_ids:
+        type: list of ints
+        required: true
+        description: The word ids of the words to retrieve from the database
+    :calls
+        get_words_by_ids (in data_access.py module) - Retrieve the words for the given word ids
+        from the database
+    :return: A list of the words found (in id order) or None if any database level issue occurs.
+    """
+    return get_words_by_ids(word_ids)
+
+
+def get_changes_since(since):
+    """
+        This function returns the changes recorded after the sequence number specified together
+        with the current details of the changed words and categories.
+    :param since:
+        type: int
+        required: true
+        description: The sequence number of the last change the client has already seen
+    :calls
+        get_changes (in data_access.py module) - Retrieve the changes from the database
+        get_words_by_ids (in data_access.py module) - Retrieve the changed words in one query
+        get_categories - Retrieve the categories
+    :return: A tuple of the list of changes, the list of changed words, the list of categories
+             and whether there are more changes, or a tuple of Nones if any database level issue
+             occurs.
+    """
+    change_list = get_changes(since, CHANGE_PAGE_SIZE + 1)
+    if change_list is None:
+        return None, None, None, None
+    more = len(change_list) > CHANGE_PAGE_SIZE
+    change_list = change_list[:CHANGE_PAGE_SIZE]
+    word_ids = [entity_id for seq, entity, entity_id, operation, changed_at in change_list
+                if entity == "word" and operation == "upsert"]
+    word_list = get_words_by_ids(word_ids) if len(word_ids) > 0 else []
+    category_list = get_categories()
+    if word_list is None or category_list is None:
+        return None, None, None, None
+    return change_list, word_list, category_list, more
+
+
 def get_user():
     """
         This function constructs and returns user details and type in a string
@@ -385,43 +894,122 @@ def get_user():
     return user_details
 
 
-def get_image_filename(english_word):
+@timed("image")
+def get_image_filename(english_word, variant=None):
     """
-        Searches the images' directory for an image file with English word (regardless of extension)
-        passed in, if a file is found return the filename with the extension immediately. If multiples
-        were found will return the first one found.
+        Looks up the image file for the English word passed in (regardless of extension, case
+        or macrons) in the image index, which is kept up to date with the images' directory.
+        If multiples were found will return the first one in alphabetical order.
         If no image file with the specified english word then return the default image file name
     :param english_word:
         type: string
         required: true
         description: The English word to search the image file for.
-    :return: The corresponding image file or default image file if not found.
+    :param variant:
+        type: string
+        required: false
+        description: The resized variant of the image shown by the page, "thumb" (the category
+                     pages) or "medium" (the word pages), None for the original image
+    :calls
+        image_index.get (in image_index.py module) - Looks up the image file name
+        get_image_variant - Gets the resized variant of the image
+    :return: The corresponding image file (relative to static/images) or default image file if
+             not found.
     """
-    path_file = f"{IMAGE_PATH}{english_word}.*"
-    listing = glob.glob(path_file)
-    for filename in listing:
-        return os.path.basename(filename)
-    return NO_IMAGE_FILENAME
+    filename = image_index.get(english_word, NO_IMAGE_FILENAME)
+    if variant is None:
+        return filename
+    return get_image_variant(filename, variant)
 
 
-def get_image_filenames(words):
+def add_image_filenames(words, variant=None):
     """
-        Constructs and returns a list of image file names corresponding to the list
-        of words passed in to the function
+        This generator adds the image file name of each word of a page as an extra value. The
+        images of the whole page are looked up together, with one check of the images directory
+        for changes. The words may be a generator streaming them from the database, in which case
+        each word is passed on as it is read and the generator is closed when this one is.
     :param words:
-        type: list of tuples
+        type: list or generator of tuples
         required: true
         description: The English word should be in the 3 location in each tuple
+    :param variant:
+        type: string
+        required: false
+        description: The resized variant of the images, None for the original images
     :calls
-       get_image_filename - To retrieve the image filename for each english word
-                            from the database
-    :return: A list of image file names corresponding to the words list
-        passed into the function.
+       image_index.get_many (in image_index.py module) - To look up the image filenames for all
+                                                         the english words of the page at once
+       get_image_variant - Gets the resized variant of each image
     """
-    image_names = []
-    for word in words:
-        image_names.append(get_image_filename(word[2]))
-    return image_names
+    rows, english_words = itertools.tee(words)
+    try:
+        filenames = image_index.get_many((word[2] for word in english_words), NO_IMAGE_FILENAME)
+        for word, filename in zip(rows, filenames):
+            yield word + (filename if variant is None else get_image_variant(filename, variant),)
+    finally:
+        close = getattr(words, "close", None)
+        if close is not None:
+            close()
+
+
+def get_image_variant(filename, variant):
+    """
+        Gets the resized variant of an image. While the variant is still being made the original
+        image is used and the page is kept out of the response cache, so it is not served with
+        the original image once the variant is ready.
+    :param filename:
+        type: string
+        required: true
+        description: The image file name from the image index
+    :param variant:
+        type: string
+        required: true
+        description: The resized variant of the image
+    :calls
+        image_index.get_stamp (in image_index.py module) - Gets the modification time and size of the image
+        image_variants.get (in image_variants.py module) - Gets the resized variant of the image
+        skip_response_cache (in response_cache.py module) - Keeps the page out of the response cache
+    :return: The image file name of the variant or of the original image
+    """
+    variant_filename = image_variants.get(filename, variant, image_index.get_stamp(filename))
+    if variant_filename is None:
+        skip_response_cache()
+        return filename
+    return variant_filename
+
+
+def get_asset_url(path):
+    """
+        Gets the URL of a static file with a hash of its content in the file name, e.g.
+        /assets/css/style.1a2b3c4d5e6f.css, which the browsers may cache for good because a changed
+        file gets a new URL. Used by the templates as asset_url.
+    :param path:
+        type: string
+        required: true
+        description: The path of the file in the static directory, e.g. css/style.css
+    :calls
+        asset_manifest.get (in asset_manifest.py module) - Looks up the hashed path of the file
+    :return: The hashed URL or the plain /static URL if the file is not in the static directory
+    """
+    hashed_path = asset_manifest.get(path)
+    if hashed_path is None:
+        return f"/static/{path}"
+    return ASSET_URL_PREFIX + hashed_path
+
+
+def get_asset(hashed_path):
+    """
+        Finds the static file of a hashed URL.
+    :param hashed_path:
+        type: string
+        required: true
+        description: The hashed path from the URL, e.g. css/style.1a2b3c4d5e6f.css
+    :calls
+        asset_manifest.resolve (in asset_manifest.py module) - Looks up the file
+    :return: A (path, content, is_current) tuple (see AssetManifest.resolve) or None if there is
+             no such file
+    """
+    return asset_manifest.resolve(hashed_path)
 
 
 def get_form_data(form):
@@ -465,20 +1053,22 @@ def get_word_form_data(word_form):
 
 def get_search_form_data(search_form):
     """
-    Retrieve and return the basic word details and most_recent indicator from the passed in
-    search form
+    Retrieve and return the basic word details, most_recent indicator and full text search phrase
+    from the passed in search form
      :param search_form:
         type: request.form
         required: true
-        description: A search form to retrieve and return word details and most_recent indicator
+        description: A search form to retrieve and return word details, most_recent indicator and phrase
     :calls
         get_form_data - Retrieve basic word details from the passed in request form
     :return:
         maori - The maori word
         english - The english word
-        description - The description of the word
+        level - The year level
         most_recent - The most_recent indicator
+        phrase - The full text search phrase
     """
     maori, english, level = get_form_data(search_form)
     most_recent = search_form.get("Date-Added").strip()
-    return maori, english, level, most_recent
+    phrase = search_form.get("phrase", "").strip()
+    return maori, english, level, most_recent, phrase
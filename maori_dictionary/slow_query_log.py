@@ -0,0 +1,221 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : slow_query_log.py
+# Program description   : This module writes the database statements that take longer than a
+#                         threshold, with their query plan and call site, to a rotating log file.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from instrumentation import count_rows
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import types
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+CALL_SITE_DEPTH = 4
+REDACTED = "<redacted>"
+REDACTED_TABLES = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+user_details\b", re.IGNORECASE)  # Emails and passwords
+WRAPPER_FILES = (os.path.abspath(__file__), os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                                       "instrumentation.py")))
+STATEMENT_FUNCTIONS = ("execute_query", "stream_query", "iterate_query", "execute_command")
+WHITESPACE = re.compile(r"\s+")
+
+
+class SlowQueryLog:
+    """
+        Writes a JSON line for each database statement that takes at least "threshold_ms"
+        milliseconds to a log file, which is rotated when it reaches "max_bytes" (keeping
+        "backup_count" old files). The line has the statement, its bound arguments (redacted for
+        the statements reading or changing user_details), the number of rows, the EXPLAIN QUERY
+        PLAN output and the call site (the functions that ran the statement).
+        The file is only opened when the first slow statement is logged.
+    """
+
+    def __init__(self, path, threshold_ms, max_bytes, backup_count, explain):
+        """
+            Creates the slow query log.
+        :param path:
+            type: string
+            required: true
+            description: The path of the log file
+        :param threshold_ms:
+            type: int
+            required: true
+            description: The duration from which a statement is logged, 0 to log nothing
+        :param max_bytes:
+            type: int
+            required: true
+            description: The size at which the log file is rotated
+        :param backup_count:
+            type: int
+            required: true
+            description: The number of rotated log files kept
+        :param explain:
+            type: function
+            required: true
+            description: A function taking the statement and its arguments and returning the
+                         lines of its query plan or an Error
+        """
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logged = 0
+        self._explain = explain
+        self._handler = None
+        self._lock = threading.Lock()
+
+    def watch(self, kind):
+        """
+            A decorator for the functions running a SQL statement (execute_query, stream_query and
+            execute_command) that logs the statements taking longer than the threshold. A streamed
+            query is checked when its rows have all been read. When the log is turned off the
+            function is returned as it is.
+        :param kind:
+            type: string
+            required: true
+            description: "query" or "command"
+        :return: The decorator
+        """
+        def decorator(function):
+            if self.threshold_ms <= 0:
+                return function
+
+            @functools.wraps(function)
+            def wrapper(sql, args=None):
+                started_at = time.perf_counter()
+                result = function(sql, args)
+                seconds = time.perf_counter() - started_at
+                if isinstance(result, types.GeneratorType):
+                    call_site = get_call_site()  # The rows are read later, from the page being rendered
+                    return count_rows(result, seconds, lambda rows, total_seconds: self.check(
+                        kind, sql, args, rows, total_seconds, False, call_site))
+                self.check(kind, sql, args, len(result) if isinstance(result, list) else None, seconds,
+                           isinstance(result, Exception))
+                return result
+            return wrapper
+        return decorator
+
+    def check(self, kind, sql, args, rows, seconds, failed, call_site=None):
+        """
+            Logs a statement if it took at least the threshold.
+        :param kind:
+            type: string
+            required: true
+            description: "query" or "command"
+        :param sql:
+            type: string
+            required: true
+            description: The SQL text
+        :param args:
+            type: list
+            required: true
+            description: The bound arguments or None
+        :param rows:
+            type: int
+            required: true
+            description: The number of rows returned, None for a command
+        :param seconds:
+            type: float
+            required: true
+            description: The time the statement took
+        :param failed:
+            type: boolean
+            required: true
+            description: True if the statement returned an error
+        :param call_site:
+            type: list
+            required: false
+            description: The call site, found from the current stack if not passed in
+        :return: True if the statement was logged otherwise False
+        """
+        if seconds * 1000 < self.threshold_ms:
+            return False
+        plan = self._explain(sql, args)
+        entry = {"time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                 "kind": kind,
+                 "ms": round(seconds * 1000, 3),
+                 "sql": WHITESPACE.sub(" ", sql).strip(),
+                 "args": redact_args(sql, args),
+                 "rows": rows,
+                 "error": failed,
+                 "plan": plan if isinstance(plan, list) else [f"EXPLAIN failed: {plan}"],
+                 "call_site": call_site if call_site is not None else get_call_site()}
+        self.write(json.dumps(entry, default=str, separators=(",", ":")))
+        return True
+
+    def write(self, line):
+        """
+            Writes a line to the log file, opening it the first time.
+        :param line:
+            type: string
+            required: true
+            description: The line
+        """
+        with self._lock:
+            if self._handler is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                                    backupCount=self.backup_count, encoding="utf-8")
+            self._handler.emit(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+            self.logged += 1
+
+    def close(self):
+        """
+            Closes the log file.
+        """
+        with self._lock:
+            if self._handler is not None:
+                self._handler.close()
+                self._handler = None
+
+
+def redact_args(sql, args):
+    """
+        Gets the arguments of a statement to log. The arguments of the statements reading or
+        changing the user_details table (emails, names and password hashes) are redacted.
+    :param sql:
+        type: string
+        required: true
+        description: The SQL text
+    :param args:
+        type: list, tuple or dict
+        required: true
+        description: The bound arguments or None
+    :return: The arguments or the redacted arguments
+    """
+    if args is None or not REDACTED_TABLES.search(sql):
+        return args
+    if isinstance(args, dict):
+        return {name: REDACTED for name in args}
+    return [REDACTED] * len(args)
+
+
+def get_call_site():
+    """
+        Finds the functions that ran a statement, skipping the statement functions of
+        data_access.py and their wrappers.
+    :return: A list of up to CALL_SITE_DEPTH "file:line function" strings, innermost first
+    """
+    call_site = []
+    frame = sys._getframe(1)
+    while frame is not None and len(call_site) < CALL_SITE_DEPTH:
+        code = frame.f_code
+        if os.path.abspath(code.co_filename) not in WRAPPER_FILES and code.co_name not in STATEMENT_FUNCTIONS:
+            call_site.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+        frame = frame.f_back
+    return call_site
@@ -0,0 +1,210 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : test_query_plans.py
+#                         NOTE: This is a query plan regression test and not a part of the application.
+#                               Run it from any directory:
+#                                   python -m pytest maori_dictionary/tests
+#                                   python -m unittest discover -s maori_dictionary/tests
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import csv
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("DICTIONARY_SLOW_QUERY_MS", "0")
+sys.path.insert(0, APP_DIR)
+import data_access
+
+
+# ~~~~~~~~~~~~~~~~~
+# Declare constants
+# ~~~~~~~~~~~~~~~~~
+SOURCE_DATABASE = os.path.join(APP_DIR, "database", "dictionary.db")
+MIGRATION_SCRIPT_DIR = os.path.join(APP_DIR, "migrations", "scripts")
+VOCAB_FILE = os.path.join(APP_DIR, "migrations", "data", "Vocab_List.csv")
+FULL_TEXT_SCAN = "SCAN dictionary_fts VIRTUAL TABLE INDEX 0:M3"  # A MATCH on the full text index
+DATE_ADDED_SCAN = "SCAN d USING COVERING INDEX dictionary_date_added_index"  # Read newest first up to the LIMIT
+CATEGORY_SCAN = "SCAN category USING COVERING INDEX category_category_name_uindex"  # The whole sidebar
+WORD_IDS_SCAN = "SCAN json_each VIRTUAL TABLE INDEX 1:"  # The list of ids passed in
+LISTED_WORDS_SCANS = ("SCAN 2 CONSTANT ROWS", "SCAN listed_words")  # The list of words passed in
+
+
+def get_cases():
+    """
+        This function lists every data_access query function call checked by the test, with
+        each of the get_search_results scenarios, the scans allowed in its query plans and
+        whether it reads a keyset page in the order of an index. Any other SCAN step fails the
+        test, as does sorting a page that should be read in index order (i.e. reading and
+        sorting every row in the range to return one page). A page searched by english only is
+        sorted, as the english range can not be read in maori order.
+    :return: A list of (name, function, allowed scans, ordered) tuples
+    """
+    cases = []
+    for maori in ["", "h"]:
+        for english in ["", "t"]:
+            for level in ["0", "3"]:
+                for most_recent in ["0", "1"]:
+                    if maori == "" and english == "" and level == "0" and most_recent == "0":
+                        continue  # Only the phrase search runs a query without the other criteria
+                    for phrase in ["", "haere mai"]:
+                        allowed = (FULL_TEXT_SCAN,) if phrase != "" else ()
+                        if most_recent == "1" and maori == "" and english == "" and phrase == "":
+                            allowed = (DATE_ADDED_SCAN,)
+                        cases.append((f"get_search_results({maori!r}, {english!r}, {level!r}, {most_recent!r}, "
+                                      f"{phrase!r})",
+                                      lambda m=maori, e=english, l=level, r=most_recent, p=phrase:
+                                      data_access.get_search_results(m, e, l, r, p),
+                                      allowed, False))
+                    cases.append((f"get_search_results({maori!r}, {english!r}, {level!r}, {most_recent!r}, "
+                                  f"after=('k', 'm'))",
+                                  lambda m=maori, e=english, l=level, r=most_recent:
+                                  data_access.get_search_results(m, e, l, r, after=("k", "m")),
+                                  (DATE_ADDED_SCAN,) if most_recent == "1" and maori == "" and english == ""
+                                  else (),
+                                  most_recent == "0" and (maori != "" or english == "")))
+    cases += [
+        ("get_browse_results('k')", lambda: data_access.get_browse_results("k"), (), True),
+        ("get_browse_results('k', after)", lambda: data_access.get_browse_results("k", after=("ka", "to")), (),
+         True),
+        ("get_category_list()", lambda: data_access.get_category_list(), (CATEGORY_SCAN,), False),
+        ("get_words(2)", lambda: data_access.get_words(2), (), True),
+        ("get_words(2, after)", lambda: data_access.get_words(2, after=("ka", "to")), (), True),
+        ("get_word(5)", lambda: data_access.get_word(5), (), False),
+        ("get_words_by_ids()", lambda: data_access.get_words_by_ids([3, 5, 99999]), (WORD_IDS_SCAN,), False),
+        ("get_changes(100)", lambda: data_access.get_changes(100), (), True),
+        ("get_user_details()", lambda: data_access.get_user_details("teacher@example.com"), (), False),
+        ("get_allow_edit()", lambda: data_access.get_allow_edit("teacher@example.com"), (), False),
+        ("get_existing_words()", lambda: data_access.get_existing_words([("ahi", "fire"), ("kai", "food")]),
+         LISTED_WORDS_SCANS, False),
+    ]
+    return cases
+
+
+def add_words(path, word_count):
+    """
+        This function fills a test database with words shaped like the vocab list (the same
+        levels and categories, with a made up suffix after the first pass) spread over two years,
+        and refreshes the statistics the query planner uses.
+    :param path:
+        type: string
+        required: true
+        description: The path of the database
+    :param word_count:
+        type: int
+        required: true
+        description: The number of words to add
+    """
+    with open(VOCAB_FILE, encoding="utf-8") as csv_file:
+        vocab = list(csv.reader(csv_file))[1:]
+    connection = data_access.get_connection(path)
+    with connection:
+        categories = {name: category_id
+                      for category_id, name in connection.execute("SELECT id, category_name FROM category")}
+        connection.executemany("""INSERT OR IGNORE INTO dictionary
+                                  (maori, english, description, level, category_id, date_added,
+                                   maori_key, english_key)
+                                  VALUES (?, ?, ?, ?, ?, ?, normalize_key(?1), normalize_key(?2))""",
+                               ((f"{maori} {number // len(vocab)}", f"{english} {number // len(vocab)}",
+                                 definition, int(level), categories[category.title()],
+                                 (date(2022, 5, 30) - timedelta(days=number % 730)).isoformat())
+                                for number, (maori, english, category, definition, level)
+                                in ((number, vocab[number % len(vocab)]) for number in range(word_count))))
+        connection.execute("ANALYZE")
+    connection.close()
+
+
+class QueryPlanTest(unittest.TestCase):
+    """
+        Checks that every data_access query reads its rows through an index: each step of its
+        EXPLAIN QUERY PLAN is a SEARCH, a step that reads no table (e.g. a temporary B-tree for an
+        ORDER BY, except on a page read in index order) or one of the scans allowed for that query. The queries run against a copy of
+        the application database migrated to the current schema in a temporary directory.
+    """
+    word_count = 0  # The seed words only
+
+    @classmethod
+    def setUpClass(cls):
+        """
+            Creates and migrates the test database.
+        """
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.patches = [mock.patch.object(data_access, "DATABASE", os.path.join(cls.temp_dir, "dictionary.db")),
+                       mock.patch.object(data_access, "MIGRATION_SCRIPT_DIR", MIGRATION_SCRIPT_DIR)]
+        for patch in cls.patches:
+            patch.start()
+        shutil.copy(SOURCE_DATABASE, data_access.DATABASE)
+        cls.version = data_access.migrate_database()
+        if cls.word_count > 0 and not issubclass(type(cls.version), sqlite3.Error):
+            add_words(data_access.DATABASE, cls.word_count)
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+            Closes the connections and removes the test database.
+        """
+        data_access.close_pool()
+        for patch in reversed(cls.patches):
+            patch.stop()
+        shutil.rmtree(cls.temp_dir)
+
+    def get_plans(self, function):
+        """
+            Calls a query function and records the query plan of every query it runs.
+        :param function:
+            type: function
+            required: true
+            description: The function calling data_access
+        :return: A list of (query, plan steps) tuples
+        """
+        plans = []
+        execute_query = data_access.execute_query
+
+        def explain_and_execute_query(query, args=None):
+            connection = sqlite3.connect(data_access.DATABASE)
+            try:
+                plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", args or [])]
+            finally:
+                connection.close()
+            plans.append((" ".join(query.split()), plan))
+            return execute_query(query, args)
+
+        with mock.patch.object(data_access, "execute_query", explain_and_execute_query):
+            function()
+        return plans
+
+    def test_migrated(self):
+        self.assertEqual(self.version, max(version for version, path in data_access.get_migration_scripts()))
+
+    def test_query_plans(self):
+        for name, function, allowed, ordered in get_cases():
+            with self.subTest(name):
+                plans = self.get_plans(function)
+                self.assertTrue(plans, "no query was run")
+                for query, plan in plans:
+                    for step in plan:
+                        self.assertFalse(step.startswith("SCAN ") and step not in allowed,
+                                         f"full scan {step!r}\n    query: {query}\n    plan: {plan}")
+                        self.assertNotIn("AUTOMATIC", step, f"temporary index\n    query: {query}\n    plan: {plan}")
+                        self.assertFalse(ordered and "TEMP B-TREE" in step,
+                                         f"sorted page {step!r}\n    query: {query}\n    plan: {plan}")
+
+
+class LargeDictionaryQueryPlanTest(QueryPlanTest):
+    """
+        The query plan checks against a dictionary of 20,000 words, analyzed so that the planner
+        chooses its plans from the statistics of a well used dictionary rather than the seed words.
+    """
+    word_count = 20000
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Application name      : Maori Dictionary
+# Program name          : versioned_cache.py
+# Program description   : This module provides an in memory cache of a value that is reloaded
+#                         whenever the version of the underlying data changes.
+# Author                : Inesh Bhanuka
+# Date                  : 2022-05-30
+# Project               : 91902 (NCEA L3 Internal)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import threading
+
+
+class VersionedCache:
+    """
+        Caches the value returned by a loader function together with the version of the data it
+        was loaded from. The cached value is used for as long as the current version matches, so
+        a change made by any process (which changes the version) is seen straight away rather
+        than after a time to live. A process that makes a change itself also calls invalidate().
+    """
+
+    def __init__(self, loader, version_reader):
+        """
+            Creates an empty cache.
+        :param loader:
+            type: function
+            required: true
+            description: A function with no arguments that loads the value, returning None on failure
+        :param version_reader:
+            type: function
+            required: true
+            description: A function with no arguments returning the current version of the data,
+                         or None if it could not be read
+        """
+        self._loader = loader
+        self._version_reader = version_reader
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        """
+            Gets the value, loading it again first if the version has changed since it was cached.
+            Values are not cached when the version could not be read or the loader failed.
+        :return: The value returned by the loader
+        """
+        version = self._version_reader()
+        with self._lock:
+            if version is not None and version == self._version:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+        value = self._loader()
+        if version is not None and value is not None:
+            with self._lock:
+                self._version = version
+                self._value = value
+        return value
+
+    def invalidate(self):
+        """
+            Discards the cached value so that the next get() loads it again.
+        """
+        with self._lock:
+            self._version = None
+            self._value = None